@@ -1,14 +1,24 @@
 
 import os
-from convlab.nlu import NLU
-from convlab.dst import DST
-from convlab.policy import Policy
-from convlab.nlg import NLG
-from convlab.dialog_agent import Agent, PipelineAgent
-from convlab.dialog_agent import Session, BiSession, DealornotSession
 
 from os.path import abspath, dirname
 
+from convlab.lazy_import import lazy_module
+
+__all__ = ['get_root_path', 'DATA_ROOT']
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'NLU': 'convlab.nlu',
+    'DST': 'convlab.dst',
+    'Policy': 'convlab.policy',
+    'NLG': 'convlab.nlg',
+    'Agent': 'convlab.dialog_agent',
+    'PipelineAgent': 'convlab.dialog_agent',
+    'Session': 'convlab.dialog_agent',
+    'BiSession': 'convlab.dialog_agent',
+    'DealornotSession': 'convlab.dialog_agent',
+})
+
 
 def get_root_path():
     return dirname(dirname(abspath(__file__)))
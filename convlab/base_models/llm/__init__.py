@@ -1,5 +1,10 @@
-from convlab.base_models.llm.base import LLM
-from convlab.base_models.llm.user_simulator import LLM_US, LLM_RG
-from convlab.base_models.llm.nlu import LLM_NLU
-from convlab.base_models.llm.dst import LLM_DST
-from convlab.base_models.llm.nlg import LLM_NLG
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'LLM': 'convlab.base_models.llm.base',
+    'LLM_US': 'convlab.base_models.llm.user_simulator',
+    'LLM_RG': 'convlab.base_models.llm.user_simulator',
+    'LLM_NLU': 'convlab.base_models.llm.nlu',
+    'LLM_DST': 'convlab.base_models.llm.dst',
+    'LLM_NLG': 'convlab.base_models.llm.nlg',
+})
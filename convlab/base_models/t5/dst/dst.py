@@ -5,16 +5,19 @@ from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, AutoConfig
 from convlab.dst.dst import DST
 from convlab.base_models.t5.dst.serialization import deserialize_dialogue_state
 from convlab.util import load_ontology
+from convlab.util.tokenizer_util import UtteranceTokenCache
 
 
 class T5DST(DST):
-    def __init__(self, dataset_name, speaker, context_window_size, model_name_or_path, device='cuda'):
+    def __init__(self, dataset_name, speaker, context_window_size, model_name_or_path, device='cuda', max_input_tokens=None):
         assert speaker in ['user', 'system']
         assert context_window_size > 0
         self.ontology = load_ontology(dataset_name)
         self.speaker = speaker
         self.opponent = 'system' if speaker == 'user' else 'user'
         self.context_window_size = context_window_size
+        # maximum number of context tokens, the oldest tokens are removed from longer contexts
+        self.max_input_tokens = max_input_tokens
         
         self.config = AutoConfig.from_pretrained(model_name_or_path)
         self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
@@ -22,6 +25,7 @@ class T5DST(DST):
         self.model.eval()
         self.device = device if torch.cuda.is_available() else "cpu"
         self.model.to(self.device)
+        self.token_cache = UtteranceTokenCache(self.tokenizer, separator='\n')
         
         logging.info("T5DST loaded")
 
@@ -34,11 +38,13 @@ class T5DST(DST):
         if len(context) > 0 and type(context[0]) is list and len(context[0]) > 1:
             context = [item[1] for item in context]
         context = context[-self.context_window_size:]
-        input_seq = '\n'.join([f"{self.opponent if (i % 2) == (len(context) % 2) else self.speaker}: {utt}" for i, utt in enumerate(context)])
+        input_seq = [f"{self.opponent if (i % 2) == (len(context) % 2) else self.speaker}: {utt}" for i, utt in enumerate(context)]
         # print(input_seq)
-        input_seq = self.tokenizer(input_seq, return_tensors="pt").to(self.device)
+        input_seq = self.token_cache.encode_context(input_seq, self.max_input_tokens)
+        input_seq = self.tokenizer.pad({'input_ids': [input_seq]}, return_tensors="pt").to(self.device)
         # print(input_seq)
-        output_seq = self.model.generate(**input_seq, max_length=256)
+        with torch.no_grad():
+            output_seq = self.model.generate(**input_seq, max_length=256)
         # print(output_seq)
         output_seq = self.tokenizer.decode(output_seq[0], skip_special_tokens=True)
         # print(output_seq)
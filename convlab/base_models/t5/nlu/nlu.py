@@ -1,17 +1,20 @@
 import logging
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, AutoConfig
-from convlab.nlu.nlu import NLU
+from convlab.nlu.nlu import NLU, length_buckets
 from convlab.base_models.t5.nlu.serialization import deserialize_dialogue_acts
+from convlab.util.tokenizer_util import UtteranceTokenCache
 
 
 class T5NLU(NLU):
-    def __init__(self, speaker, context_window_size, model_name_or_path, device='cuda'):
+    def __init__(self, speaker, context_window_size, model_name_or_path, device='cuda', max_input_tokens=None):
         assert speaker in ['user', 'system']
         self.speaker = speaker
         self.opponent = 'system' if speaker == 'user' else 'user'
         self.context_window_size = context_window_size
         self.use_context = context_window_size > 0
+        # maximum number of input tokens, the oldest context tokens are removed from longer inputs
+        self.max_input_tokens = max_input_tokens
         
         self.config = AutoConfig.from_pretrained(model_name_or_path)
         self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
@@ -19,10 +22,33 @@ class T5NLU(NLU):
         self.model.eval()
         self.device = device if torch.cuda.is_available() else "cpu"
         self.model.to(self.device)
+        self.token_cache = UtteranceTokenCache(self.tokenizer, separator='\n')
         
         logging.info("T5NLU loaded")
 
     def predict(self, utterance, context=list()):
+        return self.predict_batch([utterance], [context])[0]
+
+    def predict_batch(self, utterances, contexts=None, batch_size=32):
+        if contexts is None:
+            contexts = [[] for _ in utterances]
+        input_seqs = [self._serialize(utterance, context) for utterance, context in zip(utterances, contexts)]
+        dialog_acts = [None] * len(input_seqs)
+        input_seqs = [self.token_cache.encode_context(x, self.max_input_tokens) for x in input_seqs]
+        for bucket in length_buckets([len(x) for x in input_seqs], batch_size):
+            input_seq = self.tokenizer.pad({'input_ids': [input_seqs[i] for i in bucket]}, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                output_seqs = self.model.generate(**input_seq, max_length=256)
+            output_seqs = self.tokenizer.batch_decode(output_seqs, skip_special_tokens=True)
+            for i, output_seq in zip(bucket, output_seqs):
+                das = deserialize_dialogue_acts(output_seq.strip())
+                dialog_act = []
+                for da in das:
+                    dialog_act.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
+                dialog_acts[i] = dialog_act
+        return dialog_acts
+
+    def _serialize(self, utterance, context):
         if self.use_context:
             if len(context) > 0 and type(context[0]) is list and len(context[0]) > 1:
                 context = [item[1] for item in context]
@@ -30,19 +56,7 @@ class T5NLU(NLU):
             utts = context + [utterance]
         else:
             utts = [utterance]
-        input_seq = '\n'.join([f"{self.opponent if (i % 2) == (len(utts) % 2) else self.speaker}: {utt}" for i, utt in enumerate(utts)])
-        # print(input_seq)
-        input_seq = self.tokenizer(input_seq, return_tensors="pt").to(self.device)
-        # print(input_seq)
-        output_seq = self.model.generate(**input_seq, max_length=256)
-        # print(output_seq)
-        output_seq = self.tokenizer.decode(output_seq[0], skip_special_tokens=True)
-        # print(output_seq)
-        das = deserialize_dialogue_acts(output_seq.strip())
-        dialog_act = []
-        for da in das:
-            dialog_act.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
-        return dialog_act
+        return [f"{self.opponent if (i % 2) == (len(utts) % 2) else self.speaker}: {utt}" for i, utt in enumerate(utts)]
 
 
 if __name__ == '__main__':
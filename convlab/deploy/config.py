@@ -12,6 +12,10 @@ E.g:
     "port": 8787,           // (not default), Backend service open port
     "app_name": "convlab"      // (not default), Service access interface path name
     "session_time_out": 300 // (default as 600), The longest life cycle (seconds) in which a session is idle
+    "session_store": {"type": "sqlite", "path": "sessions-{pid}.db"}
+                            // (default as {"type": "memory"}), Where sessions are saved. "memory": in the process, limited by
+                            //   "max_items" and "max_bytes" (default as no limit); "sqlite": in a local file of the process,
+                            //   "{pid}" is replaced with the process id as workers can not share a file
   },
 
   "nlu":                    // (Can not be empty), models list of nlu module
@@ -24,6 +28,9 @@ E.g:
       "model_name": "svm",                              // (default as model key), Model name displayed on the front end
       "max_core": 2,                                    // (default as 1), The maximum number of backgrounds allowed for this model to start.
                                                         //                  Recommended to set to 1, or not set.
+      "max_batch_size": 8,                              // (default as 1), If larger than 1, the turns of concurrent sessions are queued
+                                                        //                  and run in batches of up to this size on every core.
+      "max_wait_ms": 5,                                 // (default as 5), The longest time (milliseconds) a turn waits for a batch to fill
       "preload": True                                   // (default as true), If false, this model is not preloaded
       "enable": true                                    // (default as true), If false, the system will ignore this configuration
     },
@@ -78,6 +85,7 @@ def load_config_file(filepath: str = None) -> dict:
     # check net
     conf['net'].setdefault('app_name', '')
     conf['net'].setdefault('session_time_out', 600)
+    conf['net'].setdefault('session_store', {'type': 'memory'})
     assert isinstance(conf['net'].get('port', None), int), 'Incorrect key \'net\'->\'port\' in config file \'%s\'' % filepath
     assert isinstance(conf['net'].get('app_name', None), str), 'Incorrect key \'net\'->\'app_name\' in config file \'%s\'' % filepath
 
@@ -95,6 +103,8 @@ def load_config_file(filepath: str = None) -> dict:
             conf[module][model].setdefault('model_name', model)
             conf[module][model].setdefault('max_core', 1)
             conf[module][model].setdefault('preload', True)
+            conf[module][model].setdefault('max_batch_size', 1)
+            conf[module][model].setdefault('max_wait_ms', 5)
             conf[module][model]['max_core'] = 1 if conf[module][model]['max_core'] < 1 else conf[module][model]['max_core']
             assert isinstance(conf[module][model].get("class_path", None), str), \
                 'Incorrect type for \'%s\'->\'%s\'->\'class_path\' in config file \'%s\'' % (module, model, filepath)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-batching of the turns of concurrent sessions
+"""
+import queue
+import threading
+import time
+from deploy.utils import MyLock, DeployError
+
+
+class BatchMetrics(object):
+    """Queue depth and batch size counters of a model, updated by its serving threads"""
+
+    def __init__(self):
+        self.lock = MyLock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.requests = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.wait_sec = 0.
+
+    def on_enqueue(self):
+        with self.lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def on_batch(self, batch_size, wait_sec):
+        with self.lock:
+            self.queue_depth -= batch_size
+            self.requests += batch_size
+            self.batches += 1
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            self.wait_sec += wait_sec
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.,
+                'max_batch_size': self.max_batch_size,
+                'mean_wait_ms': 1000 * self.wait_sec / self.requests if self.requests else 0.
+            }
+
+
+class TurnRequest(object):
+    """The turn of one session waiting in the queue of a model"""
+
+    def __init__(self, method, cache, isfirst, params, input_nl, input_act):
+        self.method = method
+        self.cache = cache
+        self.isfirst = isfirst
+        self.params = params
+        self.input_nl = input_nl
+        self.input_act = input_act
+        self.enqueue_time = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def set_result(self, result):
+        self.result = result
+        self.done.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class BatchQueue(object):
+    """
+    Queue of the turns of a model, served by one thread per model replica.
+
+    A serving thread waits for a request, then collects the requests arriving within `max_wait_ms` (up to
+    `max_batch_size`) and runs them together on its replica through `ModelCtrl.run_batch`.
+    """
+
+    def __init__(self, model_ctrl, max_batch_size, max_wait_ms):
+        self.model_ctrl = model_ctrl
+        self.max_batch_size = max_batch_size
+        self.max_wait_sec = max_wait_ms / 1000.
+        self.metrics = BatchMetrics()
+        self.requests = queue.Queue()
+        self.threads = [threading.Thread(target=self.__serve, daemon=True) for _ in range(model_ctrl.max_core)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, method, cache, isfirst, params, input_nl, input_act):
+        """queue a turn and wait for its (result, new cache)"""
+        request = TurnRequest(method, cache, isfirst, params, input_nl, input_act)
+        self.metrics.on_enqueue()
+        self.requests.put(request)
+        return request.wait()
+
+    def __next_batch(self):
+        batch = [self.requests.get()]
+        deadline = batch[0].enqueue_time + self.max_wait_sec
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                batch.append(self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __serve(self):
+        while True:
+            batch = self.__next_batch()
+            now = time.time()
+            self.metrics.on_batch(len(batch), sum(now - request.enqueue_time for request in batch))
+            try:
+                results = self.model_ctrl.run_batch(batch)
+            except Exception as e:
+                if not isinstance(e, DeployError):
+                    e = DeployError('running error:%s' % str(e), model=self.model_ctrl.model_id)
+                for request in batch:
+                    request.set_error(e)
+                continue
+            for request, (result, error) in zip(batch, results):
+                if error is not None:
+                    request.set_error(error)
+                else:
+                    request.set_result(result)
+
+
+if __name__ == '__main__':
+    pass
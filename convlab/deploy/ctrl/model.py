@@ -4,7 +4,9 @@
 """
 
 """
-import copy
+import logging
+import time
+from deploy.ctrl.batch import BatchMetrics, BatchQueue
 from deploy.utils import MyLock, ResourceLock, DeployError
 
 
@@ -17,6 +19,8 @@ class ModelCtrl(object):
         self.model_class = kwargs['class']
         self.ini_params = kwargs.get('ini_params', dict({}))
         self.max_core = kwargs.get('max_core', 1)
+        self.max_batch_size = kwargs.get('max_batch_size', 1)
+        self.max_wait_ms = kwargs.get('max_wait_ms', 5)
 
         # do not care
         self.class_path = kwargs.get('class_path', '')
@@ -29,6 +33,9 @@ class ModelCtrl(object):
         self.models = [None for _ in range(self.max_core)]
         self.res_lock = ResourceLock(self.max_core)
 
+        # turns of concurrent sessions are queued and run in micro-batches if max_batch_size > 1
+        self.batch_queue = BatchQueue(self, self.max_batch_size, self.max_wait_ms) if self.max_batch_size > 1 else None
+        self.metrics = self.batch_queue.metrics if self.batch_queue is not None else BatchMetrics()
 
         if kwargs.get('preload', False):
             print('Model [%s] Preload' % self.model_id)
@@ -76,19 +83,70 @@ class ModelCtrl(object):
             return model
 
     def run(self, method, cache, isfirst, params, input_nl, input_act):
+        if self.batch_queue is not None:
+            return self.batch_queue.submit(method, cache, isfirst, params, input_nl, input_act)
+
+        enqueue_time = time.time()
+        self.metrics.on_enqueue()
         res_idx = self.res_lock.res_catch()
-        print('+++++ catch res ' + str(res_idx) + ' ' + self.model_id)
+        self.metrics.on_batch(1, time.time() - enqueue_time)
         try:
-            # get model
-            model = self.models[res_idx]
-            if model is None:
-                raise DeployError('Model has not started yet.', model=self.model_id)
+            return self.__run_turn(self.__get_running_model(res_idx), method, cache, isfirst, params, input_nl,
+                                   input_act)
+        finally:
+            self.res_lock.res_leave(res_idx)
 
+    def run_batch(self, requests):
+        """
+        run the queued turns (TurnRequest) of several sessions on a free model replica
+        :return: list of (result, error) per request, result is (ret_data, new_cache)
+        """
+        res_idx = self.res_lock.res_catch()
+        try:
+            model = self.__get_running_model(res_idx)
+            batch_method = getattr(model, requests[0].method + '_batch', None)
+            if batch_method is not None and len(requests) > 1 and self.__is_batchable(requests):
+                try:
+                    return self.__run_batched(model, batch_method, requests)
+                except Exception:
+                    # run the turns one by one, so that only the failing ones get an error
+                    logging.exception('Batched %s of model [%s] failed, running the turns one by one',
+                                      requests[0].method, self.model_id)
+            results = []
+            for req in requests:
+                try:
+                    result = self.__run_turn(model, req.method, req.cache, req.isfirst, req.params, req.input_nl,
+                                             req.input_act)
+                    results.append((result, None))
+                except DeployError as e:
+                    results.append((None, e))
+            return results
+        finally:
+            self.res_lock.res_leave(res_idx)
+
+    def get_metrics(self) -> dict:
+        ret = self.metrics.to_dict()
+        ret['max_core'] = self.max_core
+        ret['batching'] = self.batch_queue is not None
+        return ret
+
+    def __get_running_model(self, res_idx):
+        model = self.models[res_idx]
+        if model is None:
+            raise DeployError('Model has not started yet.', model=self.model_id)
+        return model
+
+    @staticmethod
+    def __load_cache(model, cache, isfirst):
+        if isfirst:
+            getattr(model, 'init_session')()  # first turn
+        else:
+            getattr(model, 'from_cache')(cache)
+
+    def __run_turn(self, model, method, cache, isfirst, params, input_nl, input_act):
+        try:
             # load cache
-            if isfirst:
-                getattr(model, 'init_session')()  # first turn
-            else:
-                getattr(model, 'from_cache')(cache)
+            self.__load_cache(model, cache, isfirst)
 
             # for dst state
             if input_nl is not None:
@@ -99,20 +157,37 @@ class ModelCtrl(object):
             # process
             ret_data = getattr(model, method)(*params)
 
-            # save cache
-            new_cache = copy.deepcopy(getattr(model, 'to_cache')())
+            # save cache, to_cache returns a copy of the state
+            new_cache = getattr(model, 'to_cache')()
 
         except Exception as e:
             if not isinstance(e, DeployError):
                 raise DeployError('running error:%s' % str(e), model=self.model_id)
             else:
                 raise e
-        finally:
-            print('----- leave res ' + str(res_idx) + ' ' + self.model_id)
-            self.res_lock.res_leave(res_idx)
 
         return ret_data, new_cache
 
+    @staticmethod
+    def __is_batchable(requests):
+        # only turns that do not update the model state can share a forward pass
+        return all(req.input_nl is None and req.input_act is None and len(req.params) == len(requests[0].params)
+                   for req in requests)
+
+    def __run_batched(self, model, batch_method, requests):
+        # only methods that do not use or change the session state (e.g. predict of NLU models) may have a batched
+        # variant, so the cache of a session is kept as it is, except for the first turn which gets the initial state
+        new_caches = []
+        for req in requests:
+            if req.isfirst:
+                self.__load_cache(model, req.cache, req.isfirst)
+                new_caches.append(getattr(model, 'to_cache')())
+            else:
+                new_caches.append(req.cache)
+        # <method>_batch takes a list per parameter of <method>, e.g. predict_batch(utterances, contexts)
+        rets = batch_method(*[list(param) for param in zip(*[req.params for req in requests])])
+        return [((ret_data, new_cache), None) for ret_data, new_cache in zip(rets, new_caches)]
+
     def __catch_all_res(self):
         res_idxs = []
         for _ in range(self.max_core):
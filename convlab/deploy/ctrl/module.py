@@ -38,6 +38,10 @@ class ModuleCtrl(object):
             raise DeployError('Unknow model id \'%s\'' % model_id, module=self.module_name)
         return ret
 
+    def get_metrics(self) -> dict:
+        models = {mid: model.get_metrics() for (mid, model) in self.models.items()}
+        return {'queue_depth': sum(info['queue_depth'] for info in models.values()), 'models': models}
+
 
 if __name__ == '__main__':
     from deploy.config import get_config
@@ -4,37 +4,115 @@
 """
 
 """
+import pickle
 import uuid
-from deploy.utils import MyLock, ExpireDict
+import zlib
+from deploy.utils import MyLock, MemoryStore
+
+# delta operations of `diff`
+_KEEP, _SET, _APPEND, _UPDATE = range(4)
+
+
+def diff(old, new):
+    """
+    delta turning `old` into `new`: nested dicts are compared key by key, and lists that only grew (e.g. the dialog
+    history) only keep their new elements
+    """
+    if type(old) is dict and type(new) is dict:
+        changed = {key: diff(old[key], value) if key in old else (_SET, value) for key, value in new.items()}
+        changed = {key: delta for key, delta in changed.items() if delta[0] != _KEEP}
+        removed = [key for key in old if key not in new]
+        return (_UPDATE, changed, removed) if changed or removed else (_KEEP,)
+    if type(old) is list and type(new) is list and len(new) >= len(old) and _equal(new[:len(old)], old):
+        return (_APPEND, new[len(old):]) if len(new) > len(old) else (_KEEP,)
+    if type(old) is type(new) and _equal(old, new):
+        return (_KEEP,)
+    return _SET, new
+
+
+def _equal(old, new):
+    try:
+        return bool(old == new)
+    except Exception:  # e.g. arrays and tensors
+        return False
+
+
+def patch(old, delta):
+    """
+    apply a delta of `diff` to `old`. The dicts and lists of the result are new ones, so that a turn can be modified
+    without changing the turn it was patched from; other values are shared with `old`
+    """
+    if delta[0] == _KEEP:
+        return _copy_containers(old)
+    if delta[0] == _SET:
+        return delta[1]
+    if delta[0] == _APPEND:
+        return _copy_containers(old) + delta[1]
+    new = {key: patch(old.get(key), delta[1][key]) if key in delta[1] else _copy_containers(value)
+           for key, value in old.items() if key not in delta[2]}
+    for key in delta[1].keys() - new.keys():
+        new[key] = patch(None, delta[1][key])
+    return new
+
+
+def _copy_containers(value):
+    if type(value) is dict:
+        return {key: _copy_containers(item) for key, item in value.items()}
+    if type(value) is list:
+        return [_copy_containers(item) for item in value]
+    return value
+
+
+def encode_session(data) -> bytes:
+    """compressed session, every turn (with its module caches) is saved as a delta from the previous turn"""
+    turns = []
+    last_turn = None
+    for turn in data['turns']:
+        turns.append(diff(last_turn, turn))
+        last_turn = turn
+    return zlib.compress(pickle.dumps({'model_map': data['model_map'], 'turns': turns}, pickle.HIGHEST_PROTOCOL))
+
+
+def decode_session(value: bytes) -> dict:
+    data = pickle.loads(zlib.decompress(value))
+    turns = []
+    last_turn = None
+    for delta in data['turns']:
+        last_turn = patch(last_turn, delta)
+        turns.append(last_turn)
+    return {'model_map': data['model_map'], 'turns': turns}
 
 
 class SessionCtrl(object):
 
-    def __init__(self, max_items=None, expire_sec=None):
-        self.sessions = ExpireDict(max_items, expire_sec)
-        # self.sessions = ExpireDict(2, expire_sec)
+    def __init__(self, max_items=None, expire_sec=None, store=None):
+        """
+        :param store: session store (`deploy.utils.MemoryStore` or `deploy.utils.SQLiteStore`), an in-memory store
+            with max_items and expire_sec by default
+        """
+        self.sessions = store if store is not None else MemoryStore(max_items=max_items, expire_sec=expire_sec)
         self.lock = MyLock()
 
     def get_session(self, token) -> dict:
-        return self.sessions[token]
+        return decode_session(self.sessions[token])
 
     def set_session(self, token, data):
-        self.sessions[token] = data
+        self.sessions[token] = encode_session(data)
 
     def pop_session(self, token) -> dict:
-        return self.sessions.pop(token)
+        return decode_session(self.sessions.pop(token))
 
     def has_token(self, token) -> bool:
-        return token in self.sessions.keys()
+        return token in self.sessions
 
     def new_session(self, nlu, dst, policy, nlg) -> str:
         with self.lock:
             token = self.__new_token()
-            self.sessions[token] = self.__new_data(nlu, dst, policy, nlg)
+            self.set_session(token, self.__new_data(nlu, dst, policy, nlg))
         return token
 
     def pop_expire_session(self):
-        return self.sessions.pop_expire()
+        return {token: decode_session(value) for token, value in self.sessions.pop_expire().items()}
 
     def __new_data(self, nlu, dst, policy, nlg):
         return {
@@ -43,7 +121,7 @@ class SessionCtrl(object):
 
     def __new_token(self):
         token = str(uuid.uuid4())
-        while token in self.sessions.keys():
+        while token in self.sessions:
             token = str(uuid.uuid4())
         return token
 
@@ -56,6 +56,8 @@ def net_function(fun):
 
         if fun == 'models':
             ret = ctrl_server.on_models()
+        elif fun == 'metrics':
+            ret = ctrl_server.on_metrics()
         elif fun == 'register':
             ret = ctrl_server.on_register(**params)
         elif fun == 'close':
@@ -7,7 +7,7 @@ Backend service response service class
 import json
 import copy
 from deploy.ctrl import ModuleCtrl, SessionCtrl
-from deploy.utils import DeployError
+from deploy.utils import DeployError, get_session_store
 
 MODULES = ['nlu', 'dst', 'policy', 'nlg']
 
@@ -22,7 +22,8 @@ class ServerCtrl(object):
             'nlg': copy.deepcopy(kwargs['nlg'])
         }
         self.modules = {mdl: ModuleCtrl(mdl, self.module_conf[mdl]) for mdl in self.module_conf.keys()}
-        self.sessions = SessionCtrl(expire_sec=self.net_conf['session_time_out'])
+        self.sessions = SessionCtrl(store=get_session_store(self.net_conf['session_store'],
+                                                            expire_sec=self.net_conf['session_time_out']))
 
     def on_models(self):
         ret = {}
@@ -34,6 +35,9 @@ class ServerCtrl(object):
                 ret[module_name][model_id]['ini_params'] = json.dumps(ret[module_name][model_id]['ini_params'])
         return ret
 
+    def on_metrics(self):
+        return {module_name: self.modules[module_name].get_metrics() for module_name in MODULES}
+
     def on_register(self, **kwargs):
         ret = {key: 0 for key in MODULES}
         try:
@@ -3,3 +3,4 @@
 from deploy.utils.error import DeployError
 from deploy.utils.lock import GlobalLock, GlobalSemaphore, MyLock, MySemaphore, ResourceLock
 from deploy.utils.expire import ExpireDict
+from deploy.utils.store import MemoryStore, SQLiteStore, get_session_store
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Session stores, mapping session tokens to serialised session data (bytes)
+"""
+import datetime
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from deploy.utils.lock import MyLock
+
+
+class MemoryStore(object):
+    """
+    In-process LRU store with a limit on the number of sessions and on their total size in bytes.
+    Sessions dropped to respect the limits are returned by the next `pop_expire`, like the expired ones.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, expire_sec=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.expire_sec = expire_sec
+        self.values = OrderedDict()  # token -> [time stamp, data], least recently used first
+        self.evicted = {}
+        self.num_bytes = 0
+        self.lock = MyLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __getitem__(self, key):
+        with self.lock:
+            item = self.values[key]
+            item[0] = _time_stamp()
+            self.values.move_to_end(key)
+        return item[1]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.__delitem(key)
+            self.values[key] = [_time_stamp(), value]
+            self.num_bytes += len(value)
+            # the session being set is the most recently used one and is always kept
+            while len(self.values) > 1 and ((self.max_items is not None and len(self.values) > self.max_items) or
+                                            (self.max_bytes is not None and self.num_bytes > self.max_bytes)):
+                old_key = next(iter(self.values))
+                self.evicted[old_key] = self.values[old_key][1]
+                self.__delitem(old_key)
+
+    def keys(self):
+        return self.values.keys()
+
+    def pop(self, key):
+        with self.lock:
+            ret = self.values[key][1]
+            self.__delitem(key)
+        return ret
+
+    def pop_expire(self):
+        with self.lock:
+            ret, self.evicted = self.evicted, {}
+            if self.expire_sec is not None:
+                now = _time_stamp()
+                for key in [key for key, (stamp, _) in self.values.items() if now - stamp > self.expire_sec]:
+                    ret[key] = self.values[key][1]
+                    self.__delitem(key)
+        return ret
+
+    def __delitem(self, key):
+        if key in self.values:
+            self.num_bytes -= len(self.values.pop(key)[1])
+
+
+class SQLiteStore(object):
+    """
+    On-disk store in a local SQLite file, keeping the sessions out of the memory of the server process.
+
+    Sessions hold references to the models loaded (and counted) by the process that created them, so the file can
+    not be shared by several server processes: `{pid}` in the path is replaced with the process id, e.g.
+    "sessions-{pid}.db" for the workers of gunicorn. Sessions left in the file by a previous process are removed.
+    """
+
+    def __init__(self, path, expire_sec=None):
+        self.path = os.path.abspath(path.format(pid=os.getpid()))
+        self.expire_sec = expire_sec
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.__conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, stamp REAL, data BLOB)')
+            conn.execute('DELETE FROM sessions')
+
+    def __conn(self):
+        # sqlite connections can not be shared between threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self.__conn().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.__conn().execute('SELECT 1 FROM sessions WHERE token = ?', (key,)).fetchone() is not None
+
+    def __getitem__(self, key):
+        with self.__conn() as conn:
+            row = conn.execute('SELECT data FROM sessions WHERE token = ?', (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            conn.execute('UPDATE sessions SET stamp = ? WHERE token = ?', (_time_stamp(), key))
+        return bytes(row[0])
+
+    def __setitem__(self, key, value):
+        with self.__conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)', (key, _time_stamp(), value))
+
+    def keys(self):
+        return [row[0] for row in self.__conn().execute('SELECT token FROM sessions')]
+
+    def pop(self, key):
+        with self.__conn() as conn:
+            row = conn.execute('SELECT data FROM sessions WHERE token = ?', (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            conn.execute('DELETE FROM sessions WHERE token = ?', (key,))
+        return bytes(row[0])
+
+    def pop_expire(self):
+        if self.expire_sec is None:
+            return {}
+        conn = self.__conn()
+        with conn:
+            # the write lock is taken first, so that every expired session is popped by one thread only
+            conn.execute('BEGIN IMMEDIATE')
+            limit = _time_stamp() - self.expire_sec
+            rows = conn.execute('SELECT token, data FROM sessions WHERE stamp < ?', (limit,)).fetchall()
+            conn.execute('DELETE FROM sessions WHERE stamp < ?', (limit,))
+        return {token: bytes(data) for token, data in rows}
+
+
+def get_session_store(conf: dict, expire_sec=None):
+    """
+    create the session store of the `net`->`session_store` config
+    :param conf: dict, {"type": "memory", "max_items": ..., "max_bytes": ...} or {"type": "sqlite", "path": ...}
+    """
+    conf = dict(conf or {})
+    store_type = conf.pop('type', 'memory')
+    if store_type == 'memory':
+        return MemoryStore(expire_sec=expire_sec, **conf)
+    elif store_type == 'sqlite':
+        return SQLiteStore(expire_sec=expire_sec, **conf)
+    raise ValueError('Unknow session store type \'%s\'' % store_type)
+
+
+def _time_stamp():
+    return datetime.datetime.now().timestamp()
+
+
+if __name__ == '__main__':
+    pass
@@ -5,6 +5,7 @@ from convlab.nlu import NLU
 from convlab.dst import DST
 from convlab.policy import Policy
 from convlab.nlg import NLG
+from convlab.util.state_util import copy_nested, copy_state
 from copy import deepcopy
 import time
 import pdb
@@ -159,7 +160,7 @@ class PipelineAgent(Agent):
                 self.input_action = observation
                 self.input_action_eval = observation
         # get rid of reference problem
-        self.input_action = deepcopy(self.input_action)
+        self.input_action = copy_nested(self.input_action)
 
         # get state
         if self.dst is not None:
@@ -171,10 +172,10 @@ class PipelineAgent(Agent):
         else:
             state = self.input_action
 
-        state = deepcopy(state)  # get rid of reference problem
+        state = copy_state(state)  # get rid of reference problem
         # get action
         # get rid of reference problem
-        self.output_action = deepcopy(self.policy.predict(state))
+        self.output_action = copy_nested(self.policy.predict(state))
 
         # get model response
         if self.nlg is not None:
@@ -351,7 +352,7 @@ class DialogueAgent(Agent):
         else:
             self.input_action = observation
         # get rid of reference problem
-        self.input_action = deepcopy(self.input_action)
+        self.input_action = copy_nested(self.input_action)
         fundamental_info['input_action'] = self.input_action
 
         # get state
@@ -361,13 +362,13 @@ class DialogueAgent(Agent):
         else:
             state = self.input_action
 
-        state = deepcopy(state)  # get rid of reference problem
+        state = copy_state(state)  # get rid of reference problem
         fundamental_info['state'] = state
         self.sys_state_history.append(state)
 
         # get action
         # get rid of reference problem
-        self.output_action = deepcopy(self.policy.predict(state))
+        self.output_action = copy_nested(self.policy.predict(state))
         if hasattr(self.policy, "last_action"):
             self.sys_action_history.append(self.policy.last_action)
         else:
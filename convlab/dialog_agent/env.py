@@ -6,7 +6,8 @@ Created on Wed Jul 17 14:27:34 2019
 """
 
 import pdb
-from copy import deepcopy
+
+from convlab.util.state_util import copy_state
 
 
 class Environment():
@@ -28,6 +29,15 @@ class Environment():
         return self.sys_dst.state
 
     def step(self, action, user_reward=False):
+        model_response = self.system_response(action)
+        observation = self.usr.response(model_response)
+        self.evaluate_turn()
+        dialog_act = self.sys_nlu.predict(
+            observation) if self.sys_nlu else observation
+        return self.update_state(model_response, observation, dialog_act, user_reward)
+
+    def system_response(self, action):
+        """save the system action and return the system response the user receives"""
         # save last system action
         self.sys_dst.state['system_action'] = action
         if not self.use_semantic_acts:
@@ -35,19 +45,24 @@ class Environment():
                 action) if self.sys_nlg else action
         else:
             model_response = action
+        self.book(action)
+        return model_response
+
+    def book(self, action):
         # If system takes booking action add booking info to the 'book-booked' section of the belief state
         if type(action) == list:
             for intent, domain, slot, value in action:
                 if intent == "book":
                     self.sys_dst.state['booked'][domain] = [{slot: value}]
-        observation = self.usr.response(model_response)
+
+    def evaluate_turn(self):
         if self.evaluator:
             self.evaluator.add_sys_da(
                 self.usr.get_in_da(), self.sys_dst.state['belief_state'])
             self.evaluator.add_usr_da(self.usr.get_out_da())
 
-        dialog_act = self.sys_nlu.predict(
-            observation) if self.sys_nlu else observation
+    def update_state(self, model_response, observation, dialog_act, user_reward=False):
+        """track the user turn and return the new state, reward and whether the dialogue is terminated"""
         self.sys_dst.state['user_action'] = dialog_act
         self.sys_dst.state['history'].append(["sys", model_response])
         self.sys_dst.state['history'].append(["user", observation])
@@ -56,7 +71,7 @@ class Environment():
         self.sys_dst.state['history'].append(["sys", model_response])
         self.sys_dst.state['history'].append(["usr", observation])
 
-        state = deepcopy(state)
+        state = copy_state(state)
 
         terminated = self.usr.is_terminated()
         if not user_reward:
@@ -68,3 +83,99 @@ class Environment():
             reward = self.usr.get_reward()
 
         return state, reward, terminated
+
+
+def batch_call(module, method, inputs):
+    """call `method`_batch of module on all inputs at once if it exists, otherwise `method` on every input"""
+    batch_method = getattr(module, method + '_batch', None)
+    if batch_method is not None:
+        return batch_method(inputs)
+    return [getattr(module, method)(x) for x in inputs]
+
+
+class VectorEnvironment():
+    """
+    N independent dialogues stepped in lockstep.
+
+    Every dialogue is an Environment with its own user simulator and system DST, which keep the dialogue state. The
+    stateless stages, system NLG and NLU, are run as one call over all live dialogues sharing the same module, using
+    its generate_batch/predict_batch when it has one. Like Environment.step, the system NLU only gets the user
+    utterance, not the dialogue context. The user simulators keep a goal and agenda per dialogue and are stepped one
+    by one; the system policy is not part of the environment, the caller picks the actions of all dialogues.
+    Terminated dialogues are reset with the next goal when auto_reset is set.
+    """
+
+    def __init__(self, envs, auto_reset=True):
+        """
+        :param envs: list of Environment, one per dialogue. The system NLU and NLG can (and should) be shared.
+        :param auto_reset: whether to reset terminated dialogues in step
+        """
+        self.envs = envs
+        self.auto_reset = auto_reset
+        self.states = [None] * len(envs)
+
+    def __len__(self):
+        return len(self.envs)
+
+    def reset(self, goals=None):
+        """reset all dialogues, goals is an optional list with the goal of every dialogue"""
+        goals = goals or [None] * len(self.envs)
+        self.states = [copy_state(env.reset(goal)) for env, goal in zip(self.envs, goals)]
+        return self.states
+
+    def reset_at(self, index, goal=None):
+        self.states[index] = copy_state(self.envs[index].reset(goal))
+        return self.states[index]
+
+    def _fan_out(self, indices, stage, method, inputs):
+        """run method of the `stage` module of the dialogues in indices, one batched call per distinct module"""
+        outputs = {}
+        groups = {}
+        for i, x in zip(indices, inputs):
+            module = getattr(self.envs[i], stage)
+            groups.setdefault(id(module), (module, []))[1].append((i, x))
+        for module, items in groups.values():
+            for (i, _), y in zip(items, batch_call(module, method, [x for _, x in items])):
+                outputs[i] = y
+        return [outputs[i] for i in indices]
+
+    def step(self, actions, user_reward=False, indices=None):
+        """
+        :param actions: system action of every dialogue in indices
+        :param indices: dialogues to step, all of them by default
+        :return: next states, rewards and terminated flags of the stepped dialogues. The next state of a terminated
+        dialogue is its final state, with auto_reset the env is already reset and self.states holds its initial state.
+        """
+        indices = list(range(len(self.envs))) if indices is None else indices
+        envs = [self.envs[i] for i in indices]
+        position = {i: k for k, i in enumerate(indices)}
+
+        for env, action in zip(envs, actions):
+            env.sys_dst.state['system_action'] = action
+        nlg_indices = [i for i, env in zip(indices, envs) if env.sys_nlg and not env.use_semantic_acts]
+        responses = dict(zip(nlg_indices, self._fan_out(
+            nlg_indices, 'sys_nlg', 'generate', [actions[position[i]] for i in nlg_indices])))
+        model_responses = [responses.get(i, action) for i, action in zip(indices, actions)]
+        for env, action in zip(envs, actions):
+            env.book(action)
+
+        observations = []
+        for env, model_response in zip(envs, model_responses):
+            observations.append(env.usr.response(model_response))
+            env.evaluate_turn()
+
+        # no contexts are passed to predict_batch, Environment.step calls sys_nlu.predict without context as well
+        nlu_indices = [i for i, env in zip(indices, envs) if env.sys_nlu]
+        dialog_acts = dict(zip(nlu_indices, self._fan_out(
+            nlu_indices, 'sys_nlu', 'predict', [observations[position[i]] for i in nlu_indices])))
+
+        next_states, rewards, terminated = [], [], []
+        for i, env, model_response, observation in zip(indices, envs, model_responses, observations):
+            s, r, t = env.update_state(model_response, observation, dialog_acts.get(i, observation), user_reward)
+            next_states.append(s)
+            rewards.append(r)
+            terminated.append(t)
+            self.states[i] = s
+            if t and self.auto_reset:
+                self.reset_at(i)
+        return next_states, rewards, terminated
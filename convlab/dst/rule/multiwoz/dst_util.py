@@ -1,15 +1,24 @@
+import logging
 import re
+from collections import OrderedDict
 from difflib import SequenceMatcher
 
+try:
+    from Levenshtein import distance as _edit_distance
+except ImportError:
+    _edit_distance = None
+
+# precompiled normalizers of the most recently used value lists, by the values of the list
+_NORMALIZERS = OrderedDict()
+_NORMALIZERS_SIZE = 256
+
 
 def str_similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
 
 def _log(info):
-    with open('fuzzy_recognition.log', 'a+') as f:
-        f.write('{}\n'.format(info))
-    f.close()
+    logging.debug(info)
 
 
 def minDistance(word1, word2):
@@ -62,15 +71,24 @@ def normalize_value(value_set, domain, slot, value):
         # raise Exception(
         #     'slot <{}> not found in db_values[{}]'.format(
         #         slot, domain))
-    value_list = value_set[domain][slot]
+    normalizer = get_value_normalizer(value_set[domain][slot])
+    raw_value = value
+    value = normalizer.cache_get(raw_value)
+    if value is None:
+        value = _normalize_value(normalizer, domain, slot, raw_value)
+        normalizer.cache_put(raw_value, value)
+    return value
+
+
+def _normalize_value(normalizer, domain, slot, value):
     # exact match or containing match
-    v = _match_or_contain(value, value_list)
+    v = _match_or_contain(value, normalizer)
     if v is not None:
         return v
     # some transfomations
     cand_values = _transform_value(value)
     for cv in cand_values:
-        v = _match_or_contain(cv, value_list)
+        v = _match_or_contain(cv, normalizer)
         if v is not None:
             return v
     # special value matching
@@ -86,6 +104,102 @@ def normalize_value(value_set, domain, slot, value):
     return value
 
 
+class ValueNormalizer(object):
+    """
+    Index of a value list, answering the matches of `_match_or_contain` and `simple_fuzzy_match` without scanning the
+    list. Every query returns the first value of the list that matches, like the scans do.
+    """
+
+    def __init__(self, value_list, cache_size=4096):
+        self.values = list(value_list)
+        self.first_index = {}
+        self.str_indices = []  # indices of the string values
+        self.lengths = {}  # length -> indices of the values of this length
+        self.trigrams = {}  # character trigram -> indices of the values containing it
+        for i, v in enumerate(self.values):
+            # values that are not strings (the room prices of hotels) can not be matched
+            if not isinstance(v, str):
+                continue
+            self.first_index.setdefault(v, i)
+            self.str_indices.append(i)
+            self.lengths.setdefault(len(v), []).append(i)
+            for gram in {v[j:j + 3] for j in range(len(v) - 2)}:
+                self.trigrams.setdefault(gram, []).append(i)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # recent raw value -> normalized value
+
+    def cache_get(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+        return value
+
+    def cache_put(self, key, value):
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def __contains__(self, value):
+        return value in self.first_index
+
+    def find_containing(self, *queries):
+        """the first value v with `v in q or q in v` for one of the queries q, None if there is none"""
+        best = len(self.values)
+        for q in queries:
+            # values in q: look up the substrings of q with the length of a value
+            for length in self.lengths:
+                if length > len(q):
+                    continue
+                for start in range(len(q) - length + 1):
+                    best = min(best, self.first_index.get(q[start:start + length], best))
+            # q in values: only the values containing the rarest trigram of q are candidates
+            if len(q) >= 3:
+                candidates = min((self.trigrams.get(q[j:j + 3], []) for j in range(len(q) - 2)), key=len)
+            else:
+                candidates = self.str_indices
+            for i in candidates:
+                if i >= best:
+                    break
+                if q in self.values[i]:
+                    best = i
+                    break
+        return self.values[best] if best < len(self.values) else None
+
+    def find_similar(self, value, max_distance):
+        """the first value within `max_distance` edits of value, None if there is none"""
+        # the edit distance is at least the difference of the lengths
+        candidates = sorted(i for length in range(len(value) - max_distance, len(value) + max_distance + 1)
+                            for i in self.lengths.get(length, []))
+        for i in candidates:
+            if _distance(value, self.values[i]) <= max_distance:
+                return self.values[i]
+        return None
+
+
+def get_value_normalizer(value_list):
+    """the ValueNormalizer of value_list, built on first use"""
+    try:
+        key = tuple(value_list)
+        normalizer = _NORMALIZERS.get(key)
+    except TypeError:
+        # lists with unhashable values are indexed every time
+        return ValueNormalizer(value_list)
+    if normalizer is None:
+        normalizer = ValueNormalizer(value_list)
+        _NORMALIZERS[key] = normalizer
+        if len(_NORMALIZERS) > _NORMALIZERS_SIZE:
+            _NORMALIZERS.popitem(last=False)
+    else:
+        _NORMALIZERS.move_to_end(key)
+    return normalizer
+
+
+def _distance(word1, word2):
+    if _edit_distance is not None:
+        return _edit_distance(word1, word2)
+    return minDistance(word1, word2)
+
+
 def _transform_value(value):
     cand_list = []
     # a 's -> a's
@@ -105,18 +219,18 @@ def _transform_value(value):
     return cand_list
 
 
-def _match_or_contain(value, value_list):
+def _match_or_contain(value, normalizer):
     """match value by exact match or containing"""
-    if value in value_list:
+    if value in normalizer:
         return value
-    for v in value_list:
-        if v in value or value in v:
-            return v
+    v = normalizer.find_containing(value)
+    if v is not None:
+        return v
     # fuzzy match, when len(value) is large and distance(v1, v2) is small
-    for v in value_list:
-        d = minDistance(value, v)
-        if (d <= 2 and len(value) >= 10) or (d <= 3 and len(value) >= 15):
-            return v
+    if len(value) >= 15:
+        return normalizer.find_similar(value, 3)
+    if len(value) >= 10:
+        return normalizer.find_similar(value, 2)
     return None
 
 
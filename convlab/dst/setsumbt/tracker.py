@@ -23,6 +23,7 @@ import transformers
 
 from convlab.dst.setsumbt.modeling import SetSUMBTModels
 from convlab.dst.dst import DST
+from convlab.util.state_util import copy_nested, copy_state
 
 USE_CUDA = torch.cuda.is_available()
 transformers.logging.set_verbosity_error()
@@ -214,7 +215,7 @@ class SetSUMBTTracker(DST):
         # Update belief state
         user_acts = outputs.state['user_action']
 
-        new_belief_state = copy.deepcopy(prev_state['belief_state'])
+        new_belief_state = copy_nested(prev_state['belief_state'])
         for domain, substate in outputs.state['belief_state'].items():
             for slot, value in substate.items():
                 value = '' if value == 'none' else value
@@ -255,7 +256,7 @@ class SetSUMBTTracker(DST):
         for domain in new_domains:
             user_acts.append(['inform', domain, 'none', 'none'])
 
-        new_state = copy.deepcopy(dict(prev_state))
+        new_state = copy_state(prev_state)
         new_state['belief_state'] = new_belief_state
         new_state['active_domains'] = self.active_domains
         if belief_state_confidence is not None:
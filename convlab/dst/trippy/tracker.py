@@ -29,6 +29,7 @@ from convlab.dst.dst import DST
 from convlab.dst.trippy.modeling_dst import (TransformerForDST)
 from convlab.dst.trippy.dataset_interfacer import (create_dataset_interfacer)
 from convlab.util import relative_import_module_from_unified_datasets
+from convlab.util.state_util import copy_nested, copy_state
 
 
 class BertForDST(TransformerForDST('bert')): pass
@@ -299,7 +300,7 @@ class TRIPPY(DST):
 
         # --- Update ConvLab-style dialogue state ---
 
-        new_belief_state = copy.deepcopy(prev_state['belief_state'])
+        new_belief_state = copy_nested(prev_state['belief_state'])
         user_acts = []
         for state, value in pred_states.items():
             value = self.dataset_interfacer.normalize_values(value)
@@ -320,7 +321,7 @@ class TRIPPY(DST):
             self.update_gt_belief_state(u_acts) # For evaluation
 
         # BELIEF STATE UPDATE
-        new_state = copy.deepcopy(dict(prev_state))
+        new_state = copy_state(prev_state)
         new_state['belief_state'] = new_belief_state # TripPy
 
         state_updates = {}
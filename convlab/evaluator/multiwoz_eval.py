@@ -11,6 +11,7 @@ from convlab.util.multiwoz.multiwoz_slot_trans import REF_SYS_DA
 from convlab.evaluator.evaluator import Evaluator
 # from data.unified_datasets.multiwoz21.preprocess import reverse_da_slot_name_map
 from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import unified_format, act_dict_to_flat_tuple
+from convlab.util.db_registry import shared_database
 from convlab.util.multiwoz.dbquery import Database
 from convlab.util import relative_import_module_from_unified_datasets
 
@@ -95,7 +96,8 @@ class MultiWozEvaluator(Evaluator):
         self.goal = {}
         self.cur_domain = ''
         self.booked = {}
-        self.database = Database()
+        self.booked_states = {}
+        self.database = shared_database(Database)
         self.dbs = self.database.dbs
         self.check_book_constraints = check_book_constraints
         self.check_domain_success = check_domain_success
@@ -103,6 +105,9 @@ class MultiWozEvaluator(Evaluator):
         self.success = 0
         self.success_strict = 0
         self.successful_domains = []
+        self._reset_inform_stats()
+        self._reset_success_stats()
+        self.goal_query_cache = {}
         logging.info(
             f"We check booking constraints: {self.check_book_constraints}")
 
@@ -146,6 +151,9 @@ class MultiWozEvaluator(Evaluator):
         self.booked = self._init_dict_booked()
         self.booked_states = self._init_dict_booked()
         self.successful_domains = []
+        self._reset_inform_stats()
+        self._reset_success_stats()
+        self.goal_query_cache = {}
 
     @staticmethod
     def _convert_action(act):
@@ -173,9 +181,13 @@ class MultiWozEvaluator(Evaluator):
 
         da_turn = self._convert_action(da_turn)
 
+        # the goal requests, informed slots and bookings of these domains may change
+        changed_domains = {domain.lower() for _, domain, _, _ in da_turn}
+        num_sys_da = len(self.sys_da_array)
         for intent, domain, slot, value in da_turn:
             dom_int = '_'.join([domain, intent])
             domain = dom_int.split('_')[0].lower()
+            changed_domains.add(domain)
             if domain in belief_domains and domain != self.cur_domain:
                 self.cur_domain = domain
             da = (dom_int + '_' + slot).lower()
@@ -200,6 +212,7 @@ class MultiWozEvaluator(Evaluator):
                         else:
                             self.booked_states[domain] = None
         self.goal = self.update_goal(self.goal, da_turn)
+        self._update_success_stats(changed_domains, num_sys_da)
 
     def add_usr_da(self, da_turn):
         """add usr_da into array
@@ -313,20 +326,19 @@ class MultiWozEvaluator(Evaluator):
                     score.append(match / tot)
         return score
 
-    def _inform_F1_goal(self, goal, sys_history, domains=None):
+    def _reset_inform_stats(self):
+        # slots informed by the system, updated incrementally from sys_da_array, see _sys_inform_stats
+        self.inform_stats_source = self.sys_da_array
+        self.inform_stats_num = 0
+        self.inform_stats = ({domain: set() for domain in belief_domains},
+                             {domain: set() for domain in belief_domains},
+                             {domain: 0 for domain in belief_domains})
+
+    def _scan_inform(self, sys_history, domains, inform_slot, bad_inform, bad_inform_num):
         """
-        judge if all the requested information is answered
+        add the valid slots informed in sys_history to inform_slot[domain] and the invalid ones to
+        bad_inform[domain], counting invalid informs in bad_inform_num[domain]
         """
-        if domains is None:
-            domains = belief_domains
-        inform_slot = {}
-        for domain in domains:
-            inform_slot[domain] = set()
-        TP, FP, FN = 0, 0, 0
-
-        inform_not_reqt = set()
-        reqt_not_inform = set()
-        bad_inform = set()
         for da in sys_history:
             domain, intent, slot, value = da.split('_', 3)
             if intent in ['inform', 'recommend', 'offerbook', 'offerbooked'] and \
@@ -336,18 +348,102 @@ class MultiWozEvaluator(Evaluator):
                     # print('add key', key)
                     inform_slot[domain].add(key)
                 else:
-                    bad_inform.add((intent, domain, key))
-                    FP += 1
+                    bad_inform[domain].add((intent, domain, key))
+                    bad_inform_num[domain] += 1
+
+    def _sys_inform_stats(self):
+        """inform statistics of sys_da_array for all domains, only scanning the acts added since the last call"""
+        if self.inform_stats_source is not self.sys_da_array or self.inform_stats_num > len(self.sys_da_array):
+            self._reset_inform_stats()
+        self._scan_inform(self.sys_da_array[self.inform_stats_num:], belief_domains, *self.inform_stats)
+        self.inform_stats_num = len(self.sys_da_array)
+        return self.inform_stats
+
+    def _reset_success_stats(self):
+        # per domain components of task_success and domain_success with ref2goal=True, see _domain_stats
+        self.success_stats = {}
+        self.success_stats_sources = (self.goal, self.booked, self.booked_states, self.sys_da_array)
+        self.success_stats_num = len(self.sys_da_array)
+
+    def _update_success_stats(self, domains, num_sys_da):
+        """drop the stats of the domains changed by a system turn, which started after num_sys_da system acts"""
+        if not self._success_stats_valid(num_sys_da):
+            self._reset_success_stats()
+            return
+        for domain in domains:
+            self.success_stats.pop(domain, None)
+        self.success_stats_num = len(self.sys_da_array)
+
+    def _success_stats_valid(self, num_sys_da=None):
+        """whether the stats were computed on the current goal, bookings and system acts"""
+        sources = (self.goal, self.booked, self.booked_states, self.sys_da_array)
+        if num_sys_da is None:
+            num_sys_da = len(self.sys_da_array)
+        return all(a is b for a, b in zip(sources, self.success_stats_sources)) and \
+            num_sys_da == self.success_stats_num
+
+    def _expand_domain(self, domain):
+        """the goal of a domain as expanded by _expand"""
+        goal = dict(self.goal.get(domain, {}))
+        goal.setdefault('info', {})
+        goal.setdefault('book', {})
+        goal.setdefault('reqt', [])
+        return goal
+
+    def _domain_stats(self, domain):
+        """
+        booking, inform and final goal results of a domain w.r.t. the goal, only recomputed when a system turn has
+        changed the domain, so that task_success costs O(domains) instead of rescanning the dialogue
+        """
+        if not self._success_stats_valid():
+            self._reset_success_stats()
+        stats = self.success_stats.get(domain)
+        if stats is None:
+            goal = {domain: self._expand_domain(domain)}
+            stats = {
+                'booking_done': not goal[domain]['book'] or bool(self.booked.get(domain)),
+                'book_rate': self._book_rate_goal(goal, self.booked, [domain]),
+                'book_constraints': self._book_goal_constraints(goal, self.booked_states, [domain]),
+                'inform': self._inform_F1_goal(goal, self.sys_da_array, [domain]),
+            }
+            # taxi results are sampled, they are queried on every call, see _query_goal
+            if domain in self.goal and domain != 'taxi':
+                stats['goal_match'] = self._goal_domain_match(domain)
+            self.success_stats[domain] = stats
+        return stats
+
+    def _inform_F1_goal(self, goal, sys_history, domains=None):
+        """
+        judge if all the requested information is answered
+        """
+        if domains is None:
+            domains = belief_domains
+        if sys_history is self.sys_da_array:
+            inform_slot, bad_inform_by_domain, bad_inform_num = self._sys_inform_stats()
+        else:
+            inform_slot = {domain: set() for domain in domains}
+            bad_inform_by_domain = {domain: set() for domain in domains}
+            bad_inform_num = {domain: 0 for domain in domains}
+            self._scan_inform(sys_history, domains, inform_slot, bad_inform_by_domain, bad_inform_num)
+        TP, FP, FN = 0, 0, 0
+
+        inform_not_reqt = set()
+        reqt_not_inform = set()
+        bad_inform = set()
         for domain in domains:
+            bad_inform.update(bad_inform_by_domain.get(domain, ()))
+            FP += bad_inform_num.get(domain, 0)
+        for domain in domains:
+            domain_inform_slot = inform_slot.get(domain, set())
             for k in goal[domain]['reqt']:
-                if k in inform_slot[domain]:
+                if k in domain_inform_slot:
                     # print('k: ', k)
                     TP += 1
                 else:
                     # print('FN + 1')
                     reqt_not_inform.add(('request', domain, k))
                     FN += 1
-            for k in inform_slot[domain]:
+            for k in domain_inform_slot:
                 # exclude slots that are informed by users
                 if k not in goal[domain]['reqt'] \
                         and k not in goal[domain]['info'] \
@@ -469,15 +565,26 @@ class MultiWozEvaluator(Evaluator):
         """
         judge if all the domains are successfully completed
         """
-        booking_done = self.check_booking_done(ref2goal)
-        book_sess = self.book_rate(ref2goal)
-        book_constraint_sess = self.book_rate_constrains(ref2goal)
-        inform_sess = self.inform_F1(ref2goal)
+        if ref2goal:
+            stats = [self._domain_stats(domain) for domain in belief_domains]
+            booking_done = all(domain_stats['booking_done'] for domain_stats in stats)
+            book_sess = [score for domain_stats in stats for score in domain_stats['book_rate']]
+            book_sess = np.mean(book_sess) if book_sess else None
+            book_constraint_sess = [score for domain_stats in stats for score in domain_stats['book_constraints']]
+            book_constraint_sess = np.mean(book_constraint_sess) if book_constraint_sess else None
+            TP = sum(domain_stats['inform'][0] for domain_stats in stats)
+            FN = sum(domain_stats['inform'][2] for domain_stats in stats)
+            inform_rec = TP / (TP + FN) if TP + FN else None
+        else:
+            booking_done = self.check_booking_done(ref2goal)
+            book_sess = self.book_rate(ref2goal)
+            book_constraint_sess = self.book_rate_constrains(ref2goal)
+            inform_rec = self.inform_F1(ref2goal)[1]
         goal_sess = self.final_goal_analyze()
 
-        if ((book_sess == 1 and inform_sess[1] == 1)
-            or (book_sess == 1 and inform_sess[1] is None)
-            or (book_sess is None and inform_sess[1] == 1)) \
+        if ((book_sess == 1 and inform_rec == 1)
+            or (book_sess == 1 and inform_rec is None)
+            or (book_sess is None and inform_rec == 1)) \
                 and goal_sess == 1:
             self.complete = 1
             self.success = 1
@@ -486,7 +593,7 @@ class MultiWozEvaluator(Evaluator):
             return self.success if not self.check_book_constraints else self.success_strict
         else:
             self.complete = 1 if booking_done and (
-                inform_sess[1] == 1 or inform_sess[1] is None) else 0
+                inform_rec == 1 or inform_rec is None) else 0
             self.success = 0
             self.success_strict = 0
             return 0
@@ -523,8 +630,10 @@ class MultiWozEvaluator(Evaluator):
             return None
 
         if ref2goal:
-            goal = {}
-            goal[domain] = self._expand(self.goal)[domain]
+            stats = self._domain_stats(domain)
+            book_constraints = stats['book_constraints']
+            book_rate = stats['book_rate']
+            inform = stats['inform']
         else:
             goal = {}
             goal[domain] = {'info': {}, 'book': {}, 'reqt': []}
@@ -538,19 +647,18 @@ class MultiWozEvaluator(Evaluator):
                     goal[d]['info'][mapping[d][s]] = v
                 elif i == 'request':
                     goal[d]['reqt'].append(s)
+            book_constraints = self._book_goal_constraints(
+                goal, self.booked_states, [domain])
+            book_rate = self._book_rate_goal(goal, self.booked, [domain])
+            inform = self._inform_F1_goal(goal, self.sys_da_array, [domain])
 
-        book_constraints = self._book_goal_constraints(
-            goal, self.booked_states, [domain])
         book_constraints = np.mean(
             book_constraints) if book_constraints else None
-
-        book_rate = self._book_rate_goal(goal, self.booked, [domain])
         book_rate = np.mean(book_rate) if book_rate else None
         match, mismatch = self._final_goal_analyze_domain(domain)
         goal_sess = 1 if (match == 0 and mismatch ==
                           0) else match / (match + mismatch)
 
-        inform = self._inform_F1_goal(goal, self.sys_da_array, [domain])
         try:
             inform_rec = inform[0] / (inform[0] + inform[2])
         except ZeroDivisionError:
@@ -565,74 +673,64 @@ class MultiWozEvaluator(Evaluator):
         else:
             return 0
 
-    def _final_goal_analyze_domain(self, domain):
+    def _query_goal(self, domain, constraints):
+        """database query of the goal constraints of a domain, cached until the constraints change"""
+        if domain == 'taxi':
+            # taxi results are sampled, keep drawing them so that the random state is the same as without cache
+            return self.database.query(domain, constraints)
+        try:
+            key = (domain, tuple(constraints))
+            hash(key)
+        except TypeError:
+            return self.database.query(domain, constraints)
+        if key not in self.goal_query_cache:
+            self.goal_query_cache[key] = self.database.query(domain, constraints)
+        return self.goal_query_cache[key]
+
+    def _goal_domain_match(self, domain):
+        """whether the database has entities for the goal constraints of a domain, and whether the booking matches"""
+        dom_goal_dict = self.goal[domain]
+        reqt_constraints = list(dom_goal_dict['reqt'].items()) if 'reqt' in dom_goal_dict else []
+        info_constraints = list(dom_goal_dict['info'].items()) if 'info' in dom_goal_dict else []
+        query_result = self._query_goal(domain, info_constraints + reqt_constraints)
+
+        booked = self.booked.get(domain)
+        if not dom_goal_dict.get('book'):
+            booking_match = True
+        elif isinstance(booked, dict):
+            ref = booked['Ref']
+            booking_match = any(found['Ref'] == ref for found in query_result)
+        else:
+            booking_match = True
+        return bool(query_result), booking_match
 
+    def _goal_match(self, domain):
+        if domain == 'taxi':
+            return self._goal_domain_match(domain)
+        return self._domain_stats(domain)['goal_match']
+
+    def _final_goal_analyze_domain(self, domain):
         match = mismatch = 0
-        if domain in self.goal:
-            dom_goal_dict = self.goal[domain]
-        else:
+        if domain not in self.goal:
             return match, mismatch
-        constraints = []
-        if 'reqt' in dom_goal_dict:
-            reqt_constraints = list(dom_goal_dict['reqt'].items())
-            constraints += reqt_constraints
-        else:
-            reqt_constraints = []
-        if 'info' in dom_goal_dict:
-            info_constraints = list(dom_goal_dict['info'].items())
-            constraints += info_constraints
-        else:
-            info_constraints = []
-        query_result = self.database.query(
-            domain, info_constraints + reqt_constraints)
-        if not query_result:
+        found, booking_match = self._goal_match(domain)
+        if not found:
             mismatch += 1
-
-        booked = self.booked[domain]
-        if not self.goal[domain].get('book'):
+        if booking_match:
             match += 1
-        elif isinstance(booked, dict):
-            ref = booked['Ref']
-            if any(found['Ref'] == ref for found in query_result):
-                match += 1
-            else:
-                mismatch += 1
         else:
-            match += 1
+            mismatch += 1
         return match, mismatch
 
     def _final_goal_analyze(self):
         """whether the final goal satisfies constraints"""
         match = mismatch = 0
-        for domain, dom_goal_dict in self.goal.items():
-            constraints = []
-            if 'reqt' in dom_goal_dict:
-                reqt_constraints = list(dom_goal_dict['reqt'].items())
-                constraints += reqt_constraints
-            else:
-                reqt_constraints = []
-            if 'info' in dom_goal_dict:
-                info_constraints = list(dom_goal_dict['info'].items())
-                constraints += info_constraints
-            else:
-                info_constraints = []
-            query_result = self.database.query(
-                domain, info_constraints + reqt_constraints)
-            if not query_result:
-                mismatch += 1
-                continue
-
-            booked = self.booked[domain]
-            if not self.goal[domain].get('book'):
+        for domain in self.goal:
+            found, booking_match = self._goal_match(domain)
+            if found and booking_match:
                 match += 1
-            elif isinstance(booked, dict):
-                ref = booked['Ref']
-                if any(found['Ref'] == ref for found in query_result):
-                    match += 1
-                else:
-                    mismatch += 1
             else:
-                match += 1
+                mismatch += 1
         return match, mismatch
 
     def final_goal_analyze(self):
@@ -0,0 +1,30 @@
+"""
+Lazy attributes of packages (PEP 562), so that importing a package does not import its heavy submodules.
+"""
+import importlib
+import sys
+
+
+def lazy_module(module_name, imports):
+    """
+    create the module-level `__getattr__` and `__dir__` of a package whose attributes are imported on first access,
+    and add these attributes to the `__all__` of the package.
+        __getattr__, __dir__ = lazy_module(__name__, {'PPO': 'convlab.policy.ppo.ppo'})
+    :param module_name: `__name__` of the package
+    :param imports: dict, attribute name -> module defining it (absolute, or relative to the package)
+    """
+    module_globals = sys.modules[module_name].__dict__
+    module_globals['__all__'] = list(imports) + [name for name in module_globals.get('__all__', [])
+                                                 if name not in imports]
+
+    def __getattr__(name):
+        if name in imports:
+            value = getattr(importlib.import_module(imports[name], module_name), name)
+            module_globals[name] = value
+            return value
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(list(module_globals) + list(imports))
+
+    return __getattr__, __dir__
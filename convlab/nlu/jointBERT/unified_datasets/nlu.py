@@ -4,16 +4,17 @@ import json
 import torch
 from nltk.tokenize import TreebankWordTokenizer, PunktSentenceTokenizer
 import transformers
-from convlab.nlu.nlu import NLU
+from convlab.nlu.nlu import NLU, length_buckets
 from convlab.nlu.jointBERT.dataloader import Dataloader
 from convlab.nlu.jointBERT.jointBERT import JointBERT
 from convlab.nlu.jointBERT.unified_datasets.preprocess import preprocess
 from convlab.nlu.jointBERT.unified_datasets.postprocess import recover_intent
 from convlab.util.custom_util import model_downloader
+from convlab.util.tokenizer_util import UtteranceTokenCache
 
 
 class BERTNLU(NLU):
-    def __init__(self, mode, config_file, model_file=None):
+    def __init__(self, mode, config_file, model_file=None, max_context_tokens=None):
         assert mode == 'user' or mode == 'sys' or mode == 'all'
         self.mode = mode
         config_file = os.path.join(os.path.dirname(
@@ -53,19 +54,49 @@ class BERTNLU(NLU):
         self.model = model
         self.use_context = config['model']['context']
         self.context_window_size = config['context_window_size']
+        # maximum number of context tokens, the oldest tokens are removed from longer contexts
+        self.max_context_tokens = max_context_tokens
         self.dataloader = dataloader
+        self.context_cache = UtteranceTokenCache(dataloader.tokenizer, separator=' [SEP] ')
         self.sent_tokenizer = PunktSentenceTokenizer()
         self.word_tokenizer = TreebankWordTokenizer()
         logging.info("BERTNLU loaded")
 
     def predict(self, utterance, context=list()):
+        return self.predict_batch([utterance], [context])[0]
+
+    def predict_batch(self, utterances, contexts=None, batch_size=32):
+        if contexts is None:
+            contexts = [[] for _ in utterances]
+        batch_data = [self._preprocess(utterance, context) for utterance, context in zip(utterances, contexts)]
+        dialog_acts = [None] * len(batch_data)
+        for bucket in length_buckets([len(x[-3]) + len(x[-5]) for x in batch_data], batch_size):
+            bucket_data = [batch_data[i] for i in bucket]
+            pad_batch = self.dataloader.pad_batch(bucket_data)
+            pad_batch = tuple(t.to(self.model.device) for t in pad_batch)
+            word_seq_tensor, tag_seq_tensor, intent_tensor, word_mask_tensor, tag_mask_tensor, context_seq_tensor, context_mask_tensor = pad_batch
+            with torch.no_grad():
+                slot_logits, intent_logits = self.model.forward(word_seq_tensor, word_mask_tensor,
+                                                                context_seq_tensor=context_seq_tensor,
+                                                                context_mask_tensor=context_mask_tensor)
+            for j, i in enumerate(bucket):
+                das = recover_intent(self.dataloader, intent_logits[j], slot_logits[j], tag_mask_tensor[j],
+                                     batch_data[i][0], batch_data[i][-4])
+                dialog_act = []
+                for da_type in das:
+                    for da in das[da_type]:
+                        dialog_act.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
+                dialog_acts[i] = dialog_act
+        return dialog_acts
+
+    def _preprocess(self, utterance, context):
         sentences = self.sent_tokenizer.tokenize(utterance)
         ori_word_seq = [token for sent in sentences for token in self.word_tokenizer.tokenize(sent)]
         ori_tag_seq = [str(('O',))] * len(ori_word_seq)
         if self.use_context:
             if len(context) > 0 and type(context[0]) is list and len(context[0]) > 1:
                 context = [item[1] for item in context]
-            context_seq = self.dataloader.tokenizer.encode(' [SEP] '.join(context[-self.context_window_size:]))
+            context_seq = self.context_cache.encode_context(context[-self.context_window_size:], self.max_context_tokens)
             context_seq = context_seq[:510]
         else:
             context_seq = self.dataloader.tokenizer.encode('')
@@ -75,22 +106,8 @@ class BERTNLU(NLU):
         word_seq, tag_seq, new2ori = self.dataloader.bert_tokenize(ori_word_seq, ori_tag_seq)
         word_seq = word_seq[:510]
         tag_seq = tag_seq[:510]
-        batch_data = [[ori_word_seq, ori_tag_seq, intents, da, context_seq,
-                       new2ori, word_seq, self.dataloader.seq_tag2id(tag_seq), self.dataloader.seq_intent2id(intents)]]
-
-        pad_batch = self.dataloader.pad_batch(batch_data)
-        pad_batch = tuple(t.to(self.model.device) for t in pad_batch)
-        word_seq_tensor, tag_seq_tensor, intent_tensor, word_mask_tensor, tag_mask_tensor, context_seq_tensor, context_mask_tensor = pad_batch
-        slot_logits, intent_logits = self.model.forward(word_seq_tensor, word_mask_tensor,
-                                                        context_seq_tensor=context_seq_tensor,
-                                                        context_mask_tensor=context_mask_tensor)
-        das = recover_intent(self.dataloader, intent_logits[0], slot_logits[0], tag_mask_tensor[0],
-                             batch_data[0][0], batch_data[0][-4])
-        dialog_act = []
-        for da_type in das:
-            for da in das[da_type]:
-                dialog_act.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
-        return dialog_act
+        return [ori_word_seq, ori_tag_seq, intents, da, context_seq,
+                new2ori, word_seq, self.dataloader.seq_tag2id(tag_seq), self.dataloader.seq_intent2id(intents)]
 
 
 if __name__ == '__main__':
@@ -13,7 +13,7 @@ from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 from allennlp.models.archival import load_archive
 
 from convlab.util.file_util import cached_path, get_root_path
-from convlab.nlu.nlu import NLU
+from convlab.nlu.nlu import NLU, length_buckets
 from convlab.nlu.milu import dataset_reader, model
 import json
 from spacy.symbols import ORTH, LEMMA, POS
@@ -68,23 +68,32 @@ class MILU(NLU):
         Returns:
             output (dict): The dialog act of utterance.
         """
-        if len(utterance) == 0:
-            return []
-
+        return self.predict_batch([utterance], [context])[0]
+
+    def predict_batch(self, utterances, contexts=None, batch_size=32):
+        if contexts is None:
+            contexts = [[] for _ in utterances]
+        dialog_acts = [[] for _ in utterances]
+        indices = [i for i, utterance in enumerate(utterances) if len(utterance) > 0]
+        instances = [self._text_to_instance(utterances[i], contexts[i]) for i in indices]
+        for bucket in length_buckets([instance['tokens'].sequence_length() for instance in instances], batch_size):
+            outputs = self.model.forward_on_instances([instances[j] for j in bucket])
+            for j, output in zip(bucket, outputs):
+                tuples = []
+                for domain_intent, svs in output['dialog_act'].items():
+                    for slot, value in svs:
+                        domain, intent = domain_intent.split('-')
+                        tuples.append([intent, domain, slot, value])
+                dialog_acts[indices[j]] = tuples
+        return dialog_acts
+
+    def _text_to_instance(self, utterance, context):
         if self.context_size > 0 and len(context) > 0:
             context_tokens = sum([self.tokenizer.split_words(utterance+" SENT_END") for utterance in context[-self.context_size:]], [])
         else:
             context_tokens = self.tokenizer.split_words("SENT_END")
         tokens = self.tokenizer.split_words(utterance)
-        instance = self.dataset_reader.text_to_instance(context_tokens, tokens)
-        outputs = self.model.forward_on_instance(instance)
-
-        tuples = []
-        for domain_intent, svs in outputs['dialog_act'].items():
-            for slot, value in svs:
-                domain, intent = domain_intent.split('-')
-                tuples.append([intent, domain, slot, value])
-        return tuples
+        return self.dataset_reader.text_to_instance(context_tokens, tokens)
 
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ from allennlp.data.tokenizers import Token
 
 from convlab.util.file_util import cached_path
 from convlab.nlu.milu import dataset_reader, model
-from convlab.nlu.nlu import NLU
+from convlab.nlu.nlu import NLU, length_buckets
 from nltk.tokenize import TreebankWordTokenizer, PunktSentenceTokenizer
 
 DEFAULT_CUDA_DEVICE = -1
@@ -60,9 +60,25 @@ class MILU(NLU):
         Returns:
             output (dict): The dialog act of utterance.
         """
-        if len(utterance) == 0:
-            return []
-
+        return self.predict_batch([utterance], [context])[0]
+
+    def predict_batch(self, utterances, contexts=None, batch_size=32):
+        if contexts is None:
+            contexts = [[] for _ in utterances]
+        dialog_acts = [[] for _ in utterances]
+        indices = [i for i, utterance in enumerate(utterances) if len(utterance) > 0]
+        instances = [self._text_to_instance(utterances[i], contexts[i]) for i in indices]
+        for bucket in length_buckets([instance['tokens'].sequence_length() for instance in instances], batch_size):
+            outputs = self.model.forward_on_instances([instances[j] for j in bucket])
+            for j, output in zip(bucket, outputs):
+                tuples = []
+                for da_type in output['dialog_act']:
+                    for da in output['dialog_act'][da_type]:
+                        tuples.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
+                dialog_acts[indices[j]] = tuples
+        return dialog_acts
+
+    def _text_to_instance(self, utterance, context):
         if self.context_size > 0 and len(context) > 0:
             context_tokens = []
             for utt in context[-self.context_size:]:
@@ -74,14 +90,7 @@ class MILU(NLU):
             context_tokens = [Token("SENT_END")]
         sentences = self.sent_tokenizer.tokenize(utterance)
         tokens = [Token(token) for sent in sentences for token in self.word_tokenizer.tokenize(sent)]
-        instance = self.dataset_reader.text_to_instance(context_tokens, tokens)
-        outputs = self.model.forward_on_instance(instance)
-
-        tuples = []
-        for da_type in outputs['dialog_act']:
-            for da in outputs['dialog_act'][da_type]:
-                tuples.append([da['intent'], da['domain'], da['slot'], da.get('value','')])
-        return tuples
+        return self.dataset_reader.text_to_instance(context_tokens, tokens)
 
 
 if __name__ == "__main__":
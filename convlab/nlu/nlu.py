@@ -19,3 +19,29 @@ class NLU(Module):
                 The dialog act of utterance.
         """
         return []
+
+    def predict_batch(self, utterances, contexts=None):
+        """Predict the dialog acts of a batch of natural language utterances.
+
+        Modules that can run a batched forward pass override this method, the default calls predict on every
+        utterance.
+
+        Args:
+            utterances (list of str):
+                Natural language utterances.
+            contexts (list of list of str):
+                Previous utterances of every utterance. Empty contexts by default.
+
+        Returns:
+            actions (list of list of list):
+                The dialog act of every utterance.
+        """
+        if contexts is None:
+            contexts = [[] for _ in utterances]
+        return [self.predict(utterance, context=context) for utterance, context in zip(utterances, contexts)]
+
+
+def length_buckets(lengths, batch_size):
+    """Split the indices of the inputs with the given lengths into batches of similar lengths, to limit padding."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
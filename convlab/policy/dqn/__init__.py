@@ -1 +1,5 @@
-from convlab.policy.dqn.dqn import DQN
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'DQN': 'convlab.policy.dqn.dqn',
+})
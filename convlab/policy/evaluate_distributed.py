@@ -1,141 +1,248 @@
 # -*- coding: utf-8 -*-
 
+import atexit
+import logging
 import random
+import time
 import torch
 import numpy as np
 
 from convlab.policy.rlmodule import Memory_evaluator
+from convlab.policy.rollout_pool import get_result, worker_error
 from torch import multiprocessing as mp
 
+# worker pools of the sessions evaluated so far, kept alive between evaluations
+_POOLS = {}
 
-def sampler(pid, queue, evt, sess, seed_range, goals):
+
+def evaluate_dialogue(sess, seed, goal):
     """
-    This is a sampler function, and it will be called by multiprocess.Process to sample data from environment by multiple
-    processes.
-    :param pid: process id
-    :param queue: multiprocessing.Queue, to collect sampled data
-    :param evt: multiprocessing.Event, to keep the process alive
-    :param env: environment instance
-    :param policy: policy network, to generate action from current policy
-    :param batchsz: total sampled items
-    :return:
+    simulate one dialogue with the goal, after seeding all random generators with seed
+    :return: the metrics of the dialogue, in the order of the Transition_evaluator fields
     """
-    buff = Memory_evaluator()
-
-    for seed in seed_range:
-        torch.manual_seed(seed)
-        torch.cuda.manual_seed(seed)
-        random.seed(seed)
-        np.random.seed(seed)
-        goal = goals.pop()
-        sess.init_session(goal=goal)
-        sys_response = '' if sess.sys_agent.nlg is not None else []
-        sys_response = [] if sess.sys_agent.return_semantic_acts else sys_response
-        total_return_success = 0.0
-        total_return_complete = 0.0
-        turns = 0
-        complete = 0
-        success = 0
-        success_strict = 0
-        avg_actions = 0
-        book = 0
-        inform = 0
-        request = 0
-        select = 0
-        offer = 0
-        recommend = 0
-        task_success = {}
-
-        for i in range(40):
-            # TODO: I think the reward here is also from user simulator and not evaluator, check for task-success if yes
-            sys_response, user_response, session_over, reward = sess.next_turn(
-                sys_response)
-
-            turns += 1
-            total_return_success += sess.evaluator.get_reward(terminated=session_over)
-            total_return_complete += sess.user_agent.policy.policy.get_reward()
-            acts = sess.sys_agent.dst.state['system_action']
-            avg_actions += len(acts)
-
-            for intent, domain, _, _ in acts:
-                if intent.lower() == 'book':
-                    book += 1
-                if intent.lower() == 'inform':
-                    inform += 1
-                if intent.lower() == 'request':
-                    request += 1
-                if intent.lower() == 'select':
-                    select += 1
-                if intent.lower() == 'offerbook':
-                    offer += 1
-                if intent.lower() == 'recommend':
-                    recommend += 1
-
-            if session_over is True:
-                success = sess.evaluator.task_success()
-                complete = sess.evaluator.complete
-                success = sess.evaluator.success
-                success_strict = sess.evaluator.success_strict
-                break
-
-        for key in sess.evaluator.goal:
-            if key not in task_success:
-                task_success[key] = []
-            task_success[key].append(success_strict)
-
-        buff.push(complete, success, success_strict, total_return_complete, total_return_success, turns, avg_actions / turns,
-                  task_success, book, inform, request, select, offer, recommend)
-
-    # this is end of sampling all batchsz of items.
-    # when sampling is over, push all buff data into queue
-    queue.put([pid, buff])
-    evt.wait()
-
-
-def sample(sess, seedrange, process_num, goals):
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    sess.init_session(goal=goal)
+    sys_response = '' if sess.sys_agent.nlg is not None else []
+    sys_response = [] if sess.sys_agent.return_semantic_acts else sys_response
+    total_return_success = 0.0
+    total_return_complete = 0.0
+    turns = 0
+    complete = 0
+    success = 0
+    success_strict = 0
+    avg_actions = 0
+    book = 0
+    inform = 0
+    request = 0
+    select = 0
+    offer = 0
+    recommend = 0
+    task_success = {}
+
+    for i in range(40):
+        # TODO: I think the reward here is also from user simulator and not evaluator, check for task-success if yes
+        sys_response, user_response, session_over, reward = sess.next_turn(
+            sys_response)
+
+        turns += 1
+        total_return_success += sess.evaluator.get_reward(terminated=session_over)
+        total_return_complete += sess.user_agent.policy.policy.get_reward()
+        acts = sess.sys_agent.dst.state['system_action']
+        avg_actions += len(acts)
+
+        for intent, domain, _, _ in acts:
+            if intent.lower() == 'book':
+                book += 1
+            if intent.lower() == 'inform':
+                inform += 1
+            if intent.lower() == 'request':
+                request += 1
+            if intent.lower() == 'select':
+                select += 1
+            if intent.lower() == 'offerbook':
+                offer += 1
+            if intent.lower() == 'recommend':
+                recommend += 1
+
+        if session_over is True:
+            success = sess.evaluator.task_success()
+            complete = sess.evaluator.complete
+            success = sess.evaluator.success
+            success_strict = sess.evaluator.success_strict
+            break
+
+    for key in sess.evaluator.goal:
+        if key not in task_success:
+            task_success[key] = []
+        task_success[key].append(success_strict)
+
+    return (complete, success, success_strict, total_return_complete, total_return_success, turns, avg_actions / turns,
+            task_success, book, inform, request, select, offer, recommend)
+
+
+def evaluation_worker(sess, weight_queue, job_queue, result_queue):
     """
-    Given batchsz number of task, the batchsz will be splited equally to each processes
-    and when processes return, it merge all data and return
-        :param env:
-        :param policy:
-    :param batchsz:
-        :param process_num:
-    :return: batch
+    Main loop of a worker of the EvaluationWorkerPool.
+    :param weight_queue: receives (version, state_dict or None) of the system policy network for every evaluation
+    :param job_queue: shared by all workers, receives (version, [(index, seed, goal), ...]) chunks of dialogues, or
+        None to stop the worker
+    :param result_queue: receives (index, metrics or exception, seconds) for every dialogue as soon as it is done
     """
+    version = 0
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_version, chunk = job
+        # the weights of an evaluation are sent before its dialogues
+        while version < job_version:
+            version, state_dict = weight_queue.get()
+            if state_dict is not None:
+                sess.sys_agent.policy.policy.load_state_dict(state_dict)
+        for index, seed, goal in chunk:
+            start = time.time()
+            try:
+                metrics = evaluate_dialogue(sess, seed, goal)
+            except Exception:
+                metrics = worker_error(f'evaluation of seed {seed}')
+            result_queue.put((index, metrics, time.time() - start))
+
+
+def latency_stats(seconds):
+    """statistics of the wall time of the dialogues, in seconds"""
+    seconds = np.asarray(seconds)
+    if len(seconds) == 0:
+        return {}
+    return {'mean': float(np.mean(seconds)), 'p50': float(np.percentile(seconds, 50)),
+            'p90': float(np.percentile(seconds, 90)), 'p99': float(np.percentile(seconds, 99)),
+            'max': float(np.max(seconds))}
+
+
+class EvaluationWorkerPool(object):
+    """
+    Persistent evaluation processes pulling dialogues from a shared queue.
 
-    num_seeds = len(seedrange)
-    num_seeds_per_thread = np.ceil(num_seeds / process_num).astype(np.int32)
-    # buffer to save all data
-    queue = mp.Queue()
-
-    evt = mp.Event()
-    processes = []
-    for i in range(process_num):
-        process_args = (
-            i, queue, evt, sess, seedrange[i * num_seeds_per_thread: (i+1) * num_seeds_per_thread],
-            goals[i * num_seeds_per_thread: (i+1) * num_seeds_per_thread])
-        processes.append(mp.Process(target=sampler, args=process_args))
-    for p in processes:
-        # set the process as daemon, and it will be killed once the main process is stoped.
-        p.daemon = True
-        p.start()
-
-    # we need to get the first Memory object and then merge others Memory use its append function.
-    pid0, buff0 = queue.get()
-    for _ in range(1, process_num):
-        pid, buff_ = queue.get()
-        buff0.append(buff_)  # merge current Memory into buff0
-    evt.set()
-
-    # now buff saves all the sampled data
-    buff = buff0
+    The session is copied into the workers once, when the pool is created. The dialogues of an evaluation are
+    queued in small chunks, which the workers take whenever they are idle, so that long dialogues do not hold up
+    the other workers. Every dialogue is seeded with its own seed, so that its metrics do not depend on the number of
+    workers.
+    """
 
-    return buff.get_batch()
+    def __init__(self, sess, process_num, chunk_size=2):
+        """
+        :param sess: session to evaluate, the weights of its system policy network are sent to the workers before
+            every evaluation
+        :param process_num: number of worker processes
+        :param chunk_size: number of dialogues a worker takes from the queue at once
+        """
+        self.sess = sess
+        self.process_num = process_num
+        self.chunk_size = chunk_size
+        self.version = 0
+        self.latencies = []
+        self.weight_queues = [mp.Queue() for _ in range(process_num)]
+        self.job_queue = mp.Queue()
+        self.result_queue = mp.Queue()
+        self.processes = []
+        for pid in range(process_num):
+            process_args = (sess, self.weight_queues[pid], self.job_queue, self.result_queue)
+            process = mp.Process(target=evaluation_worker, args=process_args)
+            # set the process as daemon, and it will be killed once the main process is stoped.
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def _send_weights(self):
+        self.version += 1
+        network = getattr(self.sess.sys_agent.policy, 'policy', None)
+        state_dict = None
+        if hasattr(network, 'state_dict'):
+            state_dict = {key: value.detach().cpu() for key, value in network.state_dict().items()}
+        for weight_queue in self.weight_queues:
+            weight_queue.put((self.version, state_dict))
+
+    def evaluate(self, seeds, goals):
+        """
+        evaluate one dialogue per (seed, goal) pair
+        :return: Memory_evaluator with the metrics of the dialogues, in the order of the seeds. The wall time of every
+            dialogue is kept in self.latencies.
+        :raise RuntimeError: if a dialogue failed, or a worker died (the pool is terminated then)
+        """
+        self._send_weights()
+        jobs = [(index, seed, goal) for index, (seed, goal) in enumerate(zip(seeds, goals))]
+        for i in range(0, len(jobs), self.chunk_size):
+            self.job_queue.put((self.version, jobs[i:i + self.chunk_size]))
+
+        results = [None] * len(jobs)
+        self.latencies = [0.] * len(jobs)
+        error = None
+        for _ in range(len(jobs)):
+            try:
+                index, metrics, seconds = get_result(self.result_queue, self.processes)
+            except RuntimeError:
+                # the pool can not be used anymore, the dialogues of the dead worker are lost
+                self.terminate()
+                raise
+            if isinstance(metrics, Exception):
+                error = metrics
+            results[index] = metrics
+            self.latencies[index] = seconds
+        if error is not None:
+            raise error
+
+        buff = Memory_evaluator()
+        for metrics in results:
+            buff.push(*metrics)
+        return buff
+
+    def close(self):
+        for _ in self.processes:
+            self.job_queue.put(None)
+        for process in self.processes:
+            process.join()
+
+    def terminate(self):
+        """kill the workers, e.g. after one of them died"""
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+    @property
+    def alive(self):
+        return all(process.is_alive() for process in self.processes)
+
+
+@atexit.register
+def close_pools():
+    """stop the workers of the pools kept by evaluate_distributed"""
+    while _POOLS:
+        _, pool = _POOLS.popitem()
+        if pool.alive:
+            pool.close()
+        else:
+            pool.terminate()
 
 
 def evaluate_distributed(sess, seed_range, process_num, goals):
-
-    batch = sample(sess, seed_range, process_num, goals)
+    """
+    evaluate sess on one dialogue per seed with process_num workers. The workers of a session are kept alive for its
+    later evaluations, until close_pools is called (at the latest when the program exits). As in the single-process
+    evaluation, goals are taken from the end of the list, i.e. seed_range[i] is evaluated on goals[-1 - i].
+    """
+    key = (id(sess), process_num)
+    if key not in _POOLS or _POOLS[key].sess is not sess or not _POOLS[key].alive:
+        if key in _POOLS:
+            _POOLS.pop(key).terminate()
+        _POOLS[key] = EvaluationWorkerPool(sess, process_num)
+    pool = _POOLS[key]
+    seeds = list(seed_range)
+    buff = pool.evaluate(seeds, [goals[-1 - i] for i in range(len(seeds))])
+    logging.info(f"Dialogue wall time (s): {latency_stats(pool.latencies)}")
+
+    batch = buff.get_batch()
     return batch.complete, batch.success, batch.success_strict, batch.total_return_success, batch.turns, \
            batch.avg_actions, batch.task_success, np.average(batch.book_actions), np.average(batch.inform_actions), \
            np.average(batch.request_actions), np.average(batch.select_actions), np.average(batch.offer_actions), \
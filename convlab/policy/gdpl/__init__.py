@@ -1,2 +1,6 @@
-from convlab.policy.gdpl.gdpl import GDPL
-from convlab.policy.gdpl.estimator import RewardEstimator
\ No newline at end of file
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'GDPL': 'convlab.policy.gdpl.gdpl',
+    'RewardEstimator': 'convlab.policy.gdpl.estimator',
+})
@@ -247,19 +247,13 @@ class ActEstimatorDataLoaderMultiWoz(PolicyDataVectorizer):
         
     def create_dataset_irl(self, part, batchsz):
         print('Start creating {} irl dataset'.format(part))
-        s = []
-        a = []
-        next_s = []
-        for i, item in enumerate(self.data[part]):
-            s.append(torch.Tensor(item['state']))
-            a.append(torch.Tensor(item['action']))
-            if item['terminated']: #terminated
-                next_s.append(torch.Tensor(item['state']))
-            else:
-                next_s.append(torch.Tensor(self.data[part][i+1]['state']))
-        s = torch.stack(s)
-        a = torch.stack(a)
-        next_s = torch.stack(next_s)
+        s = torch.from_numpy(self.get_matrix(part, 'state'))
+        a = torch.from_numpy(self.get_matrix(part, 'action'))
+        # the next state of a terminated turn is the turn itself
+        next_idx = np.arange(len(s)) + 1
+        terminated = self.data[part]['terminated']
+        next_idx[terminated] -= 1
+        next_s = s[torch.from_numpy(next_idx)]
         dataset = ActStateDataset(s, a, next_s)
         dataloader = data.DataLoader(dataset, batchsz, True)
         print('Finish creating {} irl dataset'.format(part))
@@ -6,8 +6,7 @@ import logging
 import os
 import json
 
-from convlab.policy.policy import Policy
-from convlab.policy.rlmodule import MultiDiscretePolicy, Value
+from convlab.policy.rlmodule import MultiDiscretePolicy, Value, estimate_advantage, VectorPolicy
 from convlab.util.custom_util import set_seed
 from convlab.util.train_util import init_logging_handler
 from convlab.util.file_util import cached_path
@@ -20,7 +19,7 @@ sys.path.append(root_dir)
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-class GDPL(Policy):
+class GDPL(VectorPolicy):
 
     def __init__(self, is_train=False, dataset='Multiwoz', seed=0, vectorizer=None):
 
@@ -52,35 +51,6 @@ class GDPL(Policy):
             self.policy_optim = optim.RMSprop(self.policy.parameters(), lr=cfg['policy_lr'])
             self.value_optim = optim.Adam(self.value.parameters(), lr=cfg['value_lr'])
 
-    def predict(self, state):
-        """
-        Predict an system action given state.
-        Args:
-            state (dict): Dialog state. Please refer to util/state.py
-        Returns:
-            action : System act, with the form of (act_type, {slot_name_1: value_1, slot_name_2, value_2, ...})
-        """
-        s, action_mask = self.vector.state_vectorize(state)
-        s_vec = torch.Tensor(s)
-        mask_vec = torch.Tensor(action_mask)
-        a = self.policy.select_action(
-            s_vec.to(device=DEVICE), False, action_mask=mask_vec.to(device=DEVICE)).cpu()
-
-        a_counter = 0
-        while a.sum() == 0:
-            a_counter += 1
-            a = self.policy.select_action(
-                s_vec.to(device=DEVICE), True, action_mask=mask_vec.to(device=DEVICE)).cpu()
-            if a_counter == 5:
-                break
-        # print('True :')
-        # print(a)
-        action = self.vector.action_devectorize(a.detach().numpy())
-        self.info_dict["action_used"] = action
-        # for key in state.keys():
-        #     print("Key : {} , Value : {}".format(key,state[key]))
-        return action
-
     def init_session(self):
         """
         Restore after one session
@@ -95,36 +65,7 @@ class GDPL(Policy):
         :param mask: indicates ending for 0 otherwise 1, Tensor, [b]
         :return: A(s, a), V-target(s), both Tensor
         """
-        batchsz = v.size(0)
-
-        # v_target is worked out by Bellman equation.
-        v_target = torch.Tensor(batchsz).to(device=DEVICE)
-        delta = torch.Tensor(batchsz).to(device=DEVICE)
-        A_sa = torch.Tensor(batchsz).to(device=DEVICE)
-
-        prev_v_target = 0
-        prev_v = 0
-        prev_A_sa = 0
-        for t in reversed(range(batchsz)):
-            # mask here indicates a end of trajectory
-            # this value will be treated as the target value of value network.
-            # mask = 0 means the immediate reward is the real V(s) since it's end of trajectory.
-            # formula: V(s_t) = r_t + gamma * V(s_t+1)
-            v_target[t] = r[t] + self.gamma * prev_v_target * mask[t]
-
-            # please refer to : https://arxiv.org/abs/1506.02438
-            # for generalized adavantage estimation
-            # formula: delta(s_t) = r_t + gamma * V(s_t+1) - V(s_t)
-            delta[t] = r[t] + self.gamma * prev_v * mask[t] - v[t]
-
-            # formula: A(s, a) = delta(s_t) + gamma * lamda * A(s_t+1, a_t+1)
-            # here use symbol tau as lambda, but original paper uses symbol lambda.
-            A_sa[t] = delta[t] + self.gamma * self.tau * prev_A_sa * mask[t]
-
-            # update previous
-            prev_v_target = v_target[t]
-            prev_v = v[t]
-            prev_A_sa = A_sa[t]
+        A_sa, v_target = estimate_advantage(r, v, mask, self.gamma, self.tau)
 
         # normalize A_sa
         A_sa = (A_sa - A_sa.mean()) / A_sa.std()
@@ -23,6 +23,8 @@ class stepGenTUSmodel(BartForConditionalGeneration):
         self.token_map = tokenMap(self.tokenizer)
         # only_action doesn't matter. it is only used for get_log_prob
         self.token_map.default(only_action=True)
+        # encoder output and decoder key/values of the sequence being generated, see get_next_token_logits
+        self._decoding_cache = None
 
         if not train_whole_model:
             for param in self.parameters():
@@ -39,14 +41,49 @@ class stepGenTUSmodel(BartForConditionalGeneration):
             lambda p: p.requires_grad, self.parameters())
 
     def get_next_token_logits(self, model_input, generated_so_far):
+        """
+        logits of the token following generated_so_far. In eval mode, the encoder output of model_input and the
+        decoder key/values of the previous call are reused when generated_so_far extends the previously decoded
+        prefix, so only the new tokens are run through the decoder.
+        """
         input_ids = model_input["input_ids"].to(self.device)
         attention_mask = model_input["attention_mask"].to(self.device)
+        if self.training:
+            outputs = self.forward(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                decoder_input_ids=generated_so_far,
+                return_dict=True)
+            return outputs.logits[:, -1, :]
+
+        cache = self._decoding_cache
+        if cache is None or cache["model_input"] is not model_input["input_ids"]:
+            encoder_outputs = self.get_encoder()(
+                input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+            cache = {"model_input": model_input["input_ids"], "encoder_outputs": encoder_outputs,
+                     "past_key_values": None, "tokens": generated_so_far[:, :0]}
+            self._decoding_cache = cache
+
+        past_len = cache["tokens"].shape[1]
+        if past_len == generated_so_far.shape[1] and torch.equal(generated_so_far, cache["tokens"]):
+            # return a copy, so that callers can modify the logits without corrupting the cache
+            return cache["logits"].clone()
+        if past_len >= generated_so_far.shape[1] or \
+                not torch.equal(generated_so_far[:, :past_len], cache["tokens"]):
+            # not a continuation of the cached prefix, decode generated_so_far from scratch
+            cache["past_key_values"] = None
+            past_len = 0
         outputs = self.forward(
-            input_ids=input_ids,
+            encoder_outputs=cache["encoder_outputs"],
             attention_mask=attention_mask,
-            decoder_input_ids=generated_so_far,
+            decoder_input_ids=generated_so_far[:, past_len:],
+            past_key_values=cache["past_key_values"],
+            use_cache=True,
             return_dict=True)
-        return outputs.logits[:, -1, :]
+        cache["past_key_values"] = outputs.past_key_values
+        cache["tokens"] = generated_so_far.clone()
+        cache["logits"] = outputs.logits[:, -1, :]
+        return cache["logits"].clone()
 
     def get_log_prob(self, s, a, action_mask, prob_mask):
         output = self.forward(input_ids=s,
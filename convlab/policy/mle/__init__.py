@@ -1 +1,5 @@
-from .mle import MLE
\ No newline at end of file
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'MLE': '.mle',
+})
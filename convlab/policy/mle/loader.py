@@ -1,5 +1,7 @@
+import hashlib
+import json
 import os
-import pickle
+import numpy as np
 import torch
 import torch.utils.data as data
 from copy import deepcopy
@@ -7,12 +9,34 @@ from copy import deepcopy
 from tqdm import tqdm
 
 from convlab.policy.vector.vector_binary import VectorBinary
-from convlab.util import load_policy_data, load_dataset
+from convlab.util import load_policy_data, load_dataset, get_dataset_hash
 from convlab.util.custom_util import flatten_acts
 from convlab.util.multiwoz.state import default_state
 from convlab.policy.vector.dataset import ActDataset
 
 
+def pack_matrix(matrix):
+    """
+    store a matrix as compactly as possible. If all its non-zero entries share one value (binary states and actions,
+    masks filled with -sys.maxsize), only the bits of the non-zero entries are kept, packed 8 per byte.
+    Other matrices are stored as float32.
+    """
+    matrix = np.asarray(matrix)
+    nonzero = matrix[matrix != 0]
+    if nonzero.size == 0 or np.all(nonzero == nonzero[0]):
+        value = float(nonzero[0]) if nonzero.size else 1.
+        return np.packbits(matrix != 0, axis=1), {'packed': True, 'dim': matrix.shape[1], 'value': value}
+    return matrix.astype(np.float32), {'packed': False, 'dim': matrix.shape[1], 'value': None}
+
+
+def unpack_matrix(array, meta):
+    """inverse of pack_matrix, returns a float32 matrix."""
+    if meta['packed']:
+        bits = np.unpackbits(array, axis=1, count=meta['dim']).astype(bool)
+        return np.where(bits, np.float32(meta['value']), np.float32(0))
+    return np.array(array, dtype=np.float32)
+
+
 class PolicyDataVectorizer:
     
     def __init__(self, dataset_name='multiwoz21', vector=None, dst=None):
@@ -27,15 +51,31 @@ class PolicyDataVectorizer:
     def process_data(self):
         name = f"{self.dataset_name}_"
         name += f"{type(self.dst).__name__}_" if self.dst is not None else ""
-        name += f"{type(self.vector).__name__}"
+        name += f"{type(self.vector).__name__}_{self.cache_key()[:16]}"
         processed_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
-        if os.path.exists(processed_dir):
+        if os.path.exists(os.path.join(processed_dir, 'meta.json')):
             print('Load processed data file')
             self._load_data(processed_dir)
         else:
             print('Start preprocessing the dataset, this can take a while..')
             self._build_data(processed_dir)
-        
+
+    def cache_key(self):
+        """
+        hash of everything the vectorised data depends on: the dataset version, the dst, the vectoriser class,
+        its action vocabularies, its state dimension and whether it uses masking
+        """
+        key = {
+            'dataset': get_dataset_hash(self.dataset_name),
+            'dst': type(self.dst).__name__ if self.dst is not None else None,
+            'vector': type(self.vector).__name__,
+            'da_voc': getattr(self.vector, 'da_voc', None),
+            'da_voc_opp': getattr(self.vector, 'da_voc_opp', None),
+            'state_dim': getattr(self.vector, 'state_dim', None),
+            'use_mask': getattr(self.vector, 'use_mask', None)
+        }
+        return hashlib.sha256(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+
     def _build_data(self, processed_dir):
         self.data = {}
 
@@ -43,8 +83,9 @@ class PolicyDataVectorizer:
         dataset = load_dataset(self.dataset_name)
         data_split = load_policy_data(dataset, context_window_size=2)
 
+        meta = {'cache_key': self.cache_key(), 'splits': {}}
         for split in data_split:
-            self.data[split] = []
+            states, actions, masks, terminated = [], [], [], []
             raw_data = data_split[split]
 
             if self.dst is not None:
@@ -111,31 +152,44 @@ class PolicyDataVectorizer:
 
                 vectorized_state, mask = self.vector.state_vectorize(state)
                 vectorized_action = self.vector.action_vectorize(dialogue_act)
-                self.data[split].append({"state": vectorized_state, "action": vectorized_action, "mask": mask,
-                                         "terminated": state['terminated']})
-
-            with open(os.path.join(processed_dir, '{}.pkl'.format(split)), 'wb') as f:
-                pickle.dump(self.data[split], f)
-
+                states.append(vectorized_state)
+                actions.append(vectorized_action)
+                masks.append(mask)
+                terminated.append(state['terminated'])
+
+            meta['splits'][split] = {}
+            for field, matrix in [('state', states), ('action', actions), ('mask', masks)]:
+                array, meta['splits'][split][field] = pack_matrix(np.stack(matrix))
+                np.save(os.path.join(processed_dir, f'{split}_{field}.npy'), array)
+            np.save(os.path.join(processed_dir, f'{split}_terminated.npy'), np.array(terminated, dtype=bool))
+
+        # meta.json is written last and marks the cache as complete
+        with open(os.path.join(processed_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        self._load_data(processed_dir)
         print("Data processing done.")
 
     def _load_data(self, processed_dir):
+        """
+        memory-map the cached splits. self.data[split] maps 'state', 'action' and 'mask' to (array, meta) pairs
+        that get_matrix unpacks, and 'terminated' to a boolean array.
+        """
+        with open(os.path.join(processed_dir, 'meta.json')) as f:
+            meta = json.load(f)
         self.data = {}
-        for part in ['train', 'validation', 'test']:
-            with open(os.path.join(processed_dir, '{}.pkl'.format(part)), 'rb') as f:
-                self.data[part] = pickle.load(f)
-                
+        for part, fields in meta['splits'].items():
+            self.data[part] = {field: (np.load(os.path.join(processed_dir, f'{part}_{field}.npy'), mmap_mode='r'),
+                                       field_meta) for field, field_meta in fields.items()}
+            self.data[part]['terminated'] = np.load(os.path.join(processed_dir, f'{part}_terminated.npy'))
+
+    def get_matrix(self, part, field):
+        """return the float32 matrix of 'state', 'action' or 'mask' vectors of a data split, one row per turn."""
+        return unpack_matrix(*self.data[part][field])
+
     def create_dataset(self, part, batchsz):
-        states = []
-        actions = []
-        masks = []
-        for item in self.data[part]:
-            states.append(torch.Tensor(item['state']))
-            actions.append(torch.Tensor(item['action']))
-            masks.append(torch.Tensor(item['mask']))
-        s = torch.stack(states)
-        a = torch.stack(actions)
-        m = torch.stack(masks)
+        s = torch.from_numpy(self.get_matrix(part, 'state'))
+        a = torch.from_numpy(self.get_matrix(part, 'action'))
+        m = torch.from_numpy(self.get_matrix(part, 'mask'))
         dataset = ActDataset(s, a, m)
         dataloader = data.DataLoader(dataset, batchsz, True)
         return dataloader
@@ -5,8 +5,7 @@ import numpy as np
 import logging
 import os
 import json
-from convlab.policy.policy import Policy
-from convlab.policy.rlmodule import MultiDiscretePolicy
+from convlab.policy.rlmodule import MultiDiscretePolicy, discounted_cumsum, VectorPolicy
 from convlab.util.custom_util import set_seed
 from convlab.util.train_util import init_logging_handler
 from convlab.policy.vector.vector_binary import VectorBinary
@@ -21,7 +20,7 @@ sys.path.append(root_dir)
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-class PG(Policy):
+class PG(VectorPolicy):
 
     def __init__(self, is_train=False, seed=0, vectorizer=None, load_path="", **kwargs):
         with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'), 'r') as f:
@@ -63,35 +62,6 @@ class PG(Policy):
         if is_train:
             self.policy_optim = optim.RMSprop(self.policy.parameters(), lr=cfg['lr'])
 
-    def predict(self, state):
-        """
-        Predict an system action given state.
-        Args:
-            state (dict): Dialog state. Please refer to util/state.py
-        Returns:
-            action : System act, with the form of (act_type, {slot_name_1: value_1, slot_name_2, value_2, ...})
-        """
-        s, action_mask = self.vector.state_vectorize(state)
-        s_vec = torch.Tensor(s)
-        mask_vec = torch.Tensor(action_mask)
-        a = self.policy.select_action(
-            s_vec.to(device=DEVICE), False, action_mask=mask_vec.to(device=DEVICE)).cpu()
-
-        a_counter = 0
-        while a.sum() == 0:
-            a_counter += 1
-            a = self.policy.select_action(
-                s_vec.to(device=DEVICE), True, action_mask=mask_vec.to(device=DEVICE)).cpu()
-            if a_counter == 5:
-                break
-        # print('True :')
-        # print(a)
-        action = self.vector.action_devectorize(a.detach().numpy())
-        self.info_dict["action_used"] = action
-        # for key in state.keys():
-        #     print("Key : {} , Value : {}".format(key,state[key]))
-        return action
-
     def init_session(self):
         """
         Restore after one session
@@ -105,21 +75,8 @@ class PG(Policy):
         :param mask: indicates ending for 0 otherwise 1, Tensor, [b]
         :return: V-target(s), Tensor
         """
-        batchsz = r.size(0)
-
-        # v_target is worked out by Bellman equation.
-        v_target = torch.Tensor(batchsz).to(device=DEVICE)
-
-        prev_v_target = 0
-        for t in reversed(range(batchsz)):
-            # mask here indicates a end of trajectory
-            # this value will be treated as the target value of value network.
-            # mask = 0 means the immediate reward is the real V(s) since it's end of trajectory.
-            # formula: V(s_t) = r_t + gamma * V(s_t+1)
-            v_target[t] = r[t] + self.gamma * prev_v_target * mask[t]
-
-            # update previous
-            prev_v_target = v_target[t]
+        # formula: V(s_t) = r_t + gamma * V(s_t+1)
+        v_target = discounted_cumsum(r.double(), mask, self.gamma).float()
 
         return v_target
 
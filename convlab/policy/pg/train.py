@@ -63,14 +63,11 @@ def sampler(pid, queue, evt, env, policy, batchsz, train_seed=0):
     while sampled_num < batchsz:
         # for each trajectory, we reset the env and get initial state
         s = env.reset()
+        s_vec, action_mask = policy.vector.state_vectorize(s)
         for t in range(traj_len):
 
             # [s_dim] => [a_dim]
-            s_vec, action_mask = policy.vector.state_vectorize(s)
-            s_vec = torch.Tensor(s_vec)
-            action_mask = torch.Tensor(action_mask)
-
-            a = policy.predict(s)
+            a = policy.predict_from_vector(s_vec, action_mask)
             # print("---> sample action")
             # print(f"s     : {s['system_action']}")
             # print(f"a     : {a}")
@@ -84,14 +81,14 @@ def sampler(pid, queue, evt, env, policy, batchsz, train_seed=0):
             # get reward compared to demostrations
             next_s_vec, next_action_mask = policy.vector.state_vectorize(
                 next_s)
-            next_s_vec = torch.Tensor(next_s_vec)
 
             # save to queue
-            buff.push(s_vec.numpy(), policy.vector.action_vectorize(
-                a), r, next_s_vec.numpy(), mask, action_mask.numpy())
+            buff.push(np.float32(s_vec), policy.vector.action_vectorize(
+                a), r, np.float32(next_s_vec), mask, np.float32(action_mask))
 
             # update per step
             s = next_s
+            s_vec, action_mask = next_s_vec, next_action_mask
             real_traj_len = t
 
             if done:
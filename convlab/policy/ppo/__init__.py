@@ -1 +1,5 @@
-from convlab.policy.ppo.ppo import PPO
\ No newline at end of file
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'PPO': 'convlab.policy.ppo.ppo',
+})
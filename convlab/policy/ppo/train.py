@@ -18,6 +18,7 @@ from torch import multiprocessing as mp
 
 from convlab.policy.ppo import PPO
 from convlab.policy.rlmodule import Memory
+from convlab.policy.rollout_pool import RolloutWorkerPool
 from convlab.util.custom_util import (env_config, eval_policy, get_config,
                                       init_logging, load_config_file,
                                       log_start_args, move_finished_training,
@@ -37,17 +38,13 @@ except RuntimeError:
     pass
 
 
-def sampler(pid, queue, evt, env, policy, num_dialogues, train_seed=0, user_reward=False):
+def sample_dialogues(env, policy, num_dialogues, train_seed=0, user_reward=False):
     """
-    This is a sampler function, and it will be called by multiprocess.Process to sample data from environment by multiple
-    processes.
-    :param pid: process id
-    :param queue: multiprocessing.Queue, to collect sampled data
-    :param evt: multiprocessing.Event, to keep the process alive
+    Sample num_dialogues dialogues from the environment with the current policy.
     :param env: environment instance
     :param policy: policy network, to generate action from current policy
-    :param batchsz: total sampled items
-    :return:
+    :param num_dialogues: number of sampled dialogues
+    :return: Memory with the sampled transitions
     """
     buff = Memory()
     # we need to sample batchsz of (state, action, next_state, reward, mask)
@@ -65,14 +62,11 @@ def sampler(pid, queue, evt, env, policy, num_dialogues, train_seed=0, user_rewa
     while sampled_traj_num < num_dialogues:
         # for each trajectory, we reset the env and get initial state
         s = env.reset()
+        s_vec, action_mask = policy.vector.state_vectorize(s)
         for t in range(traj_len):
 
             # [s_dim] => [a_dim]
-            s_vec, action_mask = policy.vector.state_vectorize(s)
-            s_vec = torch.Tensor(s_vec)
-            action_mask = torch.Tensor(action_mask)
-
-            a = policy.predict(s)
+            a = policy.predict_from_vector(s_vec, action_mask)
             # print("---> sample action")
             # print(f"s     : {s['system_action']}")
             # print(f"a     : {a}")
@@ -86,14 +80,14 @@ def sampler(pid, queue, evt, env, policy, num_dialogues, train_seed=0, user_rewa
             # get reward compared to demostrations
             next_s_vec, next_action_mask = policy.vector.state_vectorize(
                 next_s)
-            next_s_vec = torch.Tensor(next_s_vec)
 
             # save to queue
-            buff.push(s_vec.numpy(), policy.vector.action_vectorize(
-                a), r, next_s_vec.numpy(), mask, action_mask.numpy())
+            buff.push(np.float32(s_vec), policy.vector.action_vectorize(
+                a), r, np.float32(next_s_vec), mask, np.float32(action_mask))
 
             # update per step
             s = next_s
+            s_vec, action_mask = next_s_vec, next_action_mask
             real_traj_len = t
 
             if done:
@@ -104,13 +98,40 @@ def sampler(pid, queue, evt, env, policy, num_dialogues, train_seed=0, user_rewa
         sampled_traj_num += 1
         # t indicates the valid trajectory length
 
+    return buff
+
+
+def sampler(pid, queue, evt, env, policy, num_dialogues, train_seed=0, user_reward=False):
+    """
+    This is a sampler function, and it will be called by multiprocess.Process to sample data from environment by multiple
+    processes.
+    :param pid: process id
+    :param queue: multiprocessing.Queue, to collect sampled data
+    :param evt: multiprocessing.Event, to keep the process alive
+    :param env: environment instance
+    :param policy: policy network, to generate action from current policy
+    :param num_dialogues: number of sampled dialogues
+    :return:
+    """
+    buff = sample_dialogues(env, policy, num_dialogues, train_seed, user_reward)
+
     # this is end of sampling all batchsz of items.
     # when sampling is over, push all buff data into queue
     queue.put([pid, buff])
     evt.wait()
 
 
-def sample(env, policy, num_train_dialogues, process_num, seed, user_reward=False):
+def create_rollout_pool(env, policy, num_train_dialogues, process_num, user_reward=False):
+    """
+    Start process_num persistent sampling workers, that are reused by every call of sample(..., pool=pool)
+    """
+    process_num_dialogues = int(np.ceil(num_train_dialogues / process_num))
+    # a dialogue has at most 50 turns, see sample_dialogues
+    return RolloutWorkerPool(env, policy, process_num, sample_dialogues, capacity=process_num_dialogues * 50,
+                             sample_kwargs={'user_reward': user_reward})
+
+
+def sample(env, policy, num_train_dialogues, process_num, seed, user_reward=False, pool=None):
     """
     Given batchsz number of task, the batchsz will be splited equally to each processes
     and when processes return, it merge all data and return
@@ -118,6 +139,7 @@ def sample(env, policy, num_train_dialogues, process_num, seed, user_reward=Fals
         :param policy:
     :param batchsz:
         :param process_num:
+    :param pool: RolloutWorkerPool from create_rollout_pool. If None, new processes are spawned for this batch
     :return: batch
     """
 
@@ -125,6 +147,8 @@ def sample(env, policy, num_train_dialogues, process_num, seed, user_reward=Fals
     # final batchsz maybe larger than batchsz parameters
     process_num_dialogues = np.ceil(num_train_dialogues / process_num).astype(np.int32)
     train_seeds = random.sample(range(0, 1000), process_num)
+    if pool is not None:
+        return pool.sample(int(process_num_dialogues), train_seeds)
     # buffer to save all data
     queue = mp.Queue()
 
@@ -158,10 +182,10 @@ def sample(env, policy, num_train_dialogues, process_num, seed, user_reward=Fals
     return buff.get_batch()
 
 
-def update(env, policy, num_dialogues, epoch, process_num, seed=0, user_reward=False):
+def update(env, policy, num_dialogues, epoch, process_num, seed=0, user_reward=False, pool=None):
 
     # sample data asynchronously
-    batch = sample(env, policy, num_dialogues, process_num, seed, user_reward)
+    batch = sample(env, policy, num_dialogues, process_num, seed, user_reward, pool)
     # print(batch)
     # data in batch is : batch.state: ([1, s_dim], [1, s_dim]...)
     # batch.action: ([1, a_dim], [1, a_dim]...)
@@ -253,10 +277,15 @@ if __name__ == '__main__':
     logging.info("Start of Training: " +
                  time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime()))
 
+    # the sampling processes are started once and reused in every epoch
+    pool = create_rollout_pool(env, policy_sys, conf['model']['num_train_dialogues'], conf['model']['process_num'],
+                               user_reward=use_user_reward)
+
     for i in range(conf['model']['epoch']):
         idx = i + 1
         # print("Epoch :{}".format(str(idx)))
-        update(env, policy_sys, conf['model']['num_train_dialogues'], idx, conf['model']['process_num'], seed=seed, user_reward=use_user_reward)
+        update(env, policy_sys, conf['model']['num_train_dialogues'], idx, conf['model']['process_num'], seed=seed,
+               user_reward=use_user_reward, pool=pool)
 
         if idx % conf['model']['eval_frequency'] == 0 and idx != 0:
             time_now = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
@@ -272,6 +301,7 @@ if __name__ == '__main__':
             policy_sys.save(save_path, "last")
             for key in eval_dict:
                 tb_writer.add_scalar(key, eval_dict[key], idx * conf['model']['num_train_dialogues'])
+    pool.close()
     logging.info("End of Training: " +
                  time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime()))
 
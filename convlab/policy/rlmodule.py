@@ -6,6 +6,10 @@ import numpy as np
 from collections import namedtuple
 import random
 
+from convlab.policy.policy import Policy
+
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
 
 class DiscretePolicy(nn.Module):
     def __init__(self, s_dim, h_dim, a_dim):
@@ -284,6 +288,46 @@ class Value(nn.Module):
         return value
 
 
+def discounted_cumsum(x, mask, discount):
+    """
+    reverse discounted cumulative sum over trajectories saved one after another, a trajectory ends where mask=0:
+    y[t] = x[t] + discount * mask[t] * y[t+1]. The recurrence is evaluated as a parallel scan in log2(b) steps.
+    :param x: Tensor, [b]
+    :param mask: indicates ending for 0 otherwise 1, Tensor, [b]
+    :param discount: float
+    :return: y, Tensor, [b]
+    """
+    y = x.clone()
+    # weight[t] is the factor of y[t + shift] in y[t]
+    weight = discount * mask.to(x.dtype)
+    shift = 1
+    while shift < y.size(0):
+        y = torch.cat((y[:-shift] + weight[:-shift] * y[shift:], y[-shift:]))
+        weight = torch.cat((weight[:-shift] * weight[shift:], weight[-shift:]))
+        shift *= 2
+    return y
+
+
+def estimate_advantage(r, v, mask, gamma, tau):
+    """
+    generalized advantage estimation (https://arxiv.org/abs/1506.02438) and value targets for trajectories saved
+    one after another, a trajectory ends where mask=0.
+    :param r: reward, Tensor, [b]
+    :param v: estimated value, Tensor, [b]
+    :param mask: indicates ending for 0 otherwise 1, Tensor, [b]
+    :return: A(s, a), V-target(s), both float Tensor
+    """
+    r, v, mask = r.double(), v.double(), mask.double()
+    # formula: V(s_t) = r_t + gamma * V(s_t+1)
+    v_target = discounted_cumsum(r, mask, gamma)
+    # formula: delta(s_t) = r_t + gamma * V(s_t+1) - V(s_t)
+    next_v = torch.cat((v[1:], v.new_zeros(1)))
+    delta = r + gamma * next_v * mask - v
+    # formula: A(s, a) = delta(s_t) + gamma * lamda * A(s_t+1, a_t+1)
+    A_sa = discounted_cumsum(delta, mask, gamma * tau)
+    return A_sa.float(), v_target.float()
+
+
 Transition_evaluator = namedtuple('Transition_evaluator',
                                   ('complete', 'success', 'success_strict', 'total_return_complete', 'total_return_success', 'turns',
                                    'avg_actions', 'task_success', 'book_actions', 'inform_actions', 'request_actions', 'select_actions',
@@ -340,6 +384,49 @@ class Memory(object):
         return len(self.memory)
 
 
+class VectorPolicy(Policy):
+    """
+    Policy that vectorises the state with self.vector and selects the action with the MultiDiscretePolicy
+    self.policy, such as PPO, GDPL and PG.
+    """
+
+    def predict(self, state):
+        """
+        Predict an system action given state.
+        Args:
+            state (dict): Dialog state. Please refer to util/state.py
+        Returns:
+            action : System act, with the form of (act_type, {slot_name_1: value_1, slot_name_2, value_2, ...})
+        """
+        s, action_mask = self.vector.state_vectorize(state)
+        return self.predict_from_vector(s, action_mask)
+
+    def predict_from_vector(self, s, action_mask):
+        """
+        Predict an system action given the state vector and action mask returned by self.vector.state_vectorize.
+        Samplers use it to vectorise every state only once. The state has to be the one vectorised last, as the
+        vectoriser lexicalises the action with it.
+        Args:
+            s (np.array): state vector
+            action_mask (np.array): action mask
+        Returns:
+            action : System act, with the form of (act_type, {slot_name_1: value_1, slot_name_2, value_2, ...})
+        """
+        s_vec = torch.Tensor(s).to(device=DEVICE)
+        mask_vec = torch.Tensor(action_mask).to(device=DEVICE)
+        a = self.policy.select_action(s_vec, False, action_mask=mask_vec).cpu()
+
+        a_counter = 0
+        while a.sum() == 0:
+            a_counter += 1
+            a = self.policy.select_action(s_vec, True, action_mask=mask_vec).cpu()
+            if a_counter == 5:
+                break
+        action = self.vector.action_devectorize(a.detach().numpy())
+        self.info_dict["action_used"] = action
+        return action
+
+
 Transition_LAVA = namedtuple(
     'Transition_LAVA', ('state', 'action', 'logprobs', 'reward', 'next_state', 'mask'))
 
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import queue
+import traceback
+
+import numpy as np
+import torch
+from torch import multiprocessing as mp
+
+from convlab.policy.rlmodule import Transition
+
+# dtypes of the arrays the samplers push into Memory, kept so that batches look the same as without the pool
+BUFFER_FIELDS = [('state', torch.float32), ('action', torch.float64), ('reward', torch.float64),
+                 ('next_state', torch.float32), ('mask', torch.float32), ('action_mask', torch.float32)]
+# seconds between two checks that the workers are alive while waiting for their results
+POLL_INTERVAL = 5
+
+
+def worker_error(name):
+    """the exception being handled in a worker, as a picklable exception with its traceback"""
+    return RuntimeError(f'{name} failed:\n{traceback.format_exc()}')
+
+
+def get_result(result_queue, processes):
+    """
+    wait for the next item of result_queue
+    :raise RuntimeError: if one of the worker processes died before it was put
+    """
+    while True:
+        try:
+            return result_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            for pid, process in enumerate(processes):
+                if not process.is_alive():
+                    raise RuntimeError(f'worker {pid} died with exit code {process.exitcode}')
+
+
+def rollout_worker(pid, env, policy, sample_fn, sample_kwargs, buffer, job_queue, result_queue):
+    """
+    Main loop of a pool worker. The env and policy are received once, when the worker is started.
+    For every job, the new policy weights are loaded, sample_fn(env, policy, num, seed, **sample_kwargs) is run
+    and the transitions of the returned Memory are written into this worker's block of the shared buffer.
+    :param pid: worker id
+    :param buffer: dict of shared-memory tensors, one per Transition field
+    :param job_queue: receives (state_dict, num, seed) jobs, or None to stop the worker
+    :param result_queue: receives (pid, number of transitions, Memory or None or exception). The Memory is only sent
+    through the queue if it does not fit in the buffer, the exception if the job failed.
+    """
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        try:
+            state_dict, num, seed = job
+            policy.policy.load_state_dict(state_dict)
+            buff = sample_fn(env, policy, num, seed, **sample_kwargs)
+            size = len(buff)
+            if size > len(buffer['state']):
+                result_queue.put((pid, size, buff))
+                continue
+            if size > 0:
+                for (field, _), values in zip(BUFFER_FIELDS, buff.get_batch()):
+                    buffer[field][:size] = torch.from_numpy(np.stack(values).astype(buffer[field].numpy().dtype))
+            result_queue.put((pid, size, None))
+        except Exception:
+            result_queue.put((pid, 0, worker_error(f'rollout worker {pid}')))
+
+
+class RolloutWorkerPool(object):
+    """
+    Long-lived sampling processes for on-policy training.
+
+    The env and policy are pickled into every worker only once, when the pool is created. For every batch, the
+    workers only receive the current weights of policy.policy and write the sampled transitions into preallocated
+    shared-memory tensors, so sampling time is spent on simulating dialogues rather than on process startup and
+    unpickling models.
+    """
+
+    def __init__(self, env, policy, process_num, sample_fn, capacity, sample_kwargs=None):
+        """
+        :param env: environment instance
+        :param policy: policy with a `policy` network and a `vector`
+        :param process_num: number of worker processes
+        :param sample_fn: picklable function sample_fn(env, policy, num, seed, **sample_kwargs) returning a Memory
+        :param capacity: number of transitions preallocated per worker
+        :param sample_kwargs: additional keyword arguments of sample_fn
+        """
+        ctx = mp.get_context('spawn')
+        self.process_num = process_num
+        self.policy = policy
+        dims = {'state': [policy.vector.state_dim], 'action': [policy.vector.da_dim], 'reward': [],
+                'next_state': [policy.vector.state_dim], 'mask': [], 'action_mask': [policy.vector.da_dim]}
+        self.buffers = [{field: torch.zeros([capacity] + dims[field], dtype=dtype).share_memory_()
+                         for field, dtype in BUFFER_FIELDS} for _ in range(process_num)]
+        self.job_queues = [ctx.Queue() for _ in range(process_num)]
+        self.result_queue = ctx.Queue()
+        self.processes = []
+        for pid in range(process_num):
+            process_args = (pid, env, policy, sample_fn, sample_kwargs or {}, self.buffers[pid],
+                            self.job_queues[pid], self.result_queue)
+            process = ctx.Process(target=rollout_worker, args=process_args)
+            # set the process as daemon, and it will be killed once the main process is stoped.
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def sample(self, num, seeds):
+        """
+        let every worker sample `num` (dialogues or transitions, depending on sample_fn) with its seed
+        :param seeds: one seed per worker
+        :return: batch, a Transition of arrays with the transitions of all workers, ordered by worker id
+        :raise RuntimeError: if a worker failed, or died (the pool is terminated then)
+        """
+        state_dict = {key: value.detach().cpu() for key, value in self.policy.policy.state_dict().items()}
+        for pid in range(self.process_num):
+            self.job_queues[pid].put((state_dict, num, seeds[pid]))
+
+        results = {}
+        error = None
+        for _ in range(self.process_num):
+            try:
+                pid, size, buff = get_result(self.result_queue, self.processes)
+            except RuntimeError:
+                # the results of the other workers can not be told apart from the next batch
+                self.terminate()
+                raise
+            if isinstance(buff, Exception):
+                error = buff
+            elif buff is None:
+                buff = Transition(*[self.buffers[pid][field][:size].numpy().copy() for field, _ in BUFFER_FIELDS])
+            else:
+                buff = Transition(*[np.stack(values).astype(self.buffers[pid][field].numpy().dtype)
+                                    for (field, _), values in zip(BUFFER_FIELDS, buff.get_batch())])
+            results[pid] = buff
+        if error is not None:
+            raise error
+        return Transition(*[np.concatenate([getattr(results[pid], field) for pid in range(self.process_num)])
+                            for field, _ in BUFFER_FIELDS])
+
+    def close(self):
+        for job_queue in self.job_queues:
+            job_queue.put(None)
+        for process in self.processes:
+            process.join()
+
+    def terminate(self):
+        """kill the workers, e.g. after one of them died"""
+        for process in self.processes:
+            process.terminate()
+            process.join()
@@ -13,6 +13,7 @@ import random
 import re
 import logging
 
+from convlab.dst.rule.multiwoz.dst_util import ValueNormalizer
 from convlab.policy.policy import Policy
 from convlab.task.multiwoz.goal_generator import GoalGenerator
 from convlab.util.multiwoz.multiwoz_slot_trans import REF_USR_DA, REF_SYS_DA
@@ -71,6 +72,8 @@ class UserPolicyAgendaMultiWoz(Policy):
     # load stand value
     with open(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, os.pardir, 'data/multiwoz/value_set.json')) as f:
         stand_value_dict = json.load(f)
+    # (domain, slot) -> (standard values, ValueNormalizer of the values), built on first use
+    stand_value_normalizers = {}
 
     def __init__(self):
         """
@@ -260,17 +263,29 @@ class UserPolicyAgendaMultiWoz(Policy):
         if slot in ['parking', 'internet'] and value == 'none':
             return 'yes'
 
-        value_list = cls.stand_value_dict[domain][slot]
-        low_value_list = [item.lower() for item in value_list]
-        value_list = sorted(list(set(value_list) | set(low_value_list)))
-        if value not in value_list:
-            normalized_v = simple_fuzzy_match(value_list, value)
+        if (domain, slot) not in cls.stand_value_normalizers:
+            value_list = cls.stand_value_dict[domain][slot]
+            low_value_list = [item.lower() for item in value_list]
+            value_list = sorted(list(set(value_list) | set(low_value_list)))
+            cls.stand_value_normalizers[(domain, slot)] = \
+                (set(value_list), ValueNormalizer([' '.join(val.split()) for val in value_list]))
+        value_set, normalizer = cls.stand_value_normalizers[(domain, slot)]
+        normalized_v = normalizer.cache_get(value)
+        if normalized_v is None:
+            normalized_v = cls._normalize_nonstandard_value(domain, slot, value, value_set, normalizer)
+            normalizer.cache_put(value, normalized_v)
+        return normalized_v
+
+    @classmethod
+    def _normalize_nonstandard_value(cls, domain, slot, value, value_set, normalizer):
+        if value not in value_set:
+            normalized_v = simple_fuzzy_match(normalizer, value)
             if normalized_v is not None:
                 return normalized_v
             # try some transformations
             cand_values = transform_value(value)
             for cv in cand_values:
-                _nv = simple_fuzzy_match(value_list, cv)
+                _nv = simple_fuzzy_match(normalizer, cv)
                 if _nv is not None:
                     return _nv
             if check_if_time(value):
@@ -298,22 +313,21 @@ def transform_value(value):
     return cand_list
 
 
-def simple_fuzzy_match(value_list, value):
+def simple_fuzzy_match(normalizer, value):
+    """
+    the first value v1 of the normalizer (values with normalized spaces) with v0 in v1 or v1 in v0, where v0 is value
+    with normalized or removed spaces, first as it is and then lower cased
+    """
     # check contain relation
     v0 = ' '.join(value.split())
     v0N = ''.join(value.split())
-    for val in value_list:
-        v1 = ' '.join(val.split())
-        if v0 in v1 or v1 in v0 or v0N in v1 or v1 in v0N:
-            return v1
+    v1 = normalizer.find_containing(v0, v0N)
+    if v1 is not None:
+        return v1
     value = value.lower()
     v0 = ' '.join(value.split())
     v0N = ''.join(value.split())
-    for val in value_list:
-        v1 = ' '.join(val.split())
-        if v0 in v1 or v1 in v0 or v0N in v1 or v1 in v0N:
-            return v1
-    return None
+    return normalizer.find_containing(v0, v0N)
 
 
 def check_if_time(value):
@@ -354,13 +368,15 @@ def check_constraint(slot, val_usr, val_sys):
 class Goal(object):
     """ User Goal Model Class. """
 
-    def __init__(self, goal_generator: GoalGenerator):
+    def __init__(self, goal_generator: GoalGenerator = None, user_goal=None):
         """
         create new Goal by random
         Args:
             goal_generator (GoalGenerator): Goal Generator.
+            user_goal (dict): user goal generated by goal_generator.get_user_goal() (e.g. from a goal bank), used
+                instead of generating a new one.
         """
-        self.domain_goals = goal_generator.get_user_goal()
+        self.domain_goals = user_goal if user_goal is not None else goal_generator.get_user_goal()
 
         self.domains = list(self.domain_goals['domain_ordering'])
         del self.domain_goals['domain_ordering']
@@ -4,6 +4,7 @@ import random
 from copy import deepcopy
 
 from convlab.policy.policy import Policy
+from convlab.util.db_registry import shared_database
 from convlab.util.multiwoz.dbquery import Database
 from convlab.util.multiwoz.multiwoz_slot_trans import REF_SYS_DA, REF_USR_DA
 
@@ -43,7 +44,7 @@ class RuleBasedMultiwozBot(Policy):
     def __init__(self):
         Policy.__init__(self)
         self.last_state = {}
-        self.db = Database()
+        self.db = shared_database(Database)
 
     def init_session(self):
         self.last_state = {}
@@ -10,6 +10,7 @@ from convlab.policy.vec import Vector
 from convlab.util.custom_util import flatten_acts, timeout
 from convlab.util.multiwoz.lexicalize import delexicalize_da, flat_da, deflat_da, lexicalize_da
 from convlab.util import load_ontology, load_database, load_dataset
+from convlab.util.db_registry import shared_database
 
 
 root_dir = os.path.dirname(os.path.dirname(
@@ -28,12 +29,8 @@ class VectorBase(Vector):
         self.set_seed(seed)
         self.ontology = load_ontology(dataset_name)
         try:
-            # execute to make sure that the database exists or is downloaded otherwise
-            if dataset_name == "multiwoz21" or dataset_name == "crosswoz":
-                load_database(dataset_name)
-            # the following two lines are needed for pickling correctly during multi-processing
-            exec(f'from data.unified_datasets.{dataset_name}.database import Database')
-            self.db = eval('Database()')
+            # one database per process, shared with the other components and pickled as a reference to it
+            self.db = shared_database(load_database, dataset_name)
             self.db_domains = self.db.domains
         except Exception as e:
             self.db = None
@@ -189,6 +186,50 @@ class VectorBase(Vector):
         print(f"Dimension of system actions: {self.da_dim}")
         print(f"Dimension of user actions: {self.da_opp_dim}")
 
+        self.build_mask_indices()
+
+    def build_mask_indices(self):
+        """
+        precompute, for the system action vocabulary, the action indices needed by the compute_*_mask functions,
+        so that the masks are built with a few array operations instead of parsing every action each turn
+        """
+        actions = [self.vec2act[i] for i in range(self.da_dim)]
+        self.mask_domains = sorted(set(action[0] for action in actions))
+        domain2id = {domain: i for i, domain in enumerate(self.mask_domains)}
+        self.action_domain_ids = np.array([domain2id[action[0]] for action in actions], dtype=np.int64)
+
+        # actions informing on the n-th entity, masked if there are less than n entities
+        entity_idx, entity_domain_ids, entity_values = [], [], []
+        # actions whose value is not a number are checked one by one
+        self.entity_unparsed_actions = []
+        # nooffer/nobook actions, masked if there is an entity
+        no_entity_idx = []
+        # nooffer/nobook-slot actions are always masked
+        no_entity_slot_idx = []
+        # inform actions on a booking or taxi slot, masked depending on the belief state
+        self.state_dependent_actions = []
+        for i, (domain, intent, slot, value) in enumerate(actions):
+            if intent in ['inform', 'select', 'recommend'] and value != None and value != 'none':
+                try:
+                    entity_values.append(int(value))
+                    entity_idx.append(i)
+                    entity_domain_ids.append(domain2id[domain])
+                except ValueError:
+                    self.entity_unparsed_actions.append((i, domain, value))
+            if intent in ['nooffer', 'nobook']:
+                no_entity_idx.append(i)
+                if slot != 'none':
+                    no_entity_slot_idx.append(i)
+            if intent == 'inform' and ("book" in slot or domain == 'taxi'):
+                self.state_dependent_actions.append((i, domain, slot))
+
+        self.entity_idx = np.array(entity_idx, dtype=np.int64)
+        self.entity_domain_ids = np.array(entity_domain_ids, dtype=np.int64)
+        self.entity_values = np.array(entity_values, dtype=np.int64)
+        self.no_entity_idx = np.array(no_entity_idx, dtype=np.int64)
+        self.no_entity_domain_ids = self.action_domain_ids[self.no_entity_idx]
+        self.no_entity_slot_idx = np.array(no_entity_slot_idx, dtype=np.int64)
+
     def get_state_dim(self):
         '''
         Compute the state dimension for the policy input
@@ -243,14 +284,10 @@ class VectorBase(Vector):
         Can not speak about a domain if that domain is not active.
         A domain is active if the user mentioned it in the current turn or if a slot is filled with a value
         '''
+        inactive = np.array([domain in domain_active_dict and not domain_active_dict[domain]
+                             for domain in self.mask_domains], dtype=bool)
         mask_list = np.zeros(self.da_dim)
-
-        for i in range(self.da_dim):
-            action = self.vec2act[i]
-            action_domain = action[0]
-            if action_domain in domain_active_dict.keys():
-                if not domain_active_dict[action_domain]:
-                    mask_list[i] = 1.0
+        mask_list[inactive[self.action_domain_ids]] = 1.0
 
         return mask_list
 
@@ -258,22 +295,18 @@ class VectorBase(Vector):
 
         mask_list = np.zeros(self.da_dim)
 
-        for i in range(self.da_dim):
-            action = self.vec2act[i]
-            domain, intent, slot, value = action
-
-            # NoBook/NoOffer-SLOT does not make sense because policy can not know which constraint made offer impossible
-            # If one wants to do it, lexicaliser needs to do it
-            if intent in ['nobook', 'nooffer'] and slot != 'none':
-                mask_list[i] = 1.0
+        # NoBook/NoOffer-SLOT does not make sense because policy can not know which constraint made offer impossible
+        # If one wants to do it, lexicaliser needs to do it
+        mask_list[self.no_entity_slot_idx] = 1.0
 
-            if "book" in slot and intent == 'inform':
+        for i, domain, slot in self.state_dependent_actions:
+            if "book" in slot:
                 if not self.state.get(domain, {}).get(slot, {}):
                     mask_list[i] = 1.0
 
             if domain == 'taxi':
                 if slot in self.state.get('taxi', {}):
-                    if not self.state['taxi'][slot] and intent == 'inform':
+                    if not self.state['taxi'][slot]:
                         mask_list[i] = 1.0
 
         return mask_list
@@ -286,17 +319,16 @@ class VectorBase(Vector):
         mask_list = np.zeros(self.da_dim)
         if number_entities_dict is None:
             return mask_list
-        for i in range(self.da_dim):
-            action = self.vec2act[i]
-            domain, intent, slot, value = action
-            domain_entities = number_entities_dict.get(domain, 1)
 
-            if intent in ['inform', 'select', 'recommend'] and value != None and value != 'none':
-                if int(value) > domain_entities:
-                    mask_list[i] = 1.0
-            if intent in ['nooffer', 'nobook'] and number_entities_dict.get(domain, 0) > 0:
+        domain_entities = np.array([number_entities_dict.get(domain, 1) for domain in self.mask_domains])
+        mask_list[self.entity_idx[self.entity_values > domain_entities[self.entity_domain_ids]]] = 1.0
+        for i, domain, value in self.entity_unparsed_actions:
+            if int(value) > number_entities_dict.get(domain, 1):
                 mask_list[i] = 1.0
 
+        has_entities = np.array([number_entities_dict.get(domain, 0) > 0 for domain in self.mask_domains], dtype=bool)
+        mask_list[self.no_entity_idx[has_entities[self.no_entity_domain_ids]]] = 1.0
+
         return mask_list
 
     def dbquery_domain(self, domain):
@@ -329,6 +361,12 @@ class VectorBase(Vector):
         """
         constraints = self.state.get(domain, {})
 
+        masks = None
+        if hasattr(self.db, 'constraint_masks'):
+            masks = self.db.constraint_masks(domain, [[slot, value] for slot, value in constraints.items()])
+        if masks is not None:
+            return self.find_nooffer_slot_from_masks(list(constraints), masks)
+
         # Leave slots out of constraints to find which slot constraint results in no entities being found
         for constraint_slot in constraints:
             state = [[slot, value] for slot,
@@ -354,6 +392,35 @@ class VectorBase(Vector):
         # If no single slots or pairs removed results in success then set slot 'none'
         return 'none'
 
+    @staticmethod
+    def find_nooffer_slot_from_masks(slots, masks):
+        """
+        Same as find_nooffer_slot, but works on the bitsets of entities satisfying each slot constraint
+        (see Database.constraint_masks), so that each constraint is evaluated only once against the database.
+        Dropping a slot or a pair of slots amounts to AND-ing the masks of the remaining slots.
+        """
+        # prefix[i] = AND of masks[:i], suffix[i] = AND of masks[i:], -1 has all bits set
+        prefix, suffix = [-1], [-1]
+        for mask in masks:
+            prefix.append(prefix[-1] & mask)
+        for mask in reversed(masks):
+            suffix.append(suffix[-1] & mask)
+        suffix.reverse()
+
+        for i, slot in enumerate(slots):
+            if prefix[i] & suffix[i + 1]:
+                return slot
+
+        for i, slot in enumerate(slots):
+            # between = AND of masks[i+1:j]
+            between = prefix[i]
+            for j in range(i + 1, len(slots)):
+                if between & suffix[j + 1]:
+                    return np.random.choice((slot, slots[j]))
+                between &= masks[j]
+
+        return 'none'
+
     def action_vectorize(self, action):
         action = delexicalize_da(action, self.requestable)
         #action = flat_da(action)
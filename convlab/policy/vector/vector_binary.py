@@ -64,8 +64,7 @@ class VectorBinary(VectorBase):
 
         if self.use_mask:
             mask = self.get_mask(domain_active_dict, number_entities_dict)
-            for i in range(self.da_dim):
-                mask[i] = -int(bool(mask[i])) * sys.maxsize
+            mask = np.where(mask != 0, -sys.maxsize, 0.)
         else:
             mask = np.zeros(self.da_dim)
 
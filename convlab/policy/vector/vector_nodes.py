@@ -76,8 +76,7 @@ class VectorNodes(VectorBase):
 
         if self.use_mask:
             mask = self.get_mask(domain_active_dict, number_entities_dict)
-            for i in range(self.da_dim):
-                mask[i] = -int(bool(mask[i])) * sys.maxsize
+            mask = np.where(mask != 0, -sys.maxsize, 0.)
         else:
             mask = np.zeros(self.da_dim)
 
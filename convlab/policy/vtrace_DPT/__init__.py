@@ -1 +1,5 @@
-from convlab.policy.vtrace_DPT.vtrace import VTRACE
\ No newline at end of file
+from convlab.lazy_import import lazy_module
+
+__getattr__, __dir__ = lazy_module(__name__, {
+    'VTRACE': 'convlab.policy.vtrace_DPT.vtrace',
+})
@@ -169,9 +169,7 @@ if __name__ == '__main__':
     if train_processes > 1:
         # We use multiprocessing
         queues, episode_queues = get_queues(train_processes)
-        online_metric_queue = mp.SimpleQueue()
-        processes = start_processes(train_processes, queues, episode_queues, env, policy_sys, seed,
-                                    online_metric_queue)
+        processes = start_processes(train_processes, queues, episode_queues, env, policy_sys, seed)
     goal_generator = GoalGenerator()
 
     num_dialogues = 0
@@ -185,8 +183,7 @@ if __name__ == '__main__':
         goals = create_goals(goal_generator, new_dialogues, single_domains=single_domains,
                              allowed_domains=allowed_domains)
         if train_processes > 1:
-            time_now, metrics = submit_jobs(new_dialogues, queues, episode_queues, train_processes, memory, goals,
-                                            online_metric_queue)
+            time_now, metrics = submit_jobs(new_dialogues, queues, episode_queues, train_processes, memory, goals)
         else:
             create_episodes(env, policy_sys, new_dialogues, memory, goals)
         num_dialogues += new_dialogues
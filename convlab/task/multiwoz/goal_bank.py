@@ -0,0 +1,148 @@
+"""
+Goal banks: the user goals of an evaluation, generated once and saved to a file.
+
+A bank holds the goal created for every seed of a seed range, exactly like
+    for seed in seeds: set_seed(seed); create_goals(goal_generator, 1, single_domains, allowed_domains)
+would, so that the goals of every evaluation are identical. The file name is the hash of the goal model, the
+database, the generator options and the seeds, a bank is only generated once for every version of these. Goals are
+unpickled on access from the memory-mapped file, without loading the goal model and the database. Banks are saved in
+the user cache directory (`convlab.util.file_util.get_cache_dir`) unless another directory is given.
+"""
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import pickle
+import random
+import tempfile
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+from convlab import get_root_path
+from convlab.util.file_util import get_cache_dir
+
+DB_DIR = os.path.join(get_root_path(), 'data/multiwoz/db')
+# change to invalidate the saved banks when goal generation changes
+GOAL_BANK_VERSION = 1
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def goal_bank_key(seeds, single_domains=False, allowed_domains=None, generator_kwargs=None) -> str:
+    """hash identifying the goals of a bank"""
+    from convlab.task.multiwoz.goal_generator import GoalGenerator
+    generator_kwargs = dict(generator_kwargs or {})
+    goal_model_path = generator_kwargs.get(
+        'goal_model_path', inspect.signature(GoalGenerator).parameters['goal_model_path'].default)
+    config = {
+        'version': GOAL_BANK_VERSION,
+        'goal_model': _file_hash(goal_model_path),
+        'db': {name: _file_hash(os.path.join(DB_DIR, name)) for name in sorted(os.listdir(DB_DIR))
+               if name.endswith('_db.json')},
+        'generator': {key: repr(value) for key, value in sorted(generator_kwargs.items()) if key != 'goal_model_path'},
+        'seeds': list(seeds),
+        'single_domains': single_domains,
+        'allowed_domains': sorted(allowed_domains) if allowed_domains is not None else None
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class GoalBank(Sequence):
+    """
+    user goals (dicts as returned by GoalGenerator.get_user_goal) in a goal bank file, every access returns a new
+    copy of the goal. Pickled as its path, so that sampler processes memory-map the same file. The file is unmapped
+    by `close`, or at the end of a `with` block.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # the file ends with the offsets of the goals and their number
+        num_goals = array('q', self.data[-8:])[0]
+        self.offsets = array('q', self.data[-8 * (num_goals + 2):-8])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        if i < 0:
+            i += len(self)
+        return pickle.loads(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __reduce__(self):
+        return GoalBank, (self.path,)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_goal_bank(path, seeds, single_domains=False, allowed_domains=None, generator_kwargs=None):
+    """generate the goal of every seed and save them to `path`, the random states are restored afterwards"""
+    from convlab.task.multiwoz.goal_generator import GoalGenerator
+    goal_generator = GoalGenerator(**(generator_kwargs or {}))
+    random_states = random.getstate(), np.random.get_state()
+    offsets = array('q', [0])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written to a temporary file first, parallel runs may build the same bank
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for seed in seeds:
+                random.seed(seed)
+                np.random.seed(seed)
+                while True:
+                    user_goal = goal_generator.get_user_goal()
+                    goal_domains = [domain for domain in user_goal if domain != 'domain_ordering']
+                    if single_domains and len(goal_domains) > 1:
+                        continue
+                    if allowed_domains is not None and not set(goal_domains).issubset(set(allowed_domains)):
+                        continue
+                    break
+                f.write(pickle.dumps(user_goal, protocol=pickle.HIGHEST_PROTOCOL))
+                offsets.append(f.tell())
+            offsets.tofile(f)
+            array('q', [len(offsets) - 1]).tofile(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        random.setstate(random_states[0])
+        np.random.set_state(random_states[1])
+
+
+def load_goal_bank(seeds, single_domains=False, allowed_domains=None, generator_kwargs=None,
+                   bank_dir=None) -> GoalBank:
+    """
+    load the goal bank of the seeds, it is generated on first use
+    :param seeds: one goal per seed, e.g. range(1000, 1000 + num_eval_dialogues)
+    :param single_domains: only keep goals with one domain
+    :param allowed_domains: only keep goals whose domains are all in this list
+    :param generator_kwargs: arguments of GoalGenerator
+    :param bank_dir: directory of the goal banks, get_cache_dir('goal_banks') by default
+    """
+    bank_dir = bank_dir or get_cache_dir('goal_banks')
+    seeds = list(seeds)
+    key = goal_bank_key(seeds, single_domains, allowed_domains, generator_kwargs)
+    path = os.path.join(bank_dir, f'{key}.bin')
+    if not os.path.exists(path):
+        build_goal_bank(path, seeds, single_domains, allowed_domains, generator_kwargs)
+    return GoalBank(path)
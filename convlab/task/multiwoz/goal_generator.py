@@ -12,6 +12,7 @@ from pprint import pprint
 import numpy as np
 import pdb
 
+from convlab.util.db_registry import shared_database
 from convlab.util.multiwoz.dbquery import Database
 from convlab import get_root_path
 
@@ -137,8 +138,20 @@ def do_boldify(content):
     return '<b>' + content + '</b>'
 
 
-def nomial_sample(counter: Counter):
-    return list(counter.keys())[np.argmax(np.random.multinomial(1, list(counter.values())))]
+class CategoricalSampler:
+    """Draw the keys of a {key: weight} distribution with one uniform number, by searching the cumulative weights."""
+
+    def __init__(self, dist):
+        self.keys = list(dist.keys())
+        self.cum_weights = np.cumsum(list(dist.values()), dtype=float)
+
+    def sample(self, uniform=np.random.random_sample):
+        """
+        :param uniform: function returning a uniform number in [0, 1). With random.random, the key is the same as
+            random.choices(keys, weights)[0] would draw.
+        """
+        index = np.searchsorted(self.cum_weights, uniform() * self.cum_weights[-1], side='right')
+        return self.keys[min(int(index), len(self.keys) - 1)]
 
 
 class GoalGenerator:
@@ -162,7 +175,7 @@ class GoalGenerator:
         """
         self.goal_model_path = goal_model_path
         self.corpus_path = corpus_path
-        self.db = Database()
+        self.db = shared_database(Database)
         self.boldify = do_boldify if boldify else null_boldify
         self.sample_info_from_trainset = sample_info_from_trainset
         self.sample_reqt_from_trainset = sample_reqt_from_trainset
@@ -176,6 +189,9 @@ class GoalGenerator:
             print('Building goal model is done')
         if domain_ordering_dist is not None:
             self.domain_ordering_dist = domain_ordering_dist
+        self._build_samplers()
+        # db entities of the (domain, info) queried again and again while generating goals
+        self.query_cache = {}
         np.random.seed(seed)
         random.seed(seed)
         # remove some slot
@@ -192,6 +208,26 @@ class GoalGenerator:
         # pprint(self.slots_num_dist)
         # pprint(self.slots_combination_dist)
 
+    def _build_samplers(self):
+        """precompute the samplers of the goal model distributions, call it again after changing them"""
+        self.domain_ordering_sampler = CategoricalSampler(self.domain_ordering_dist)
+        self.slots_combination_samplers = {
+            domain: {key: CategoricalSampler(dist) for key, dist in self.slots_combination_dist[domain].items()}
+            for domain in self.slots_combination_dist}
+        self.slot_value_samplers = {
+            domain: {key: {slot: CategoricalSampler(dist) for slot, dist in self.ind_slot_value_dist[domain][key].items()}
+                     for key in ['info', 'book'] if key in self.ind_slot_value_dist[domain]}
+            for domain in self.ind_slot_value_dist}
+
+    def _query(self, domain, info):
+        """entities of the db matching a goal info, taxi queries are random and not cached"""
+        if domain == 'taxi':
+            return self.db.query(domain, info.items())
+        key = (domain, tuple(info.items()))
+        if key not in self.query_cache:
+            self.query_cache[key] = self.db.query(domain, info.items())
+        return self.query_cache[key]
+
     def _build_goal_model(self):
         dialogs = json.load(open(self.corpus_path))
 
@@ -345,7 +381,7 @@ class GoalGenerator:
 
     def _get_domain_goal(self, domain):
         cnt_slot = self.ind_slot_dist[domain]
-        cnt_slot_value = self.ind_slot_value_dist[domain]
+        value_samplers = self.slot_value_samplers[domain]
         pro_book = self.book_dist[domain]
 
         while True:
@@ -355,16 +391,13 @@ class GoalGenerator:
             # inform
             if 'info' in cnt_slot:
                 if self.sample_info_from_trainset:
-                    slots = random.choices(list(self.slots_combination_dist[domain]['info'].keys()),
-                                           list(self.slots_combination_dist[domain]['info'].values()))[0]
+                    slots = self.slots_combination_samplers[domain]['info'].sample(random.random)
                     for slot in slots:
-                        domain_goal['info'][slot] = nomial_sample(
-                            cnt_slot_value['info'][slot])
+                        domain_goal['info'][slot] = value_samplers['info'][slot].sample()
                 else:
                     for slot in cnt_slot['info']:
                         if random.random() < cnt_slot['info'][slot] + pro_correction['info']:
-                            domain_goal['info'][slot] = nomial_sample(
-                                cnt_slot_value['info'][slot])
+                            domain_goal['info'][slot] = value_samplers['info'][slot].sample()
 
                 if domain in ['hotel', 'restaurant', 'attraction'] and 'name' in domain_goal['info'] and len(
                         domain_goal['info']) > 1:
@@ -386,11 +419,9 @@ class GoalGenerator:
                         domain_goal['info']:
                     if random.random() < (cnt_slot['info']['arriveBy'] / (
                             cnt_slot['info']['arriveBy'] + cnt_slot['info']['leaveAt'])):
-                        domain_goal['info']['arriveBy'] = nomial_sample(
-                            cnt_slot_value['info']['arriveBy'])
+                        domain_goal['info']['arriveBy'] = value_samplers['info']['arriveBy'].sample()
                     else:
-                        domain_goal['info']['leaveAt'] = nomial_sample(
-                            cnt_slot_value['info']['leaveAt'])
+                        domain_goal['info']['leaveAt'] = value_samplers['info']['leaveAt'].sample()
 
                 if domain in ['train']:
                     random_train = random.choice(self.train_database)
@@ -398,12 +429,10 @@ class GoalGenerator:
                     domain_goal['info']['destination'] = random_train['destination']
 
                 if domain in ['taxi'] and 'departure' not in domain_goal['info']:
-                    domain_goal['info']['departure'] = nomial_sample(
-                        cnt_slot_value['info']['departure'])
+                    domain_goal['info']['departure'] = value_samplers['info']['departure'].sample()
 
                 if domain in ['taxi'] and 'destination' not in domain_goal['info']:
-                    domain_goal['info']['destination'] = nomial_sample(
-                        cnt_slot_value['info']['destination'])
+                    domain_goal['info']['destination'] = value_samplers['info']['destination'].sample()
 
                 if domain in ['taxi'] and \
                         'departure' in domain_goal['info'] and \
@@ -411,11 +440,9 @@ class GoalGenerator:
                         domain_goal['info']['departure'] == domain_goal['info']['destination']:
                     if random.random() < (cnt_slot['info']['departure'] / (
                             cnt_slot['info']['departure'] + cnt_slot['info']['destination'])):
-                        domain_goal['info']['departure'] = nomial_sample(
-                            cnt_slot_value['info']['departure'])
+                        domain_goal['info']['departure'] = value_samplers['info']['departure'].sample()
                     else:
-                        domain_goal['info']['destination'] = nomial_sample(
-                            cnt_slot_value['info']['destination'])
+                        domain_goal['info']['destination'] = value_samplers['info']['destination'].sample()
                 if domain_goal['info'] == {}:
                     continue
             # request
@@ -445,29 +472,23 @@ class GoalGenerator:
 
                 for slot in cnt_slot['book']:
                     if random.random() < cnt_slot['book'][slot] + pro_correction['book']:
-                        domain_goal['book'][slot] = nomial_sample(
-                            cnt_slot_value['book'][slot])
+                        domain_goal['book'][slot] = value_samplers['book'][slot].sample()
 
                 # makes sure that there are all necessary slots for booking
                 if domain == 'restaurant' and 'time' not in domain_goal['book']:
-                    domain_goal['book']['time'] = nomial_sample(
-                        cnt_slot_value['book']['time'])
+                    domain_goal['book']['time'] = value_samplers['book']['time'].sample()
 
                 if domain == 'hotel' and 'stay' not in domain_goal['book']:
-                    domain_goal['book']['stay'] = nomial_sample(
-                        cnt_slot_value['book']['stay'])
+                    domain_goal['book']['stay'] = value_samplers['book']['stay'].sample()
 
                 if domain in ['hotel', 'restaurant'] and 'day' not in domain_goal['book']:
-                    domain_goal['book']['day'] = nomial_sample(
-                        cnt_slot_value['book']['day'])
+                    domain_goal['book']['day'] = value_samplers['book']['day'].sample()
 
                 if domain in ['hotel', 'restaurant'] and 'people' not in domain_goal['book']:
-                    domain_goal['book']['people'] = nomial_sample(
-                        cnt_slot_value['book']['people'])
+                    domain_goal['book']['people'] = value_samplers['book']['people'].sample()
 
                 if domain == 'train' and len(domain_goal['book']) <= 0:
-                    domain_goal['book']['people'] = nomial_sample(
-                        cnt_slot_value['book']['people'])
+                    domain_goal['book']['people'] = value_samplers['book']['people'].sample()
 
             # always give user optional second booking criteria in case the system outputs fail booking by chance
             if 'book' in domain_goal:
@@ -546,12 +567,12 @@ class GoalGenerator:
             #                 domain_goal['fail_book']['day'] = days[(days.index(domain_goal['book']['day']) + 1) % 7]
 
             # fail_info
-            if 'info' in domain_goal and len(self.db.query(domain, domain_goal['info'].items())) == 0:
+            if 'info' in domain_goal and len(self._query(domain, domain_goal['info'])) == 0:
                 num_trial = 0
                 while num_trial < 100:
                     adjusted_info = self._adjust_info(
                         domain, domain_goal['info'])
-                    if len(self.db.query(domain, adjusted_info.items())) > 0:
+                    if len(self._query(domain, adjusted_info)) > 0:
                         if domain == 'train':
                             domain_goal['info'] = adjusted_info
                         else:
@@ -566,7 +587,7 @@ class GoalGenerator:
                     continue
 
             if 'reqt' in domain_goal and domain in ['train', 'hotel', 'restaurant', 'attraction']:
-                entities = self.db.query(domain, domain_goal['info'].items())
+                entities = self._query(domain, domain_goal['info'])
                 for req in domain_goal['reqt']:
                     keep = True
                     for ent in entities:
@@ -590,7 +611,7 @@ class GoalGenerator:
     def get_user_goal(self):
         domain_ordering = ()
         while len(domain_ordering) <= 0:
-            domain_ordering = nomial_sample(self.domain_ordering_dist)
+            domain_ordering = self.domain_ordering_sampler.sample()
         # domain_ordering = ('restaurant',)
 
         user_goal = {dom: self._get_domain_goal(
@@ -632,7 +653,7 @@ class GoalGenerator:
             adjusted_restaurant_goal = deepcopy(
                 user_goal['restaurant']['info'])
             adjusted_restaurant_goal['area'] = user_goal['attraction']['info']['area']
-            if len(self.db.query('restaurant', adjusted_restaurant_goal.items())) > 0 and random.random() < 0.5:
+            if len(self._query('restaurant', adjusted_restaurant_goal)) > 0 and random.random() < 0.5:
                 user_goal['restaurant']['info']['area'] = user_goal['attraction']['info']['area']
 
         # match day and people of restaurant and hotel
@@ -663,7 +684,7 @@ class GoalGenerator:
                     (days.index(user_goal['hotel']['book']['day']) + int(
                         user_goal['hotel']['book']['stay'])) % 7]
             # In case, we have no query results with adjusted train goal, we simply drop the train goal.
-            if len(self.db.query('train', user_goal['train']['info'].items())) == 0:
+            if len(self._query('train', user_goal['train']['info'])) == 0:
                 del user_goal['train']
                 domain_ordering = tuple(list(domain_ordering).remove('train'))
 
@@ -671,12 +692,28 @@ class GoalGenerator:
 
         return user_goal
 
+    def get_user_goals(self, n, seed=None):
+        """
+        generate n user goals.
+        :param seed: if given, the goals only depend on the seed (the i-th goal is the same for every n), and the state
+            of the random generators is restored afterwards
+        """
+        if seed is None:
+            return [self.get_user_goal() for _ in range(n)]
+        random_states = random.getstate(), np.random.get_state()
+        random.seed(seed)
+        np.random.seed(seed)
+        try:
+            return [self.get_user_goal() for _ in range(n)]
+        finally:
+            random.setstate(random_states[0])
+            np.random.set_state(random_states[1])
+
     def _adjust_info(self, domain, info):
         # adjust one of the slots of the info
         adjusted_info = deepcopy(info)
         slot = random.choice(list(info.keys()))
-        adjusted_info[slot] = random.choice(
-            list(self.ind_slot_value_dist[domain]['info'][slot].keys()))
+        adjusted_info[slot] = random.choice(self.slot_value_samplers[domain]['info'][slot].keys)
         return adjusted_info
 
     def build_message(self, user_goal, boldify=null_boldify):
@@ -9,6 +9,7 @@ import numpy as np
 import torch
 from tensorboardX import SummaryWriter
 from convlab.task.multiwoz.goal_generator import GoalGenerator
+from convlab.task.multiwoz.goal_bank import load_goal_bank
 from convlab.util.file_util import cached_path
 from convlab.policy.evaluate_distributed import evaluate_distributed
 from convlab.util.train_util_neo import init_logging_nunu
@@ -161,13 +162,12 @@ def save_best(policy_sys, best_complete_rate, best_success_rate, best_return, co
 def eval_policy(conf, policy_sys, env, sess, save_eval, log_save_path, single_domain_goals=False, allowed_domains=None):
     policy_sys.is_train = False
 
-    goal_generator = GoalGenerator()
-    goals = []
-    for seed in range(1000, 1000 + conf['model']['num_eval_dialogues']):
-        set_seed(seed)
-        goal = create_goals(goal_generator, 1,
-                            single_domain_goals, allowed_domains)
-        goals.append(goal[0])
+    from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import Goal
+
+    # the same goals as creating one goal after set_seed(seed) for every seed, generated once and saved
+    with load_goal_bank(range(1000, 1000 + conf['model']['num_eval_dialogues']), single_domain_goals,
+                        allowed_domains, bank_dir=conf['model'].get('goal_bank_dir')) as goal_bank:
+        goals = [Goal(user_goal=user_goal) for user_goal in goal_bank]
 
     if conf['model']['process_num'] == 1 or save_eval:
         complete_rate, success_rate, success_rate_strict, avg_return, turns, \
@@ -532,7 +532,7 @@ def build_domains_goal(goal_generator, domains=None):
 def data_goals(num_goals, dataset="multiwoz21", dial_ids_order=0):
     from convlab.policy.tus.unify.Goal import Goal
     from convlab.policy.tus.unify.util import create_goal
-    data = load_dataset(dataset, dial_ids_order)
+    data = load_dataset(dataset, dial_ids_order, data_splits=['test'], use_cache=True)
     collected_goals = []
     for dialog in data["test"]:
         goal = Goal(create_goal(dialog))
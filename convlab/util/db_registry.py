@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide registry of read-only databases.
+
+The user simulator, the goal generator, the evaluator, the vectoriser and the rule policies of an environment all
+query the same tables. shared_database loads every database once per process and hands the same instance to all of
+them. Shared instances are pickled as a reference to their registry entry, so an environment sent to a spawned
+sampler process loads each database once in that process, instead of unpickling one copy per component.
+
+Shared databases and the entities of their tables must not be modified, copy a record before changing it.
+"""
+import threading
+
+_REGISTRY = {}
+_LOCK = threading.Lock()
+
+
+class SharedInstance(object):
+    """Mixin of the classes whose instances can be handed out by shared_database."""
+    _shared_key = None
+
+    def __reduce_ex__(self, protocol):
+        if self._shared_key is not None:
+            # pickled and deep-copied as a reference to the instance of the registry
+            return _shared_database_from_key, (self._shared_key,)
+        return super().__reduce_ex__(protocol)
+
+
+def _shared_database_from_key(key):
+    loader, args, kwargs = key
+    return shared_database(loader, *args, **dict(kwargs))
+
+
+def shared_database(loader, *args, **kwargs):
+    """
+    return the instance loader(*args, **kwargs) of this process, it is only created on the first call
+    :param loader: module-level class or function returning a SharedInstance, e.g.
+        convlab.util.multiwoz.dbquery.Database or convlab.util.unified_datasets_util.load_database
+    :param args, kwargs: hashable arguments of loader
+    """
+    key = (loader, args, tuple(sorted(kwargs.items())))
+    database = _REGISTRY.get(key)
+    if database is None:
+        with _LOCK:
+            database = _REGISTRY.get(key)
+            if database is None:
+                database = loader(*args, **kwargs)
+                assert isinstance(database, SharedInstance), f'{type(database)} can not be shared'
+                database._shared_key = key
+                _REGISTRY[key] = database
+    return database
+
+
+def clear_shared_databases():
+    """drop the registered databases, e.g. to reload them after the data files changed"""
+    with _LOCK:
+        for database in _REGISTRY.values():
+            database._shared_key = None
+        _REGISTRY.clear()
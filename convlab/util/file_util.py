@@ -2,10 +2,11 @@ from pathlib import Path
 import zipfile
 import json
 import os
-from convlab.util.allennlp_file_utils import cached_path as allennlp_cached_path
 
 
 def cached_path(file_path, cached_dir=None):
+    # boto3 and requests are only imported when a file is actually fetched
+    from convlab.util.allennlp_file_utils import cached_path as allennlp_cached_path
     print('Load from', file_path)
     if not cached_dir:
         cached_dir = str(Path(Path.home() / '.convlab') / "cache")
@@ -13,6 +14,14 @@ def cached_path(file_path, cached_dir=None):
     return allennlp_cached_path(file_path, cached_dir)
 
 
+def get_cache_dir(*subdirs):
+    """
+    directory of the files built by convlab (e.g. dataset caches, goal banks): `$CONVLAB_CACHE` if set,
+    ~/.convlab/cache otherwise
+    """
+    return os.path.join(os.environ.get('CONVLAB_CACHE', str(Path.home() / '.convlab' / 'cache')), *subdirs)
+
+
 def read_zipped_json(zip_path, filepath):
     archive = zipfile.ZipFile(zip_path, 'r')
     return json.load(archive.open(filepath))
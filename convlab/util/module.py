@@ -17,7 +17,7 @@ class Module(ABC):
         return None
 
     def to_cache(self, *args, **kwargs):
-        """save internal state for multi-turn dialog"""
+        """save a copy of internal state for multi-turn dialog"""
         return None
 
     def init_session(self):
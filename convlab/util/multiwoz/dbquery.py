@@ -6,9 +6,10 @@ import random
 from fuzzywuzzy import fuzz
 from itertools import chain
 from copy import deepcopy
+from convlab.util.db_registry import SharedInstance
 
 
-class Database(object):
+class Database(SharedInstance):
     def __init__(self):
         super(Database, self).__init__()
         # loading databases
@@ -19,6 +20,9 @@ class Database(object):
                     os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
                     'data/multiwoz/db/{}_db.json'.format(domain))) as f:
                 self.dbs[domain] = json.load(f)
+        # lowercased attribute names of every record, to check which constraints apply to it
+        self.record_keys = {domain: [{k.lower() for k in record} for record in table]
+                            for domain, table in self.dbs.items() if isinstance(table, list)}
 
     def query(self, domain, constraints, ignore_open=False, soft_contraints=(), fuzzy_match_ratio=60):
         """Returns the list of entities for a given domain
@@ -42,7 +46,7 @@ class Database(object):
         constraints = list(map(lambda ele: ele if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), constraints))
 
         found = []
-        for i, record in enumerate(self.dbs[domain]):
+        for i, (record, record_keys) in enumerate(zip(self.dbs[domain], self.record_keys[domain])):
             constraints_iterator = zip(constraints, [False] * len(constraints))
             soft_contraints_iterator = zip(soft_contraints, [True] * len(soft_contraints))
             for (key, val), fuzzy_match in chain(constraints_iterator, soft_contraints_iterator):
@@ -50,7 +54,6 @@ class Database(object):
                     pass
                 else:
                     try:
-                        record_keys = [k.lower() for k in record]
                         if key.lower() not in record_keys:
                             continue
                         if key == 'leaveAt':
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap copies of dialogue states.
+
+A dialogue state is handed from the DST to the policy, the environment and the evaluator every turn, and used to be
+protected from later updates with copy.deepcopy. The history makes such copies grow with the dialogue length, so
+copy_state shares whatever the DSTs never modify in place instead:
+
+* history is append-only and its turns are never modified, its copy is a new list of the same turns
+* belief_state, booked, user_action and system_action only contain dicts, lists and immutable values, their
+  containers are copied and the values are shared
+* every other entry (model features, tensors, ...) is still deep-copied
+"""
+from copy import deepcopy
+
+NESTED_STATE_KEYS = ('belief_state', 'booked', 'user_action', 'system_action')
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+
+def copy_nested(value):
+    """
+    copy the dicts and lists of a nested structure (e.g. a belief state or a list of dialog acts), sharing its
+    immutable leaves. Other objects are deep-copied.
+    """
+    if isinstance(value, dict):
+        return {key: copy_nested(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [copy_nested(val) for val in value]
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+    return deepcopy(value)
+
+
+def copy_state(state):
+    """
+    copy a dialogue state so that later updates of the original do not affect the copy, without deep-copying the
+    history. States that are not dicts (e.g. dialog acts when there is no DST) are copied with copy_nested.
+    """
+    if not isinstance(state, dict):
+        return copy_nested(state)
+    new_state = {}
+    for key, value in state.items():
+        if key == 'history' and isinstance(value, list):
+            new_state[key] = list(value)
+        elif key in NESTED_STATE_KEYS:
+            new_state[key] = copy_nested(value)
+        else:
+            new_state[key] = deepcopy(value)
+    return new_state
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+
+class UtteranceTokenCache(object):
+    """
+    Token ids of dialogue context utterances, so that every utterance is only tokenized once.
+
+    The ids of the utterances in a context window are concatenated instead of tokenizing the joined context again
+    every turn. Whether this gives the same ids as tokenizing the joined string is checked on a few probe contexts
+    when the cache is created; if it does not, the joined string is tokenized every turn instead.
+    """
+
+    # (first utterance, second utterance) pairs joined with the separator to check the concatenation
+    probes = [('hello', 'world'), ('i need a cheap hotel.', "what's the area?"), ('ok', ''), ('', 'ok')]
+
+    def __init__(self, tokenizer, separator='', maxsize=10000):
+        """
+        :param tokenizer: huggingface tokenizer
+        :param separator: string between utterances when they are joined
+        :param maxsize: number of utterances to keep, least recently used ones are dropped first
+        """
+        self.tokenizer = tokenizer
+        self.separator = separator
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        # None if concatenating the ids of the utterances differs from tokenizing the joined string
+        self.separator_ids = self._separator_ids()
+
+    def _separator_ids(self):
+        """ids that the separator adds between the ids of two utterances, None if joining changes the ids"""
+        separator_ids = None
+        for first, second in self.probes:
+            first_ids, second_ids = self.encode(first), self.encode(second)
+            joined = self.tokenizer.encode(first + self.separator + second, add_special_tokens=False)
+            middle = joined[len(first_ids):len(joined) - len(second_ids)]
+            if joined != first_ids + middle + second_ids or separator_ids not in (None, middle):
+                return None
+            separator_ids = middle
+        return separator_ids
+
+    def encode(self, text):
+        """token ids of text, without special tokens"""
+        ids = self.cache.get(text)
+        if ids is None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            self.cache[text] = ids
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(text)
+        return ids
+
+    def encode_context(self, utterances, max_length=None):
+        """
+        token ids of the joined utterances with the special tokens of the tokenizer
+        :param max_length: maximum number of ids without special tokens, the first ones are removed when the
+        context is longer
+        """
+        if self.separator_ids is None:
+            ids = self.tokenizer.encode(self.separator.join(utterances), add_special_tokens=False)
+        else:
+            ids = []
+            for i, utterance in enumerate(utterances):
+                if i > 0:
+                    ids.extend(self.separator_ids)
+                ids.extend(self.encode(utterance))
+        if max_length is not None and len(ids) > max_length:
+            ids = ids[len(ids) - max_length:]
+        return self.tokenizer.build_inputs_with_special_tokens(ids)
@@ -1,21 +1,32 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Sequence
 from copy import deepcopy
+from itertools import islice
 from typing import Dict, List, Tuple
 from zipfile import ZipFile
+import hashlib
+import io
 import json
+import mmap
 import os
+import pickle
 import re
+import tempfile
 import importlib
+import inspect
 from abc import ABC, abstractmethod
 from pprint import pprint
-from convlab.util.file_util import cached_path
+from convlab.util.db_registry import SharedInstance
+from convlab.util.file_util import cached_path, get_cache_dir
 import shutil
-from sentence_transformers import SentenceTransformer, util
-import torch
 from tqdm import tqdm
 
 
-class BaseDatabase(ABC):
-    """Base class of unified database. Should override the query function."""
+class BaseDatabase(SharedInstance, ABC):
+    """Base class of unified database. Should override the query function. Instances can be shared between the
+    components of a process with `convlab.util.db_registry.shared_database(load_database, dataset_name)`."""
 
     def __init__(self):
         """extract data.zip and load the database."""
@@ -25,6 +36,88 @@ class BaseDatabase(ABC):
         """return a list of topk entities (dict containing slot-value pairs) for a given domain based on the dialogue state."""
 
 
+def _freeze(obj):
+    """convert (nested) dicts, lists and sets to hashable tuples and frozensets."""
+    if isinstance(obj, dict):
+        return tuple((key, _freeze(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(value) for value in obj)
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(_freeze(value) for value in obj)
+    return obj
+
+
+def _copy_entities(entities):
+    """copy a query result, entities that are not dicts (e.g. read-only `EntityView`s) are shared."""
+    return [deepcopy(entity) if isinstance(entity, dict) else entity for entity in entities]
+
+
+class CachedDatabase(BaseDatabase):
+    """
+    Wrap a database and memoize its query results in a bounded LRU cache.
+
+    The cache key is built from the domain, the constraints of that domain (the belief state format
+    `{domain: {slot: value}}` and the `[[slot, value], ...]` format give the same key), topk and the other query
+    options, passed by position or by name as for the wrapped `query`. Queries of `uncached_domains`, whose results
+    are random (e.g. the taxi phone and colour), always go to the wrapped database. Every call returns copies of the
+    cached entities (read-only entity views are shared), so callers may modify them.
+    Other attributes (`domains`, `dbs`, ...) are forwarded to the wrapped database.
+    """
+
+    def __init__(self, database: BaseDatabase, maxsize=1024, uncached_domains=('taxi',)):
+        self.database = database
+        self.maxsize = maxsize
+        self.uncached_domains = set(uncached_domains)
+        self.query_signature = inspect.signature(database.query)
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        if name == 'database':
+            raise AttributeError(name)
+        return getattr(self.database, name)
+
+    def _make_key(self, domain, state, topk, args, kwargs):
+        # the options of the wrapped query by name, with their defaults, whether they are passed by position or not
+        bound = self.query_signature.bind(domain, state, topk, *args, **kwargs)
+        bound.apply_defaults()
+        options = [(name, value) for name, value in list(bound.arguments.items())[3:]]
+        if isinstance(state, dict) and domain in state:
+            state = state[domain].items()
+        return (domain, _freeze(list(state)), topk, _freeze(options))
+
+    def query(self, domain: str, state: dict, topk: int, *args, **kwargs) -> list:
+        """return the cached result of `database.query` if the same query has been issued before."""
+        if domain in self.uncached_domains:
+            return self.database.query(domain, state, topk, *args, **kwargs)
+        try:
+            key = self._make_key(domain, state, topk, args, kwargs)
+            hash(key)
+        except TypeError:
+            return self.database.query(domain, state, topk, *args, **kwargs)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return _copy_entities(self.cache[key])
+        self.misses += 1
+        result = self.database.query(domain, state, topk, *args, **kwargs)
+        self.cache[key] = result
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return _copy_entities(result)
+
+    def cache_info(self) -> Dict:
+        """return the hit/miss counters and the current size of the cache."""
+        return {'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize, 'currsize': len(self.cache)}
+
+    def cache_clear(self):
+        """empty the cache and reset the counters, e.g. at the start of a new dialogue."""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 def download_unified_datasets(dataset_name, filename, data_dir):
     """
     It downloads the file of unified datasets from HuggingFace's datasets if it doesn't exist in the data directory
@@ -74,7 +167,156 @@ def relative_import_module_from_unified_datasets(dataset_name, filename, names2i
         return variables
 
 
-def load_dataset(dataset_name: str, dial_ids_order=None, split2ratio={}) -> Dict:
+def _iter_json_array(f, chunk_size=1 << 20):
+    """yield the objects of the JSON array in the binary file f, reading it chunk by chunk"""
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(f, encoding='utf-8')
+    buffer = ''
+    while not buffer:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    assert buffer.startswith('['), 'expect a JSON array'
+    pos, eof = 1, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError('need more data', buffer, pos)
+            obj, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the next object is not complete yet
+            if eof:
+                raise
+            chunk = reader.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+
+
+class _SplitCache:
+    """dialogues of one data split in a binary cache file, unpickled on access from the memory-mapped file"""
+
+    def __init__(self, cache_dir, data_split):
+        with open(os.path.join(cache_dir, f'{data_split}.bin'), 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        # offsets of the dialogues in the data file, and their indices in data/dialogues.json
+        self.offsets = array('q')
+        self.dial_idx = array('q')
+        with open(os.path.join(cache_dir, f'{data_split}_offsets.bin'), 'rb') as f:
+            self.offsets.frombytes(f.read())
+        with open(os.path.join(cache_dir, f'{data_split}_dial_idx.bin'), 'rb') as f:
+            self.dial_idx.frombytes(f.read())
+
+    def __len__(self):
+        return len(self.dial_idx)
+
+    def __getitem__(self, i):
+        return pickle.loads(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def get_by_dial_idx(self, dial_idx):
+        i = bisect_left(self.dial_idx, dial_idx)
+        assert i < len(self.dial_idx) and self.dial_idx[i] == dial_idx, f'dialogue {dial_idx} not in the split'
+        return self[i]
+
+
+def build_dataset_cache(dataset_name: str) -> str:
+    """convert `data/dialogues.json` of a unified dataset into a binary cache with one file per data split
+
+    The cache is stored in the user cache directory (`convlab.util.file_util.get_cache_dir`), under the dataset name
+    and the hash of data.zip, and is only built once for every version of the dataset. It is built in a temporary
+    directory first, so that concurrent builds do not write to the same files.
+
+    Args:
+        dataset_name (str): unique dataset name in `data/unified_datasets`
+
+    Returns:
+        cache_dir (str): the directory of the cache
+    """
+    cache_dir = get_cache_dir('unified_datasets', dataset_name, get_dataset_hash(dataset_name)[:16])
+    if os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        return cache_dir
+    os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir))
+    try:
+        files, offsets, dial_idx = {}, {}, {}
+        try:
+            for i, dialogue in enumerate(iter_dialogues(dataset_name)):
+                data_split = dialogue['data_split']
+                if data_split not in files:
+                    files[data_split] = open(os.path.join(tmp_dir, f'{data_split}.bin'), 'wb')
+                    offsets[data_split] = array('q', [0])
+                    dial_idx[data_split] = array('q')
+                files[data_split].write(pickle.dumps(dialogue, protocol=pickle.HIGHEST_PROTOCOL))
+                offsets[data_split].append(files[data_split].tell())
+                dial_idx[data_split].append(i)
+        finally:
+            for f in files.values():
+                f.close()
+        for data_split in files:
+            with open(os.path.join(tmp_dir, f'{data_split}_offsets.bin'), 'wb') as f:
+                offsets[data_split].tofile(f)
+            with open(os.path.join(tmp_dir, f'{data_split}_dial_idx.bin'), 'wb') as f:
+                dial_idx[data_split].tofile(f)
+        # meta.json marks the cache as complete
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'dataset': dataset_name, 'data_splits': {k: len(v) for k, v in dial_idx.items()}}, f)
+        if os.path.isdir(cache_dir) and not os.path.exists(os.path.join(cache_dir, 'meta.json')):
+            # left by an interrupted build
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, cache_dir)
+        except OSError:
+            # another process has built the cache first
+            if not os.path.exists(os.path.join(cache_dir, 'meta.json')):
+                raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+    return cache_dir
+
+
+def _load_dataset_cache(dataset_name: str) -> Dict:
+    cache_dir = build_dataset_cache(dataset_name)
+    meta = json.load(open(os.path.join(cache_dir, 'meta.json')))
+    return {data_split: _SplitCache(cache_dir, data_split) for data_split in meta['data_splits']}
+
+
+def iter_dialogues(dataset_name: str, data_splits=None, use_cache=False):
+    """iterate over the dialogues of a unified dataset without loading the whole dataset into memory
+
+    Args:
+        dataset_name (str): unique dataset name in `data/unified_datasets`
+        data_splits (list): only yield the dialogues of these data splits, all by default
+        use_cache (bool): read the dialogues from the binary cache built by `build_dataset_cache`. The dialogues
+            are then yielded split by split.
+
+    Yields:
+        dialogue (dict)
+    """
+    if use_cache:
+        for data_split, split_cache in _load_dataset_cache(dataset_name).items():
+            if data_splits is None or data_split in data_splits:
+                for i in range(len(split_cache)):
+                    yield split_cache[i]
+        return
+    data_dir = os.path.abspath(os.path.join(os.path.abspath(
+        __file__), f'../../../data/unified_datasets/{dataset_name}'))
+    data_path = download_unified_datasets(dataset_name, 'data.zip', data_dir)
+
+    with ZipFile(data_path) as archive, archive.open('data/dialogues.json') as f:
+        for dialogue in _iter_json_array(f):
+            if data_splits is None or dialogue['data_split'] in data_splits:
+                yield dialogue
+
+
+def load_dataset(dataset_name: str, dial_ids_order=None, split2ratio={}, data_splits=None, use_cache=False) -> Dict:
     """load unified dataset from `data/unified_datasets/$dataset_name`
 
     Args:
@@ -82,28 +324,51 @@ def load_dataset(dataset_name: str, dial_ids_order=None, split2ratio={}) -> Dict
         dial_ids_order (int): idx of shuffled dial order in `data/unified_datasets/$dataset_name/shuffled_dial_ids.json`
         split2ratio (dict): a dictionary that maps the data split to the ratio of the data you want to use. 
             For example, if you want to use only half of the training data, you can set split2ratio = {'train': 0.5}
+        data_splits (list): only load these data splits, e.g. ['test']. All splits by default.
+        use_cache (bool): load the dialogues from a binary cache of the dataset, built on first use. Only the
+            selected dialogues are deserialized.
 
     Returns:
         dataset (dict): keys are data splits and the values are lists of dialogues
     """
     data_dir = os.path.abspath(os.path.join(os.path.abspath(
         __file__), f'../../../data/unified_datasets/{dataset_name}'))
-    data_path = download_unified_datasets(dataset_name, 'data.zip', data_dir)
+    split_caches = _load_dataset_cache(dataset_name) if use_cache else None
 
-    archive = ZipFile(data_path)
-    with archive.open('data/dialogues.json') as f:
-        dialogues = json.loads(f.read())
     dataset = {}
     if dial_ids_order is not None:
         data_path = download_unified_datasets(
             dataset_name, 'shuffled_dial_ids.json', data_dir)
         dial_ids = json.load(open(data_path))[dial_ids_order]
+        # data split and position in the dataset of every selected dialogue
+        selected = {}
         for data_split in dial_ids:
+            if data_splits is not None and data_split not in data_splits:
+                continue
             ratio = split2ratio.get(data_split, 1)
-            dataset[data_split] = [dialogues[i]
-                                   for i in dial_ids[data_split][:round(len(dial_ids[data_split])*ratio)]]
+            split_ids = dial_ids[data_split][:round(len(dial_ids[data_split])*ratio)]
+            dataset[data_split] = [None] * len(split_ids)
+            for j, i in enumerate(split_ids):
+                selected[i] = (data_split, j)
+        if split_caches is not None:
+            for i, (data_split, j) in selected.items():
+                dataset[data_split][j] = split_caches[data_split].get_by_dial_idx(i)
+        else:
+            last = max(selected, default=-1)
+            for i, dialogue in enumerate(iter_dialogues(dataset_name)):
+                if i in selected:
+                    data_split, j = selected[i]
+                    dataset[data_split][j] = dialogue
+                if i == last:
+                    break
+    elif split_caches is not None:
+        for data_split, split_cache in split_caches.items():
+            if data_splits is not None and data_split not in data_splits:
+                continue
+            num = round(len(split_cache)*split2ratio.get(data_split, 1))
+            dataset[data_split] = [split_cache[i] for i in range(num)]
     else:
-        for dialogue in dialogues:
+        for dialogue in iter_dialogues(dataset_name, data_splits):
             if dialogue['data_split'] not in dataset:
                 dataset[dialogue['data_split']] = [dialogue]
             else:
@@ -115,6 +380,25 @@ def load_dataset(dataset_name: str, dial_ids_order=None, split2ratio={}) -> Dict
     return dataset
 
 
+def get_dataset_hash(dataset_name: str) -> str:
+    """return the sha256 of `data/unified_datasets/$dataset_name/data.zip`, identifying the dataset version
+
+    Args:
+        dataset_name (str): unique dataset name in `data/unified_datasets`
+
+    Returns:
+        hash (str): hex digest of the data.zip content
+    """
+    data_dir = os.path.abspath(os.path.join(os.path.abspath(
+        __file__), f'../../../data/unified_datasets/{dataset_name}'))
+    data_path = download_unified_datasets(dataset_name, 'data.zip', data_dir)
+    sha = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
 def load_ontology(dataset_name: str) -> Dict:
     """load unified ontology from `data/unified_datasets/$dataset_name`
 
@@ -134,11 +418,14 @@ def load_ontology(dataset_name: str) -> Dict:
     return ontology
 
 
-def load_database(dataset_name: str):
+def load_database(dataset_name: str, cached=False, cache_size=1024, **kwargs):
     """load database from `data/unified_datasets/$dataset_name`
 
     Args:
         dataset_name (str): unique dataset name in `data/unified_datasets`
+        cached (bool): wrap the database in a `CachedDatabase` that memoizes query results
+        cache_size (int): maximum number of query results kept by the `CachedDatabase`
+        kwargs: passed to the `Database` constructor, e.g. `use_index=True` for multiwoz21
 
     Returns:
         database: an instance of BaseDatabase
@@ -153,11 +440,109 @@ def load_database(dataset_name: str):
     Database = relative_import_module_from_unified_datasets(
         dataset_name, 'database.py', 'Database')
     assert issubclass(Database, BaseDatabase)
-    database = Database()
+    database = Database(**kwargs)
     assert isinstance(database, BaseDatabase)
+    if cached:
+        database = CachedDatabase(database, maxsize=cache_size)
     return database
 
 
+class ContextWindow(Sequence):
+    """read-only view of `turns[start:end]`, where turns is the list of previous turns shared by all samples of a
+    dialogue. The turns are only collected when the window is accessed, it is pickled and deep-copied as a list."""
+    __slots__ = ('turns', 'start', 'end')
+
+    def __init__(self, turns, start, end):
+        self.turns = turns
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.turns[i] for i in range(self.start, self.end)[index]]
+        return self.turns[range(self.start, self.end)[index]]
+
+    def __iter__(self):
+        return islice(self.turns, self.start, self.end)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ContextWindow)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(list(self), memo)
+
+
+def iter_unified_data(
+        dataset, 
+        data_split='all', 
+        speaker='all', 
+        utterance=False, 
+        dialogue_acts=False, 
+        state=False, 
+        db_results=False,
+        delex_utterance=False,
+        use_context=False, 
+        context_window_size=0, 
+        terminated=False, 
+        goal=False, 
+        active_domains=False,
+        split_to_turn=True
+    ):
+    """
+    > Streaming variant of `load_unified_data`, it yields (data_split, sample) pairs one at a time. Unlike
+    `load_unified_data`, the context of a sample is a read-only `ContextWindow` into a turn list shared by the
+    samples of the same dialogue instead of a deep-copied list, so memory does not grow with context_window_size,
+    and the samples share their values (utterances, dialogue acts, states...) with the dataset: copy a value
+    before modifying it in place. The dataset is not modified.
+
+    Takes the same arguments as `load_unified_data`.
+    """
+    data_splits = dataset.keys() if data_split == 'all' else [data_split]
+    assert speaker in ['user', 'system', 'all']
+    assert not use_context or context_window_size > 0
+    info_list = list(filter(eval, ['utterance', 'dialogue_acts', 'state', 'db_results', 'delex_utterance']))
+    info_list += ['utt_idx']
+    for data_split in data_splits:
+        for dialogue in dataset[data_split]:
+            context = []
+            for turn in dialogue['turns']:
+                sample = {'speaker': turn['speaker']}
+                for ele in info_list:
+                    if ele in turn:
+                        sample[ele] = turn[ele]
+
+                if use_context or not split_to_turn:
+                    context.append(dict(sample))
+
+                if split_to_turn and speaker in [turn['speaker'], 'all']:
+                    if use_context:
+                        end = len(context) - 1
+                        sample['context'] = ContextWindow(context, max(end - context_window_size, 0), end)
+                    if goal:
+                        sample['goal'] = dialogue['goal']
+                    if active_domains:
+                        sample['domains'] = dialogue['domains']
+                    if terminated:
+                        sample['terminated'] = turn['utt_idx'] == len(
+                            dialogue['turns']) - 1
+                    if speaker == 'system' and 'booked' in turn:
+                        sample['booked'] = turn['booked']
+                    yield data_split, sample
+            if not split_to_turn:
+                yield data_split, {**dialogue, 'turns': context}
+
+
 def load_unified_data(
         dataset, 
         data_split='all', 
@@ -479,6 +864,8 @@ def retrieve_utterances(query_turns, turn_pool, top_k, model_name):
     :param model_name: the name of the model you want to use
     :return: A list of dictionaries, with a new key 'retrieve_utterances' that is a list of retrieved turns and similarity scores.
     """
+    # sentence_transformers (and torch) are heavy, only import them when retrieving
+    from sentence_transformers import SentenceTransformer, util
     embedder = SentenceTransformer(model_name)
     corpus = [turn['utterance'] for turn in turn_pool]
     corpus_embeddings = embedder.encode(corpus, convert_to_tensor=True)
@@ -1,6 +1,8 @@
 import json
 import os
 import random
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
 from fuzzywuzzy import fuzz
 from itertools import chain
 from zipfile import ZipFile
@@ -8,9 +10,194 @@ from copy import deepcopy
 from convlab.util.unified_datasets_util import BaseDatabase, download_unified_datasets
 
 
+DONTCARE_VALUES = ["", "dont care", 'not mentioned', "don't care", "dontcare", "do n't care", "do not care"]
+
+
+def parse_time(value):
+    """convert 'hh:mm' to hh * 100 + mm, the integer used to compare `leaveAt`/`arriveBy` constraints."""
+    return int(value.split(':')[0]) * 100 + int(value.split(':')[1])
+
+
+def iter_bits(mask):
+    """yield the positions of the set bits of an int bitset in ascending order."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def match_record(record, key, val, fuzzy_match=False, ignore_open=False, fuzzy_match_ratio=60):
+    """whether a db record satisfies the constraint (key, val). Constraints that can not be checked are satisfied."""
+    if val in DONTCARE_VALUES:
+        return True
+    try:
+        if key not in record:
+            return True
+        if key == 'leaveAt':
+            return parse_time(val) <= parse_time(record['leaveAt'])
+        elif key == 'arriveBy':
+            return parse_time(val) >= parse_time(record['arriveBy'])
+        # elif ignore_open and key in ['destination', 'departure', 'name']:
+        elif ignore_open and key in ['destination', 'departure']:
+            return True
+        elif record[key].strip() == '?':
+            # '?' matches any constraint
+            return True
+        elif not fuzzy_match:
+            return val.strip().lower() == record[key].strip().lower()
+        else:
+            return fuzz.partial_ratio(val.strip().lower(), record[key].strip().lower()) >= fuzzy_match_ratio
+    except:
+        return True
+
+
+class EntityView(Mapping):
+    """read-only view of a db record with its `Ref`, materialised into a dict only when copied."""
+
+    __slots__ = ('_record', '_ref')
+
+    def __init__(self, record, ref):
+        self._record = record
+        self._ref = ref
+
+    def __getitem__(self, key):
+        if key == 'Ref':
+            return self._ref
+        return self._record[key]
+
+    def __iter__(self):
+        yield from self._record
+        if 'Ref' not in self._record:
+            yield 'Ref'
+
+    def __len__(self):
+        return len(self._record) + ('Ref' not in self._record)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        res = deepcopy(self._record)
+        res['Ref'] = self._ref
+        return res
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+
+class DomainIndex:
+    """
+    index of one db table that answers `Database.query` without scanning every record.
+    Each constraint is turned into an int bitset of the records it accepts:
+        - exact constraints look up an inverted index from the normalised value to the records holding it
+        - `leaveAt`/`arriveBy` constraints bisect the pre-parsed times and take a cumulative bitset
+        - records missing the slot, holding '?' or a non-string value accept every value, as in the linear scan
+    Soft (fuzzy) constraints are still checked record by record, but only on the records left by the others.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.all_mask = (1 << len(records)) - 1
+        self.wildcard = {}
+        self.postings = {}
+        self.times = {}
+        self.geq_masks = {}
+        self.leq_masks = {}
+        keys = set(chain.from_iterable(records))
+        for key in keys:
+            self.wildcard[key] = 0
+            self.postings[key] = {}
+        for i, record in enumerate(records):
+            bit = 1 << i
+            for key in keys:
+                value = record.get(key)
+                if not isinstance(value, str) or value.strip() == '?':
+                    self.wildcard[key] |= bit
+                else:
+                    norm = value.strip().lower()
+                    self.postings[key][norm] = self.postings[key].get(norm, 0) | bit
+        for key in ['leaveAt', 'arriveBy']:
+            if key in keys:
+                self._build_time_index(key)
+
+    def _build_time_index(self, key):
+        time2mask = {}
+        unparsed = 0
+        for i, record in enumerate(self.records):
+            try:
+                time = parse_time(record[key])
+            except Exception:
+                unparsed |= 1 << i
+                continue
+            time2mask[time] = time2mask.get(time, 0) | (1 << i)
+        times = sorted(time2mask)
+        # leq_masks[j]: records with time <= times[j]; geq_masks[j]: records with time >= times[j]
+        leq_masks, mask = [], 0
+        for time in times:
+            mask |= time2mask[time]
+            leq_masks.append(mask | unparsed)
+        geq_masks, mask = [], 0
+        for time in reversed(times):
+            mask |= time2mask[time]
+            geq_masks.append(mask | unparsed)
+        geq_masks.reverse()
+        self.times[key] = times
+        self.leq_masks[key] = [unparsed] + leq_masks
+        self.geq_masks[key] = geq_masks + [unparsed]
+
+    def match_mask(self, key, val, fuzzy_match=False, ignore_open=False):
+        """
+        return the bitset of records that accept the constraint (key, val),
+        or None for a fuzzy constraint that has to be checked per record.
+        """
+        try:
+            if val in DONTCARE_VALUES or key not in self.postings:
+                return self.all_mask
+            elif key == 'leaveAt':
+                return self.geq_masks[key][bisect_left(self.times[key], parse_time(val))]
+            elif key == 'arriveBy':
+                return self.leq_masks[key][bisect_right(self.times[key], parse_time(val))]
+            elif ignore_open and key in ['destination', 'departure']:
+                return self.all_mask
+            elif fuzzy_match:
+                # match_record accepts every record for a value that is not a string
+                return None if isinstance(val, str) else self.all_mask
+            return self.wildcard[key] | self.postings[key].get(val.strip().lower(), 0)
+        except Exception:
+            return self.all_mask
+
+    def query(self, state, soft_contraints, topk, ignore_open=False, fuzzy_match_ratio=60):
+        mask = self.all_mask
+        fuzzy_constraints = []
+        for key, val in state:
+            mask &= self.match_mask(key, val, False, ignore_open)
+        for key, val in soft_contraints:
+            soft_mask = self.match_mask(key, val, True, ignore_open)
+            if soft_mask is None:
+                fuzzy_constraints.append((key, val))
+            else:
+                mask &= soft_mask
+
+        found = []
+        for i in iter_bits(mask):
+            record = self.records[i]
+            if all(match_record(record, key, val, True, ignore_open, fuzzy_match_ratio) for key, val in fuzzy_constraints):
+                found.append(EntityView(record, '{0:08d}'.format(i)))
+                if len(found) == topk:
+                    return found
+        return found
+
+
 class Database(BaseDatabase):
-    def __init__(self):
-        """extract data.zip and load the database."""
+    def __init__(self, use_index=False):
+        """
+        extract data.zip and load the database.
+        :param use_index: build a `DomainIndex` for every table at load time, so that `query` looks up
+            constraints instead of scanning the table and returns read-only `EntityView`s instead of deep copies.
+        """
         data_path = download_unified_datasets('multiwoz21', 'data.zip', os.path.dirname(os.path.abspath(__file__)))
         archive = ZipFile(data_path)
         self.domains = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'police']
@@ -37,6 +224,29 @@ class Database(BaseDatabase):
             'train id': 'trainID'
         }
 
+        self.indexes = {}
+        if use_index:
+            for domain in ['restaurant', 'hotel', 'attraction', 'train']:
+                self.indexes[domain] = DomainIndex(self.dbs[domain])
+
+    def constraint_masks(self, domain: str, state) -> list:
+        """
+        evaluate every constraint of `state` ([[slot,value], ...]) once against the whole table of `domain`.
+        return a list with one int bitset per constraint, whose i-th bit is set if the i-th record satisfies it.
+        return None for the domains without a table (taxi, police, hospital).
+        """
+        if domain not in ['restaurant', 'hotel', 'attraction', 'train']:
+            return None
+        state = list(map(lambda ele: (self.slot2dbattr.get(ele[0], ele[0]), ele[1]) if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), state))
+        if domain in self.indexes:
+            return [self.indexes[domain].match_mask(key, val) for key, val in state]
+        masks = [0] * len(state)
+        for i, record in enumerate(self.dbs[domain]):
+            for j, (key, val) in enumerate(state):
+                if match_record(record, key, val):
+                    masks[j] |= 1 << i
+        return masks
+
     def query(self, domain: str, state: dict, topk: int, ignore_open=False, soft_contraints=(), fuzzy_match_ratio=60) -> list:
         """
         return a list of topk entities (dict containing slot-value pairs) for a given domain based on the dialogue state.
@@ -68,42 +278,16 @@ class Database(BaseDatabase):
         state = list(map(lambda ele: (self.slot2dbattr.get(ele[0], ele[0]), ele[1]) if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), state))
         soft_contraints = list(map(lambda ele: (self.slot2dbattr.get(ele[0], ele[0]), ele[1]) if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), soft_contraints))
 
+        if domain in self.indexes:
+            return self.indexes[domain].query(state, soft_contraints, topk, ignore_open, fuzzy_match_ratio)
+
         found = []
         for i, record in enumerate(self.dbs[domain]):
             constraints_iterator = zip(state, [False] * len(state))
             soft_contraints_iterator = zip(soft_contraints, [True] * len(soft_contraints))
             for (key, val), fuzzy_match in chain(constraints_iterator, soft_contraints_iterator):
-                if val in ["", "dont care", 'not mentioned', "don't care", "dontcare", "do n't care", "do not care"]:
-                    pass
-                else:
-                    try:
-                        if key not in record:
-                            continue
-                        if key == 'leaveAt':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['leaveAt'].split(':')[0]) * 100 + int(record['leaveAt'].split(':')[1])
-                            if val1 > val2:
-                                break
-                        elif key == 'arriveBy':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['arriveBy'].split(':')[0]) * 100 + int(record['arriveBy'].split(':')[1])
-                            if val1 < val2:
-                                break
-                        # elif ignore_open and key in ['destination', 'departure', 'name']:
-                        elif ignore_open and key in ['destination', 'departure']:
-                            continue
-                        elif record[key].strip() == '?':
-                            # '?' matches any constraint
-                            continue
-                        else:
-                            if not fuzzy_match:
-                                if val.strip().lower() != record[key].strip().lower():
-                                    break
-                            else:
-                                if fuzz.partial_ratio(val.strip().lower(), record[key].strip().lower()) < fuzzy_match_ratio:
-                                    break
-                    except:
-                        continue
+                if not match_record(record, key, val, fuzzy_match, ignore_open, fuzzy_match_ratio):
+                    break
             else:
                 res = deepcopy(record)
                 res['Ref'] = '{0:08d}'.format(i)
@@ -121,5 +305,8 @@ if __name__ == '__main__':
     res1 = db.query("restaurant", [['price range', 'expensive']], topk=3)
     res2 = db.query("restaurant", {'restaurant':{'price range': 'expensive'}}, topk=3)
     assert res1 == res2
+    # the indexed engine returns the same entities
+    indexed_db = Database(use_index=True)
+    assert indexed_db.query("restaurant", [['price range', 'expensive']], topk=3) == res1
     print(res1, len(res1))
     # print(db.query("hotel", [['price range', 'moderate'], ['stars','4'], ['type', 'guesthouse'], ['internet', 'yes'], ['parking', 'no'], ['area', 'east']]))
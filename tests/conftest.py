@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+sys.path.insert(0, ROOT)
+# the deploy service imports its modules as `deploy.*`, see convlab/deploy/run.py
+sys.path.append(os.path.join(ROOT, 'convlab'))
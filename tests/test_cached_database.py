@@ -0,0 +1,48 @@
+from convlab.util.unified_datasets_util import BaseDatabase, CachedDatabase
+
+
+class CountingDatabase(BaseDatabase):
+    def __init__(self):
+        self.calls = 0
+
+    def query(self, domain, state, topk, ignore_open=False, soft_contraints=(), fuzzy_match_ratio=60):
+        self.calls += 1
+        if isinstance(state, dict):
+            state = state[domain].items()
+        return [{'name': 'entity %d' % i, 'state': list(state), 'ignore_open': ignore_open} for i in range(topk)]
+
+
+def test_query_formats_share_the_cache():
+    db = CachedDatabase(CountingDatabase())
+    res1 = db.query('hotel', [['area', 'north']], 2)
+    res2 = db.query('hotel', {'hotel': {'area': 'north'}}, 2)
+    assert res1 == res2 and db.database.calls == 1
+    assert db.cache_info()['hits'] == 1
+
+
+def test_positional_and_keyword_options():
+    db = CachedDatabase(CountingDatabase())
+    res1 = db.query('hotel', [['area', 'north']], 1, True)
+    res2 = db.query('hotel', [['area', 'north']], 1, ignore_open=True)
+    assert res1 == res2 and res1[0]['ignore_open'] is True and db.database.calls == 1
+    # the default value is the same query as no value
+    db.query('hotel', [['area', 'north']], 1)
+    db.query('hotel', [['area', 'north']], 1, ignore_open=False)
+    assert db.database.calls == 2
+
+
+def test_results_can_be_modified():
+    db = CachedDatabase(CountingDatabase())
+    res = db.query('hotel', [['area', 'north']], 1)
+    res[0]['name'] = 'modified'
+    res[0]['state'].append(('stars', '4'))
+    res.append({'name': 'new'})
+    assert db.query('hotel', [['area', 'north']], 1) == [{'name': 'entity 0', 'state': [['area', 'north']],
+                                                          'ignore_open': False}]
+
+
+def test_uncached_domains():
+    db = CachedDatabase(CountingDatabase())
+    db.query('taxi', [], 1)
+    db.query('taxi', [], 1)
+    assert db.database.calls == 2 and db.cache_info()['currsize'] == 0
@@ -0,0 +1,61 @@
+import io
+import json
+import os
+
+import pytest
+
+from convlab.util import unified_datasets_util
+from convlab.util.unified_datasets_util import _iter_json_array, build_dataset_cache, iter_dialogues
+
+DIALOGUES = [{'dialogue_id': f'{split}-{i}', 'data_split': split, 'turns': [{'utterance': 'a "quoted" [text]'}]}
+             for i, split in enumerate(['train', 'test', 'train', 'validation', 'test'])]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1 << 20])
+@pytest.mark.parametrize('text', [json.dumps(DIALOGUES), json.dumps(DIALOGUES, indent=2), '  \n' + json.dumps(DIALOGUES)])
+def test_iter_json_array(text, chunk_size):
+    assert list(_iter_json_array(io.BytesIO(text.encode()), chunk_size)) == DIALOGUES
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1 << 20])
+def test_iter_json_array_empty(chunk_size):
+    assert list(_iter_json_array(io.BytesIO(b' [ ] '), chunk_size)) == []
+    assert list(_iter_json_array(io.BytesIO(b'[]'), chunk_size)) == []
+
+
+def test_iter_json_array_truncated():
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_json_array(io.BytesIO(json.dumps(DIALOGUES)[:-20].encode()), 16))
+
+
+@pytest.fixture
+def fake_dataset(monkeypatch, tmp_path):
+    monkeypatch.setenv('CONVLAB_CACHE', str(tmp_path))
+    monkeypatch.setattr(unified_datasets_util, 'get_dataset_hash', lambda dataset_name: '0123456789abcdef0123')
+    original = unified_datasets_util.iter_dialogues
+
+    def fake_iter_dialogues(dataset_name, data_splits=None, use_cache=False):
+        if use_cache:
+            return original(dataset_name, data_splits, use_cache)
+        return iter(DIALOGUES)
+    monkeypatch.setattr(unified_datasets_util, 'iter_dialogues', fake_iter_dialogues)
+    return tmp_path
+
+
+def test_build_dataset_cache(fake_dataset):
+    cache_dir = build_dataset_cache('fake')
+    assert cache_dir == os.path.join(str(fake_dataset), 'unified_datasets', 'fake', '0123456789abcdef')
+    # only the complete cache is left
+    assert os.listdir(os.path.dirname(cache_dir)) == ['0123456789abcdef']
+    assert build_dataset_cache('fake') == cache_dir
+    by_split = sorted(DIALOGUES, key=lambda dialogue: ['train', 'test', 'validation'].index(dialogue['data_split']))
+    assert list(iter_dialogues('fake', use_cache=True)) == by_split
+    assert list(iter_dialogues('fake', data_splits=['test'], use_cache=True)) == DIALOGUES[1::3]
+
+
+def test_build_dataset_cache_replaces_interrupted_build(fake_dataset):
+    cache_dir = os.path.join(str(fake_dataset), 'unified_datasets', 'fake', '0123456789abcdef')
+    os.makedirs(cache_dir)
+    open(os.path.join(cache_dir, 'train.bin'), 'wb').close()
+    assert build_dataset_cache('fake') == cache_dir
+    assert os.path.exists(os.path.join(cache_dir, 'meta.json'))
@@ -0,0 +1,83 @@
+from deploy.ctrl.session import SessionCtrl, decode_session, diff, encode_session, patch
+from deploy.utils import MemoryStore
+
+
+def _turn(i, dst='state', history_len=None):
+    history_len = 2 * i + 2 if history_len is None else history_len
+    return {
+        'data': 'utterance %d' % i, 'input_module': 'nlu',
+        'modified_output': {'nlu': None, 'dst': dst, 'policy': None, 'nlg': None},
+        'cache': {'nlu': None, 'dst': {'history': [['usr', str(j)] for j in range(history_len)],
+                                       'belief_state': {'hotel': {'area': 'north' if i else ''}}},
+                  'policy': None, 'nlg': None},
+        'context': {'usr': 'utterance %d' % i, 'sys': 'reply %d' % i},
+        'return': {'nlu': [], 'dst': None, 'policy': [], 'nlg': 'reply %d' % i}
+    }
+
+
+def _session(num_turns):
+    return {'model_map': {'nlu': 'bert', 'dst': 'rule', 'policy': None, 'nlg': None},
+            'turns': [_turn(i) for i in range(num_turns)]}
+
+
+def test_diff_patch_round_trip():
+    old, new = _turn(0), _turn(1)
+    new['cache']['policy'] = {'new': [1, 2]}
+    del new['return']['nlg']
+    assert patch(old, diff(old, new)) == new
+    assert patch(None, diff(None, new)) == new
+
+
+def test_encode_decode_round_trip():
+    session = _session(5)
+    assert decode_session(encode_session(session)) == session
+    assert decode_session(encode_session({'model_map': {}, 'turns': []})) == {'model_map': {}, 'turns': []}
+
+
+def test_decoded_turns_are_independent():
+    turns = decode_session(encode_session(_session(3)))['turns']
+    turns[-1]['modified_output']['dst'] = 'modified'
+    turns[-1]['cache']['dst']['history'].append(['sys', 'new'])
+    turns[-1]['cache']['dst']['history'][0][1] = 'changed'
+    assert turns[0]['modified_output']['dst'] == 'state'
+    assert turns[1]['modified_output']['dst'] == 'state'
+    assert turns[1]['cache']['dst']['history'] == [['usr', str(j)] for j in range(4)]
+
+
+def test_modify_last_round_trip():
+    sessions = SessionCtrl(store=MemoryStore())
+    token = sessions.new_session('bert', 'rule', None, None)
+    session = sessions.get_session(token)
+    session['turns'] = [_turn(0), _turn(1)]
+    sessions.set_session(token, session)
+
+    # as ServerCtrl.on_modify_last
+    session = sessions.get_session(token)
+    last_turn = session['turns'][-1]
+    session['turns'] = session['turns'][:-1]
+    last_turn['modified_output']['dst'] = 'modified'
+    session['turns'].append(last_turn)
+    sessions.set_session(token, session)
+
+    turns = sessions.get_session(token)['turns']
+    assert turns[0] == _turn(0)
+    assert turns[1]['modified_output']['dst'] == 'modified'
+
+
+def test_rollback_round_trip():
+    sessions = SessionCtrl(store=MemoryStore())
+    token = sessions.new_session('bert', 'rule', None, None)
+    session = sessions.get_session(token)
+    session['turns'] = [_turn(i) for i in range(4)]
+    sessions.set_session(token, session)
+
+    # as ServerCtrl.on_rollback
+    session = sessions.get_session(token)
+    session['turns'] = session['turns'][:-2]
+    sessions.set_session(token, session)
+    assert sessions.get_session(token)['turns'] == [_turn(0), _turn(1)]
+
+    session = sessions.get_session(token)
+    session['turns'].append(_turn(2, dst='again'))
+    sessions.set_session(token, session)
+    assert sessions.get_session(token)['turns'] == [_turn(0), _turn(1), _turn(2, dst='again')]
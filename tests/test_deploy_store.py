@@ -0,0 +1,41 @@
+import os
+
+from deploy.utils import MemoryStore, SQLiteStore
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_items=2)
+    store['a'] = b'1'
+    store['b'] = b'2'
+    assert store['a'] == b'1'
+    store['c'] = b'3'
+    assert set(store.keys()) == {'a', 'c'}
+    assert store.pop_expire() == {'b': b'2'}
+    assert store.pop_expire() == {}
+
+
+def test_memory_store_byte_limit():
+    store = MemoryStore(max_bytes=5)
+    store['a'] = b'123'
+    store['b'] = b'456'
+    assert 'a' not in store and store.num_bytes == 3
+    # the session being set is kept even if it is larger than the limit
+    store['c'] = b'1234567'
+    assert list(store.keys()) == ['c']
+
+
+def test_sqlite_store_is_per_process(tmp_path):
+    path = str(tmp_path / 'sessions-{pid}.db')
+    store = SQLiteStore(path)
+    assert store.path == str(tmp_path / ('sessions-%d.db' % os.getpid()))
+    store['a'] = b'1'
+    assert 'a' in store and store['a'] == b'1' and len(store) == 1
+    # sessions of a previous process are dropped, their models are not loaded
+    assert len(SQLiteStore(path)) == 0
+
+
+def test_sqlite_store_expire(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'sessions.db'), expire_sec=-1)
+    store['a'] = b'1'
+    assert store.pop_expire() == {'a': b'1'}
+    assert len(store) == 0
@@ -0,0 +1,46 @@
+import os
+import pickle
+
+import pytest
+
+from convlab.task.multiwoz import goal_bank
+from convlab.task.multiwoz.goal_bank import GoalBank, load_goal_bank
+
+GOALS = [{'domain_ordering': ('hotel',), 'hotel': {'info': {'area': 'north', 'stars': str(i)}}} for i in range(5)]
+
+
+@pytest.fixture
+def fake_generator(monkeypatch):
+    def build_goal_bank(path, seeds, single_domains=False, allowed_domains=None, generator_kwargs=None):
+        # the file layout of goal_bank.build_goal_bank, without loading the goal model
+        from array import array
+        offsets = array('q', [0])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for seed in seeds:
+                f.write(pickle.dumps(GOALS[seed]))
+                offsets.append(f.tell())
+            offsets.tofile(f)
+            array('q', [len(offsets) - 1]).tofile(f)
+    monkeypatch.setattr(goal_bank, 'build_goal_bank', build_goal_bank)
+    monkeypatch.setattr(goal_bank, 'goal_bank_key', lambda seeds, *args: 'key-' + '-'.join(map(str, seeds)))
+
+
+def test_goal_bank_in_user_cache_dir(fake_generator, monkeypatch, tmp_path):
+    monkeypatch.setenv('CONVLAB_CACHE', str(tmp_path))
+    with load_goal_bank(range(5)) as bank:
+        assert bank.path == str(tmp_path / 'goal_banks' / 'key-0-1-2-3-4.bin')
+        assert list(bank) == GOALS and bank[-1] == GOALS[-1] and bank[1:3] == GOALS[1:3]
+        assert pickle.loads(pickle.dumps(bank))[2] == GOALS[2]
+    assert bank.data.closed
+
+
+def test_goal_bank_dir(fake_generator, tmp_path):
+    bank = load_goal_bank([3, 1], bank_dir=str(tmp_path))
+    assert bank.path == str(tmp_path / 'key-3-1.bin') and list(bank) == [GOALS[3], GOALS[1]]
+    bank.close()
+    # goals are copies
+    bank = GoalBank(str(tmp_path / 'key-3-1.bin'))
+    bank[0]['hotel']['info']['area'] = 'south'
+    assert bank[0] == GOALS[3]
+    bank.close()
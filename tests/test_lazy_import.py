@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from convlab.lazy_import import lazy_module
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+HEAVY_MODULES = ['torch', 'transformers', 'nltk', 'sentence_transformers', 'boto3', 'requests']
+
+# statement -> import time budget in seconds
+IMPORT_BUDGETS = {
+    'import convlab': 0.5,
+    'from convlab.dst.rule.multiwoz import RuleDST': 1.5,
+    'import convlab.policy.ppo, convlab.policy.gdpl, convlab.policy.pg, convlab.policy.mle, convlab.policy.dqn, '
+    'convlab.policy.vtrace_DPT, convlab.base_models.llm': 1.5,
+}
+
+TIMER = '''import json, sys, time
+start = time.perf_counter()
+{}
+print(json.dumps([time.perf_counter() - start, [m for m in {} if m in sys.modules]]))'''
+
+
+def run_import(statement):
+    """import time in seconds of statement in a fresh interpreter, and the heavy modules it imported"""
+    output = subprocess.run([sys.executable, '-c', TIMER.format(statement, HEAVY_MODULES)], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('statement', list(IMPORT_BUDGETS))
+def test_imports_are_cheap(statement):
+    runs = [run_import(statement) for _ in range(3)]
+    assert runs[0][1] == []
+    assert min(seconds for seconds, _ in runs) <= IMPORT_BUDGETS[statement]
+
+
+def test_lazy_module():
+    module = types.ModuleType('lazy_test_package')
+    module.__all__ = ['VERSION']
+    sys.modules[module.__name__] = module
+    try:
+        module.__getattr__, module.__dir__ = lazy_module(module.__name__, {'dumps': 'json'})
+        assert module.__all__ == ['dumps', 'VERSION']
+        assert 'dumps' not in vars(module)
+        assert 'dumps' in dir(module)
+        assert module.dumps is json.dumps
+        assert vars(module)['dumps'] is json.dumps
+        with pytest.raises(AttributeError):
+            module.loads
+    finally:
+        del sys.modules[module.__name__]
+
+
+def test_package_attributes():
+    import convlab
+    import convlab.policy.gdpl as gdpl
+    assert gdpl.__all__ == ['GDPL', 'RewardEstimator']
+    assert 'RewardEstimator' in dir(gdpl)
+    assert convlab.__all__[-2:] == ['get_root_path', 'DATA_ROOT']
+    assert 'PipelineAgent' in convlab.__all__
@@ -0,0 +1,130 @@
+import importlib.util
+import json
+import os
+import random
+import zipfile
+
+import pytest
+
+pytest.importorskip('fuzzywuzzy')
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+DOMAINS = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'police']
+
+
+@pytest.fixture(scope='module')
+def database_module(tmp_path_factory):
+    """data/unified_datasets/multiwoz21/database.py, reading the tables of data/multiwoz/db instead of data.zip"""
+    spec = importlib.util.spec_from_file_location(
+        'multiwoz21_database', os.path.join(ROOT, 'data/unified_datasets/multiwoz21/database.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    data_path = str(tmp_path_factory.mktemp('multiwoz21') / 'data.zip')
+    with zipfile.ZipFile(data_path, 'w') as archive:
+        for domain in DOMAINS:
+            archive.write(os.path.join(ROOT, f'data/multiwoz/db/{domain}_db.json'), f'data/{domain}_db.json')
+    module.download_unified_datasets = lambda dataset_name, filename, data_dir: data_path
+    return module
+
+
+@pytest.fixture(scope='module')
+def databases(database_module):
+    return database_module.Database(), database_module.Database(use_index=True)
+
+
+def random_constraints(db, domain, rng, max_constraints=4):
+    """constraints taken from the values of the table, with some unknown, dontcare and non-string values"""
+    records = db.dbs[domain]
+    slots = sorted({key for record in records for key, value in record.items() if isinstance(value, str)})
+    constraints = []
+    for slot in rng.sample(slots, rng.randint(1, min(max_constraints, len(slots)))):
+        choice = rng.random()
+        if choice < 0.6:
+            value = rng.choice(records).get(slot, 'unknown')
+            value = value.upper() + ' ' if rng.random() < 0.2 and isinstance(value, str) else value
+        elif choice < 0.7:
+            value = 'unknown value'
+        elif choice < 0.8:
+            value = rng.choice(['dontcare', "don't care", ''])
+        elif choice < 0.9:
+            value = rng.choice([4, None, '25:99', 'soon'])
+        else:
+            value = '%02d:%02d' % (rng.randint(5, 23), rng.choice([0, 15, 30, 45]))
+        slot = {'pricerange': 'price range', 'arriveBy': 'arrive by', 'leaveAt': 'leave at'}.get(slot, slot)
+        constraints.append([slot, value])
+    return constraints
+
+
+@pytest.mark.parametrize('domain', ['restaurant', 'hotel', 'attraction', 'train'])
+def test_indexed_query_matches_linear_scan(databases, domain):
+    db, indexed_db = databases
+    rng = random.Random(0)
+    for _ in range(200):
+        state = random_constraints(db, domain, rng)
+        soft = random_constraints(db, domain, rng, 2) if rng.random() < 0.3 else []
+        topk = rng.choice([1, 3, 10 ** 6])
+        ignore_open = rng.random() < 0.3
+        expected = db.query(domain, state, topk, ignore_open=ignore_open, soft_contraints=soft)
+        result = indexed_db.query(domain, state, topk, ignore_open=ignore_open, soft_contraints=soft)
+        assert [dict(entity) for entity in result] == expected, (state, soft, topk, ignore_open)
+
+
+def test_indexed_query_returns_read_only_views(databases):
+    db, indexed_db = databases
+    entity = indexed_db.query('hotel', [['area', 'north']], 1)[0]
+    with pytest.raises(TypeError):
+        entity['area'] = 'south'
+    copied = entity.copy()
+    copied['price']['single'] = '0'
+    assert indexed_db.query('hotel', [['area', 'north']], 1)[0] == db.query('hotel', [['area', 'north']], 1)[0]
+
+
+def test_non_string_soft_constraint(databases):
+    db, indexed_db = databases
+    for value in [4, None, ['north']]:
+        expected = db.query('hotel', [], 10 ** 6, soft_contraints=[['area', value]])
+        assert len(expected) == len(db.dbs['hotel'])
+        assert [dict(e) for e in indexed_db.query('hotel', [], 10 ** 6, soft_contraints=[['area', value]])] == expected
+
+
+@pytest.mark.parametrize('domain', ['restaurant', 'hotel', 'attraction', 'train'])
+def test_constraint_masks_match_query(databases, domain):
+    db, indexed_db = databases
+    rng = random.Random(1)
+    for _ in range(200):
+        state = random_constraints(db, domain, rng)
+        masks = indexed_db.constraint_masks(domain, state)
+        assert masks == db.constraint_masks(domain, state), state
+        found = -1
+        for mask in masks:
+            found &= mask
+        expected = [int(entity['Ref']) for entity in db.query(domain, state, 10 ** 6)]
+        assert [i for i in range(len(db.dbs[domain])) if found >> i & 1] == expected, state
+
+
+def test_constraint_masks_without_table(databases):
+    for db in databases:
+        assert db.constraint_masks('taxi', [['leave at', '10:00']]) is None
+        assert db.constraint_masks('police', []) is None
+
+
+@pytest.mark.parametrize('domain', ['restaurant', 'hotel', 'attraction', 'train'])
+def test_find_nooffer_slot_from_masks_matches_query_search(databases, domain):
+    np = pytest.importorskip('numpy')
+    VectorBase = pytest.importorskip('convlab.policy.vector.vector_base').VectorBase
+
+    class QueryOnlyDatabase:
+        def __init__(self, db):
+            self.query = db.query
+
+    db, indexed_db = databases
+    rng = random.Random(2)
+    for _ in range(100):
+        state = {domain: dict(random_constraints(db, domain, rng, 6))}
+        results = []
+        for database in [QueryOnlyDatabase(db), indexed_db]:
+            vector = VectorBase.__new__(VectorBase)
+            vector.db, vector.state = database, state
+            np.random.seed(0)
+            results.append(vector.find_nooffer_slot(domain))
+        assert results[0] == results[1], state
@@ -0,0 +1,294 @@
+import random
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+multiwoz_eval = pytest.importorskip('convlab.evaluator.multiwoz_eval')
+goal_generator = pytest.importorskip('convlab.task.multiwoz.goal_generator')
+policy_agenda = pytest.importorskip('convlab.policy.rule.multiwoz.policy_agenda_multiwoz')
+
+from convlab.evaluator.multiwoz_eval import MultiWozEvaluator, belief_domains, mapping, requestable
+
+DOMAINS = list(belief_domains)
+TABLE_DOMAINS = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'police']
+# db attribute -> slot of the unified system acts
+UNIFIED_SLOT = {'trainID': 'train id', 'leaveAt': 'leave at', 'arriveBy': 'arrive by', 'pricerange': 'price range',
+                'car type': 'type'}
+JUNK_VALUES = ['centre', 'north', '12:30', '25:00', 'none', '?', 'dontcare', '', '01223 1', '01223351880', 'cheap',
+               'cb21ab', 'cb 2', 'tr1234', '5', 'yes', '4 pounds', '40 minutes', 'monday']
+
+
+class BaselineMultiWozEvaluator(MultiWozEvaluator):
+    """MultiWozEvaluator computing the success components from the whole dialogue on every call, as it used to"""
+
+    def _query_goal(self, domain, constraints):
+        return self.database.query(domain, constraints)
+
+    def _inform_F1_goal(self, goal, sys_history, domains=None):
+        if domains is None:
+            domains = belief_domains
+        inform_slot = {}
+        for domain in domains:
+            inform_slot[domain] = set()
+        TP, FP, FN = 0, 0, 0
+
+        inform_not_reqt = set()
+        reqt_not_inform = set()
+        bad_inform = set()
+        for da in sys_history:
+            domain, intent, slot, value = da.split('_', 3)
+            if intent in ['inform', 'recommend', 'offerbook', 'offerbooked'] and \
+                    domain in domains and slot in mapping[domain] and value.strip() not in multiwoz_eval.NUL_VALUE:
+                key = mapping[domain][slot]
+                if self._check_value(domain, key, value):
+                    inform_slot[domain].add(key)
+                else:
+                    bad_inform.add((intent, domain, key))
+                    FP += 1
+        for domain in domains:
+            for k in goal[domain]['reqt']:
+                if k in inform_slot[domain]:
+                    TP += 1
+                else:
+                    reqt_not_inform.add(('request', domain, k))
+                    FN += 1
+            for k in inform_slot[domain]:
+                if k not in goal[domain]['reqt'] \
+                        and k not in goal[domain]['info'] \
+                        and k in requestable[domain]:
+                    inform_not_reqt.add(('inform', domain, k,))
+                    FP += 1
+        return TP, FP, FN, bad_inform, reqt_not_inform, inform_not_reqt
+
+    def task_success(self, ref2goal=True):
+        booking_done = self.check_booking_done(ref2goal)
+        book_sess = self.book_rate(ref2goal)
+        book_constraint_sess = self.book_rate_constrains(ref2goal)
+        inform_sess = self.inform_F1(ref2goal)
+        goal_sess = self.final_goal_analyze()
+
+        if ((book_sess == 1 and inform_sess[1] == 1)
+            or (book_sess == 1 and inform_sess[1] is None)
+            or (book_sess is None and inform_sess[1] == 1)) \
+                and goal_sess == 1:
+            self.complete = 1
+            self.success = 1
+            self.success_strict = 1 if (
+                book_constraint_sess == 1 or book_constraint_sess is None) else 0
+            return self.success if not self.check_book_constraints else self.success_strict
+        else:
+            self.complete = 1 if booking_done and (
+                inform_sess[1] == 1 or inform_sess[1] is None) else 0
+            self.success = 0
+            self.success_strict = 0
+            return 0
+
+    def domain_success(self, domain, ref2goal=True):
+        if domain not in self.goal:
+            return None
+
+        if ref2goal:
+            goal = {}
+            goal[domain] = self._expand(self.goal)[domain]
+        else:
+            goal = {}
+            goal[domain] = {'info': {}, 'book': {}, 'reqt': []}
+            if 'book' in self.goal[domain]:
+                goal[domain]['book'] = self.goal[domain]['book']
+            for da in self.usr_da_array:
+                d, i, s, v = da.split('_', 3)
+                if d != domain:
+                    continue
+                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
+                    goal[d]['info'][mapping[d][s]] = v
+                elif i == 'request':
+                    goal[d]['reqt'].append(s)
+
+        book_constraints = self._book_goal_constraints(
+            goal, self.booked_states, [domain])
+        book_constraints = np.mean(
+            book_constraints) if book_constraints else None
+
+        book_rate = self._book_rate_goal(goal, self.booked, [domain])
+        book_rate = np.mean(book_rate) if book_rate else None
+        match, mismatch = self._final_goal_analyze_domain(domain)
+        goal_sess = 1 if (match == 0 and mismatch ==
+                          0) else match / (match + mismatch)
+
+        inform = self._inform_F1_goal(goal, self.sys_da_array, [domain])
+        try:
+            inform_rec = inform[0] / (inform[0] + inform[2])
+        except ZeroDivisionError:
+            inform_rec = None
+
+        if ((book_rate == 1 and inform_rec == 1) or (book_rate == 1 and inform_rec is None) or
+                (book_rate is None and inform_rec == 1)) and goal_sess == 1:
+            domain_success = 1
+            domain_strict_success = 1 if (
+                book_constraints == 1 or book_constraints is None) else 0
+            return domain_success if not self.check_book_constraints else domain_strict_success
+        else:
+            return 0
+
+    def _final_goal_analyze_domain(self, domain):
+        match = mismatch = 0
+        if domain in self.goal:
+            dom_goal_dict = self.goal[domain]
+        else:
+            return match, mismatch
+        reqt_constraints = list(dom_goal_dict['reqt'].items()) if 'reqt' in dom_goal_dict else []
+        info_constraints = list(dom_goal_dict['info'].items()) if 'info' in dom_goal_dict else []
+        query_result = self.database.query(
+            domain, info_constraints + reqt_constraints)
+        if not query_result:
+            mismatch += 1
+
+        booked = self.booked[domain]
+        if not self.goal[domain].get('book'):
+            match += 1
+        elif isinstance(booked, dict):
+            ref = booked['Ref']
+            if any(found['Ref'] == ref for found in query_result):
+                match += 1
+            else:
+                mismatch += 1
+        else:
+            match += 1
+        return match, mismatch
+
+    def _final_goal_analyze(self):
+        match = mismatch = 0
+        for domain, dom_goal_dict in self.goal.items():
+            reqt_constraints = list(dom_goal_dict['reqt'].items()) if 'reqt' in dom_goal_dict else []
+            info_constraints = list(dom_goal_dict['info'].items()) if 'info' in dom_goal_dict else []
+            query_result = self.database.query(
+                domain, info_constraints + reqt_constraints)
+            if not query_result:
+                mismatch += 1
+                continue
+
+            booked = self.booked[domain]
+            if not self.goal[domain].get('book'):
+                match += 1
+            elif isinstance(booked, dict):
+                ref = booked['Ref']
+                if any(found['Ref'] == ref for found in query_result):
+                    match += 1
+                else:
+                    mismatch += 1
+            else:
+                match += 1
+        return match, mismatch
+
+
+def random_value(rng, domain, key, entity):
+    if entity is not None and key in entity and rng.random() < 0.85:
+        return str(entity[key])
+    if domain == 'taxi' and rng.random() < 0.7:
+        return rng.choice(['toyota', '07123456789'])
+    return rng.choice(JUNK_VALUES)
+
+
+def make_dialogue(rng, goal, database):
+    """a dialogue of random system and user acts around the goal, with bookings of entities matching it or not"""
+    entities = {}
+    for domain in DOMAINS:
+        if domain in TABLE_DOMAINS:
+            found = database.query(domain, list(goal.get(domain, {}).get('info', {}).items()))
+            if not found or rng.random() < 0.2:
+                found = [dict(record, Ref='%08d' % i) for i, record in enumerate(database.dbs[domain])]
+            entities[domain] = rng.choice(found)
+        else:
+            entities[domain] = None
+    turns = []
+    for _ in range(rng.randint(1, 20)):
+        sys_acts = []
+        for _ in range(rng.randint(0, 4)):
+            domain = rng.choice(list(goal)) if rng.random() < 0.8 else rng.choice(DOMAINS)
+            entity = entities[domain]
+            keys = list(goal.get(domain, {}).get('reqt', {})) + list(mapping[domain].values())
+            key = rng.choice(keys)
+            slot = UNIFIED_SLOT.get(key, key.lower())
+            intent = rng.choices(['inform', 'recommend', 'offerbook', 'book', 'request', 'nooffer', 'reqmore'],
+                                 [10, 2, 1, 3, 2, 1, 1])[0]
+            if intent == 'book':
+                ref = entity.get('Ref') if entity is not None and rng.random() < 0.8 else None
+                ref = ref or rng.choice(['', '00000001', '1'])
+                if ref and rng.random() < 0.3:
+                    sys_acts.append(['inform', domain, 'ref', ref])
+                    ref = ''
+                sys_acts.append(['book', domain, '', ref])
+            elif intent == 'request':
+                sys_acts.append(['request', domain, slot, ''])
+            elif intent == 'reqmore':
+                sys_acts.append(['reqmore', 'general', '', ''])
+            else:
+                sys_acts.append([intent, domain, slot, random_value(rng, domain, key, entity)])
+        belief_state = None
+        if rng.random() < 0.8:
+            belief_state = {}
+            for domain in DOMAINS:
+                book = goal.get(domain, {}).get('book', {})
+                belief_state[domain] = {f'book {slot}': value if rng.random() < 0.8 else rng.choice(JUNK_VALUES)
+                                        for slot, value in book.items()}
+                if rng.random() < 0.1:
+                    belief_state[domain] = {'area': 'north'}
+        usr_acts = []
+        for domain, domain_goal in goal.items():
+            for key, value in domain_goal.get('info', {}).items():
+                if rng.random() < 0.2:
+                    usr_acts.append(['inform', domain, UNIFIED_SLOT.get(key, key.lower()), value])
+            for key in domain_goal.get('reqt', {}):
+                if rng.random() < 0.1:
+                    usr_acts.append(['request', domain, UNIFIED_SLOT.get(key, key.lower()), ''])
+        turns.append((sys_acts, belief_state, usr_acts))
+    return turns
+
+
+def replay(evaluator, goal, turns, seed):
+    """outputs of the evaluator after every turn, and the random state at the end (taxi queries are sampled)"""
+    random.seed(seed)
+    evaluator.add_goal(goal)
+    outputs = []
+    for i, (sys_acts, belief_state, usr_acts) in enumerate(turns):
+        evaluator.add_sys_da(sys_acts, belief_state)
+        evaluator.add_usr_da(usr_acts)
+        outputs.append((
+            evaluator.get_reward(terminated=i == len(turns) - 1),
+            list(evaluator.successful_domains),
+            evaluator.task_success(), evaluator.complete, evaluator.success, evaluator.success_strict,
+            evaluator.task_success(ref2goal=False), evaluator.complete, evaluator.success, evaluator.success_strict,
+            [(evaluator.domain_success(domain), evaluator.domain_success(domain, ref2goal=False))
+             for domain in DOMAINS],
+            [evaluator.domain_reqt_inform_analyze(domain) for domain in DOMAINS],
+            evaluator.book_rate(), evaluator.book_rate_constrains(), evaluator.check_booking_done(),
+            evaluator.inform_F1(), evaluator.inform_F1(ref2goal=False), evaluator.final_goal_analyze()))
+    system_acts = [sys_acts for sys_acts, _, _ in turns]
+    system_states = [belief_state for _, belief_state, _ in turns]
+    user_acts = [usr_acts for _, _, usr_acts in turns]
+    outputs.append(evaluator.evaluate_dialog(deepcopy(goal), user_acts, system_acts, system_states))
+    return outputs, random.getstate()
+
+
+@pytest.fixture(scope='module')
+def goals():
+    random.seed(0)
+    np.random.seed(0)
+    generator = goal_generator.GoalGenerator()
+    return [policy_agenda.Goal(generator).domain_goals for _ in range(30)]
+
+
+@pytest.mark.parametrize('check_book_constraints', [True, False])
+def test_replay_matches_baseline_evaluator(goals, check_book_constraints):
+    evaluator = MultiWozEvaluator(check_book_constraints=check_book_constraints, check_domain_success=True)
+    baseline = BaselineMultiWozEvaluator(check_book_constraints=check_book_constraints, check_domain_success=True)
+    rng = random.Random(1)
+    successes = 0
+    for seed, goal in enumerate(goals):
+        turns = make_dialogue(rng, goal, evaluator.database)
+        outputs = replay(evaluator, goal, turns, seed)
+        assert outputs == replay(baseline, goal, turns, seed), (goal, turns)
+        successes += outputs[0][-1]['success']
+    # the replay suite covers both outcomes
+    assert 0 < successes < len(goals)
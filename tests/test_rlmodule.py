@@ -0,0 +1,102 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from convlab.policy.rlmodule import MultiDiscretePolicy, VectorPolicy, discounted_cumsum, estimate_advantage
+
+
+def old_estimate_advantage(r, v, mask, gamma, tau):
+    """the loop of PPO.est_adv before it was replaced by the parallel scan"""
+    batchsz = v.size(0)
+    v_target = torch.Tensor(batchsz)
+    delta = torch.Tensor(batchsz)
+    A_sa = torch.Tensor(batchsz)
+    prev_v_target = 0
+    prev_v = 0
+    prev_A_sa = 0
+    for t in reversed(range(batchsz)):
+        v_target[t] = r[t] + gamma * prev_v_target * mask[t]
+        delta[t] = r[t] + gamma * prev_v * mask[t] - v[t]
+        A_sa[t] = delta[t] + gamma * tau * prev_A_sa * mask[t]
+        prev_v_target = v_target[t]
+        prev_v = v[t]
+        prev_A_sa = A_sa[t]
+    return A_sa, v_target
+
+
+def random_batch(batchsz, generator):
+    r = torch.randn(batchsz, generator=generator) * 10
+    v = torch.randn(batchsz, generator=generator) * 10
+    mask = (torch.rand(batchsz, generator=generator) > 0.2).float()
+    mask[-1] = 0
+    return r, v, mask
+
+
+@pytest.mark.parametrize('batchsz', [1, 2, 3, 7, 8, 100, 1025])
+@pytest.mark.parametrize('gamma, tau', [(0.99, 0.95), (0.9, 1.0), (1.0, 0.5)])
+def test_estimate_advantage_matches_loop(batchsz, gamma, tau):
+    generator = torch.Generator().manual_seed(batchsz)
+    r, v, mask = random_batch(batchsz, generator)
+    A_sa, v_target = estimate_advantage(r, v, mask, gamma, tau)
+    old_A_sa, old_v_target = old_estimate_advantage(r, v, mask, gamma, tau)
+    assert A_sa.dtype == v_target.dtype == torch.float32
+    assert torch.allclose(A_sa, old_A_sa, rtol=1e-4, atol=1e-3)
+    assert torch.allclose(v_target, old_v_target, rtol=1e-4, atol=1e-3)
+
+
+def test_discounted_cumsum_stops_at_trajectory_ends():
+    x = torch.tensor([1., 1., 1., 2., 2.])
+    mask = torch.tensor([1., 1., 0., 1., 0.])
+    assert discounted_cumsum(x, mask, 0.5).tolist() == [1.75, 1.5, 1., 3., 2.]
+    assert discounted_cumsum(x, mask, 0.5).tolist() == old_estimate_advantage(x, torch.zeros(5), mask, 0.5, 1.)[1].tolist()
+    assert discounted_cumsum(x, torch.zeros(5), 0.5).tolist() == x.tolist()
+
+
+class RandomVector:
+    """state vectors and masks of random states, the action vector is returned as the action"""
+
+    def __init__(self, s_dim, a_dim, generator):
+        self.s_dim, self.a_dim, self.generator = s_dim, a_dim, generator
+
+    def state_vectorize(self, state):
+        s = torch.randn(self.s_dim, generator=self.generator).double().numpy()
+        action_mask = (torch.rand(self.a_dim, generator=self.generator) < 0.3).double().numpy() * -1e18
+        return s, action_mask
+
+    def action_devectorize(self, action_vec):
+        return action_vec.tolist()
+
+
+def old_predict(policy, state):
+    """PPO.predict before it was moved to VectorPolicy"""
+    s, action_mask = policy.vector.state_vectorize(state)
+    s_vec = torch.Tensor(s)
+    mask_vec = torch.Tensor(action_mask)
+    a = policy.policy.select_action(s_vec, False, action_mask=mask_vec).cpu()
+    a_counter = 0
+    while a.sum() == 0:
+        a_counter += 1
+        a = policy.policy.select_action(s_vec, True, action_mask=mask_vec).cpu()
+        if a_counter == 5:
+            break
+    return policy.vector.action_devectorize(a.detach().numpy())
+
+
+def test_vector_policy_predict_matches_old_predict():
+    np = pytest.importorskip('numpy')
+    policy = VectorPolicy()
+    policy.info_dict = {}
+    policy.policy = MultiDiscretePolicy(10, 16, 8)
+    actions = []
+    for predict in [old_predict, VectorPolicy.predict]:
+        policy.vector = RandomVector(10, 8, torch.Generator().manual_seed(0))
+        torch.manual_seed(0)
+        actions.append([predict(policy, {}) for _ in range(50)])
+    assert actions[0] == actions[1]
+    assert policy.info_dict['action_used'] == actions[1][-1]
+
+    s, action_mask = policy.vector.state_vectorize({})
+    for x in [s, action_mask]:
+        assert np.array_equal(np.float32(x), torch.Tensor(x).numpy())
+        assert np.float32(x).dtype == torch.Tensor(x).numpy().dtype
+
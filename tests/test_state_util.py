@@ -0,0 +1,52 @@
+import json
+
+from convlab.util.state_util import copy_nested, copy_state
+
+
+def _state():
+    return {
+        'user_action': [['inform', 'hotel', 'area', 'north']],
+        'system_action': [],
+        'belief_state': {'hotel': {'area': 'north', 'name': ''}},
+        'booked': {'hotel': [{'name': 'acorn guest house'}]},
+        'request_state': {'hotel': {'phone': ''}},
+        'history': [['usr', 'i need a hotel in the north'], ['sys', 'what price range ?']],
+        'terminated': False
+    }
+
+
+def test_copy_state_is_plain_data():
+    state = copy_state(_state())
+    assert state == _state()
+    assert type(state['history']) is list
+    assert json.loads(json.dumps(state)) == _state()
+
+
+def test_copy_state_is_independent():
+    state = _state()
+    copied = copy_state(state)
+    state['history'].append(['usr', 'cheap please'])
+    state['belief_state']['hotel']['pricerange'] = 'cheap'
+    state['booked']['hotel'][0]['name'] = 'alexander bed and breakfast'
+    state['user_action'][0][3] = 'south'
+    state['request_state']['hotel']['phone'] = '01223'
+    assert copied == _state()
+
+    copied['history'].append(['sys', 'ok'])
+    copied['belief_state']['hotel']['area'] = 'east'
+    assert state['history'][-1] == ['usr', 'cheap please']
+    assert state['belief_state']['hotel']['area'] == 'north'
+
+
+def test_copy_state_shares_history_turns():
+    state = _state()
+    copied = copy_state(state)
+    assert copied['history'] is not state['history']
+    assert all(a is b for a, b in zip(copied['history'], state['history']))
+
+
+def test_copy_nested():
+    acts = [['inform', 'hotel', 'area', 'north']]
+    copied = copy_nested(acts)
+    assert copied == acts and copied[0] is not acts[0]
+    assert copy_nested('not a state') == 'not a state'
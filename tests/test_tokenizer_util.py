@@ -0,0 +1,75 @@
+import pytest
+
+from convlab.util.tokenizer_util import UtteranceTokenCache
+
+transformers = pytest.importorskip('transformers')
+if int(transformers.__version__.split('.')[0]) >= 5:
+    pytest.skip('tokenizers of transformers 5 have no build_inputs_with_special_tokens', allow_module_level=True)
+
+CONTEXTS = [
+    ['user: i need a cheap hotel in the north.'],
+    ['user: i need a cheap hotel in the north.', "system: what's the area? the north or the centre?"],
+    ['user: hello', 'system: ', 'user: book it for 2 people at 18:30 on friday!'],
+    ['user:  a train to cambridge , please ', 'system: tr1234 leaves at 09:15.', 'user: great, thanks'],
+    ['user: unseen wörds like zyxwv and qqq', 'system: i am sorry?'],
+    [''],
+    [],
+]
+
+
+def utterances():
+    for context in CONTEXTS:
+        yield from context
+
+
+def make_bert_tokenizers(tmp_path):
+    words = set()
+    for utterance in utterances():
+        words.update(transformers.BasicTokenizer(do_lower_case=True).tokenize(utterance))
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'un', '##seen', '##s'] + sorted(words - {'unseen'})
+    vocab_file = tmp_path / 'vocab.txt'
+    vocab_file.write_text('\n'.join(vocab) + '\n')
+    return [transformers.BertTokenizer(str(vocab_file)), transformers.BertTokenizerFast(str(vocab_file))]
+
+
+def make_t5_tokenizers(tmp_path):
+    sentencepiece = pytest.importorskip('sentencepiece')
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('\n'.join(list(utterances()) * 20) + '\n')
+    sentencepiece.SentencePieceTrainer.train(
+        input=str(corpus), model_prefix=str(tmp_path / 'spiece'), vocab_size=120, hard_vocab_limit=False,
+        pad_id=0, eos_id=1, unk_id=2, bos_id=-1)
+    model_file = str(tmp_path / 'spiece.model')
+    return [transformers.T5Tokenizer(model_file, extra_ids=0), transformers.T5TokenizerFast(model_file, extra_ids=0)]
+
+
+@pytest.mark.parametrize('name, separator', [('bert', ' [SEP] '), ('t5', '\n')])
+def test_encode_context_matches_joined_string(tmp_path, name, separator):
+    make_tokenizers = make_bert_tokenizers if name == 'bert' else make_t5_tokenizers
+    for tokenizer in make_tokenizers(tmp_path):
+        cache = UtteranceTokenCache(tokenizer, separator=separator)
+        for _ in range(2):
+            for context in CONTEXTS:
+                expected = tokenizer(separator.join(context))['input_ids']
+                assert cache.encode_context(context) == expected, (type(tokenizer).__name__, context)
+                ids = tokenizer.encode(separator.join(context), add_special_tokens=False)
+                for max_length in [0, 3, 10]:
+                    expected = tokenizer.build_inputs_with_special_tokens(ids[max(len(ids) - max_length, 0):])
+                    assert cache.encode_context(context, max_length) == expected
+
+
+class WholeStringTokenizer(object):
+    """one id for the whole text, so concatenating the ids of the utterances never matches the joined string"""
+
+    def encode(self, text, add_special_tokens=True):
+        return [len(text)]
+
+    def build_inputs_with_special_tokens(self, ids):
+        return ids + [0]
+
+
+def test_falls_back_to_the_joined_string():
+    cache = UtteranceTokenCache(WholeStringTokenizer(), separator='|')
+    assert cache.separator_ids is None
+    assert cache.encode_context(['ab', 'c']) == [4, 0]
+    assert cache.encode_context(['ab', 'c'], max_length=0) == [0]
@@ -0,0 +1,83 @@
+import json
+import pickle
+from copy import deepcopy
+
+import pytest
+
+from convlab.util.unified_datasets_util import ContextWindow, iter_unified_data, load_unified_data
+
+
+def make_dataset():
+    dataset = {}
+    for split, num_dialogues in [('train', 3), ('test', 2)]:
+        dataset[split] = []
+        for d in range(num_dialogues):
+            turns = []
+            for t in range(2 * d + 3):
+                turn = {'speaker': ['user', 'system'][t % 2], 'utt_idx': t, 'utterance': f'{split} {d} {t}',
+                        'dialogue_acts': {'binary': [{'intent': 'bye', 'domain': 'general', 'slot': ''}],
+                                          'categorical': [], 'non-categorical': []}}
+                if t % 2 == 0:
+                    turn['state'] = {'hotel': {'area': f'area {t}'}}
+                else:
+                    turn['db_results'] = {'hotel': [{'name': f'hotel {t}'}]}
+                    turn['booked'] = {'hotel': []}
+                turns.append(turn)
+            dataset[split].append({'dialogue_id': f'{split}-{d}', 'goal': {'description': f'goal {d}'},
+                                   'domains': ['hotel'], 'turns': turns})
+    return dataset
+
+
+ARGUMENTS = [
+    dict(utterance=True, dialogue_acts=True),
+    dict(data_split='test', speaker='user', utterance=True, use_context=True, context_window_size=1),
+    dict(speaker='system', dialogue_acts=True, state=True, use_context=True, context_window_size=2, terminated=True),
+    dict(speaker='user', state=True, db_results=True, use_context=True, context_window_size=100, goal=True,
+         active_domains=True),
+    dict(speaker='all', utterance=True, state=True, dialogue_acts=True, split_to_turn=False),
+]
+
+
+@pytest.mark.parametrize('kwargs', ARGUMENTS)
+def test_iter_unified_data_matches_load_unified_data(kwargs):
+    dataset = make_dataset()
+    samples = {}
+    for data_split, sample in iter_unified_data(dataset, **kwargs):
+        samples.setdefault(data_split, []).append(sample)
+    assert dataset == make_dataset()
+    expected = load_unified_data(make_dataset(), **kwargs)
+    assert {data_split: samples.get(data_split, []) for data_split in expected} == expected
+    assert pickle.loads(pickle.dumps(samples)) == samples
+
+
+def test_load_unified_data_copies_the_context():
+    dataset = make_dataset()
+    data = load_unified_data(dataset, speaker='user', state=True, use_context=True, context_window_size=2)
+    sample = data['train'][-1]
+    assert type(sample['context']) is list
+    json.dumps(data)
+    sample['context'][0]['state']['hotel']['area'] = 'north'
+    assert dataset == make_dataset()
+
+
+def test_samples_are_views():
+    dataset = make_dataset()
+    samples = [sample for _, sample in iter_unified_data(
+        dataset, 'train', 'user', utterance=True, state=True, use_context=True, context_window_size=2)]
+    turns = [turn for dialogue in dataset['train'] for turn in dialogue['turns'] if turn['speaker'] == 'user']
+    assert len(samples) == len(turns)
+    for sample, turn in zip(samples, turns):
+        assert sample['state'] is turn['state']
+        assert isinstance(sample['context'], ContextWindow)
+        assert all('context' not in context_turn for context_turn in sample['context'])
+
+    sample = samples[-1]
+    assert sample['context'][-2]['state'] is dataset['train'][-1]['turns'][-3]['state']
+    assert sample['context'][:1] == [{'speaker': 'user', 'utt_idx': 4, 'utterance': 'train 2 4',
+                                      'state': {'hotel': {'area': 'area 4'}}}]
+    with pytest.raises(TypeError):
+        sample['context'][0] = {}
+    copied = deepcopy(sample)
+    assert type(copied['context']) is list
+    copied['context'][0]['state']['hotel']['area'] = 'north'
+    assert dataset == make_dataset()
@@ -0,0 +1,104 @@
+import json
+import os
+import random
+
+import pytest
+
+from convlab.dst.rule.multiwoz import dst_util
+from convlab.dst.rule.multiwoz.dst_util import ValueNormalizer, _match_or_contain, get_value_normalizer, minDistance
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+def old_match_or_contain(value, value_list):
+    """_match_or_contain before the value lists were indexed"""
+    if value in value_list:
+        return value
+    for v in value_list:
+        if v in value or value in v:
+            return v
+    for v in value_list:
+        d = minDistance(value, v)
+        if (d <= 2 and len(value) >= 10) or (d <= 3 and len(value) >= 15):
+            return v
+    return None
+
+
+def old_find_containing(value_list, *queries):
+    """the containment scan of simple_fuzzy_match before the value lists were indexed"""
+    for v in value_list:
+        if any(q in v or v in q for q in queries):
+            return v
+    return None
+
+
+def perturb(value, rng):
+    choice = rng.randrange(6)
+    if choice == 0:
+        return value
+    if choice == 1:
+        start = rng.randrange(len(value))
+        return value[start:start + rng.randint(1, 6)]
+    if choice == 2:
+        return 'the ' + value + ' please'
+    if choice == 3:
+        return value[:1]
+    chars = list(value + ' hotel')
+    for _ in range(choice - 2):
+        chars[rng.randrange(len(chars))] = rng.choice('abcdefghijklmnopqrstuvwxyz ')
+    return ''.join(chars)
+
+
+@pytest.fixture(scope='module')
+def value_lists():
+    with open(os.path.join(ROOT, 'data/multiwoz/value_dict.json')) as f:
+        value_dict = json.load(f)
+    return [value_list for domain in value_dict.values() for value_list in domain.values()
+            if value_list and all(isinstance(v, str) and v for v in value_list)]
+
+
+def test_match_or_contain_matches_linear_scan(value_lists):
+    rng = random.Random(0)
+    for value_list in value_lists:
+        normalizer = get_value_normalizer(value_list)
+        for _ in range(20):
+            query = perturb(rng.choice(value_list), rng)
+            assert _match_or_contain(query, normalizer) == old_match_or_contain(query, value_list), query
+
+
+def test_find_containing_matches_linear_scan(value_lists):
+    rng = random.Random(1)
+    for value_list in value_lists:
+        normalizer = ValueNormalizer(value_list)
+        for _ in range(20):
+            query = perturb(rng.choice(value_list), rng)
+            queries = [query, ''.join(query.split())]
+            assert normalizer.find_containing(*queries) == old_find_containing(value_list, *queries), query
+
+
+@pytest.mark.parametrize('query', ['4', '40', '£4', 'nothing', 'north'])
+def test_non_string_values_are_skipped(query):
+    value_list = [{'single': '40'}, 'north', 40, '40 pounds', None]
+    normalizer = ValueNormalizer(value_list)
+    expected = old_find_containing([v for v in value_list if isinstance(v, str)], query)
+    assert normalizer.find_containing(query) == expected
+    assert _match_or_contain(query, normalizer) == (query if query in value_list else expected)
+
+
+def test_normalizer_is_rebuilt_after_modification():
+    value_list = ['north', 'south']
+    assert get_value_normalizer(value_list) is get_value_normalizer(['north', 'south'])
+    value_list.append('centre')
+    assert _match_or_contain('cent', get_value_normalizer(value_list)) == 'centre'
+    # a new list with the id of a deleted one does not get the normalizer of the deleted list
+    for i in range(100):
+        assert _match_or_contain('cent', get_value_normalizer([f'east {i}', f'centre {i}'])) == f'centre {i}'
+
+
+def test_normalizers_are_bounded():
+    for i in range(2 * dst_util._NORMALIZERS_SIZE):
+        get_value_normalizer([f'value {i}'])
+    assert len(dst_util._NORMALIZERS) == dst_util._NORMALIZERS_SIZE
+    normalizer = get_value_normalizer([{'single': '40'}, 'north'])
+    assert normalizer is not get_value_normalizer([{'single': '40'}, 'north'])
+    assert 'north' in normalizer
@@ -0,0 +1,142 @@
+import random
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+VectorBinary = pytest.importorskip('convlab.policy.vector.vector_binary').VectorBinary
+VectorNodes = pytest.importorskip('convlab.policy.vector.vector_nodes').VectorNodes
+
+STATE = {
+    'attraction': {'area': '', 'name': '', 'type': ''},
+    'hotel': {'area': '', 'book day': '', 'book people': '', 'book stay': '', 'name': '', 'stars': ''},
+    'restaurant': {'area': '', 'book day': '', 'book people': '', 'book time': '', 'food': '', 'name': ''},
+    'taxi': {'arrive by': '', 'departure': '', 'destination': '', 'leave at': ''},
+    'train': {'book people': '', 'day': '', 'departure': '', 'destination': '', 'leave at': ''},
+}
+DB_DOMAINS = ['attraction', 'hospital', 'hotel', 'police', 'restaurant', 'train']
+
+
+def make_vocabulary():
+    """a multiwoz-like system action vocabulary"""
+    vocabulary = [('general', intent, 'none', 'none') for intent in ['bye', 'greet', 'reqmore', 'welcome']]
+    for domain in ['attraction', 'booking', 'hospital', 'hotel', 'police', 'restaurant', 'taxi', 'train']:
+        slots = list(STATE.get(domain, {'ref': '', 'phone': '', 'book day': ''})) + ['choice', 'ref']
+        for slot in slots:
+            vocabulary.append((domain, 'request', slot, '?'))
+            for intent in ['inform', 'recommend', 'select']:
+                vocabulary.extend((domain, intent, slot, value) for value in ['1', '2', '3', 'none'])
+            for intent in ['nobook', 'nooffer', 'offerbook']:
+                vocabulary.append((domain, intent, slot, '1'))
+        for intent in ['book', 'nobook', 'nooffer', 'offerbook', 'offerbooked']:
+            vocabulary.append((domain, intent, 'none', 'none'))
+    return sorted(set(vocabulary))
+
+
+def make_vector(cls):
+    vector = cls.__new__(cls)
+    vector.ontology = {'state': STATE}
+    vector.domains = sorted(set(STATE) | set(DB_DOMAINS) | {'booking', 'general'})
+    vector.belief_domains = sorted(STATE)
+    vector.state = STATE
+    vector.db = object()
+    vector.db_domains = DB_DOMAINS
+    vector.character = 'sys'
+    vector.use_mask = True
+    vector.filter_state = True
+    vector.requestable = ['request']
+    vector.da_voc = make_vocabulary()
+    vector.da_voc_opp = [('general', 'greet', 'none', 'none')]
+    vector.generate_dict()
+    vector.get_state_dim()
+    return vector
+
+
+def old_compute_domain_mask(vector, domain_active_dict):
+    """compute_domain_mask before the action indices were precomputed"""
+    mask_list = np.zeros(vector.da_dim)
+    for i in range(vector.da_dim):
+        action = vector.vec2act[i]
+        action_domain = action[0]
+        if action_domain in domain_active_dict.keys():
+            if not domain_active_dict[action_domain]:
+                mask_list[i] = 1.0
+    return mask_list
+
+
+def old_compute_general_mask(vector):
+    """compute_general_mask before the action indices were precomputed"""
+    mask_list = np.zeros(vector.da_dim)
+    for i in range(vector.da_dim):
+        action = vector.vec2act[i]
+        domain, intent, slot, value = action
+        if intent in ['nobook', 'nooffer'] and slot != 'none':
+            mask_list[i] = 1.0
+        if "book" in slot and intent == 'inform':
+            if not vector.state.get(domain, {}).get(slot, {}):
+                mask_list[i] = 1.0
+        if domain == 'taxi':
+            if slot in vector.state.get('taxi', {}):
+                if not vector.state['taxi'][slot] and intent == 'inform':
+                    mask_list[i] = 1.0
+    return mask_list
+
+
+def old_compute_entity_mask(vector, number_entities_dict):
+    """compute_entity_mask before the action indices were precomputed"""
+    mask_list = np.zeros(vector.da_dim)
+    if number_entities_dict is None:
+        return mask_list
+    for i in range(vector.da_dim):
+        action = vector.vec2act[i]
+        domain, intent, slot, value = action
+        domain_entities = number_entities_dict.get(domain, 1)
+        if intent in ['inform', 'select', 'recommend'] and value != None and value != 'none':
+            if int(value) > domain_entities:
+                mask_list[i] = 1.0
+        if intent in ['nooffer', 'nobook'] and number_entities_dict.get(domain, 0) > 0:
+            mask_list[i] = 1.0
+    return mask_list
+
+
+def old_state_mask(vector, domain_active_dict, number_entities_dict):
+    """the state_vectorize mask of VectorBinary and VectorNodes before np.where was used"""
+    mask = old_compute_entity_mask(vector, number_entities_dict) + old_compute_general_mask(vector)
+    for i in range(vector.da_dim):
+        mask[i] = -int(bool(mask[i])) * sys.maxsize
+    return mask
+
+
+def random_turn(rng):
+    belief_state = {domain: {slot: rng.choice(['', '', 'dontcare', 'north', '2']) for slot in slots}
+                    for domain, slots in STATE.items()}
+    number_entities_dict = {domain: rng.choice([0, 0, 1, 2, 3, 5]) for domain in DB_DOMAINS if rng.random() < 0.9}
+    domain_active_dict = {domain: rng.random() < 0.5 for domain in STATE if rng.random() < 0.9}
+    return belief_state, domain_active_dict, number_entities_dict
+
+
+@pytest.mark.parametrize('cls', [VectorBinary, VectorNodes])
+def test_masks_match_action_loops(cls):
+    vector = make_vector(cls)
+    rng = random.Random(0)
+    masked = 0
+    for _ in range(300):
+        belief_state, domain_active_dict, number_entities_dict = random_turn(rng)
+        # only the active domains are in the state of some datasets
+        vector.state = {domain: slots for domain, slots in belief_state.items() if rng.random() < 0.8}
+        assert (vector.compute_domain_mask(domain_active_dict)
+                == old_compute_domain_mask(vector, domain_active_dict)).all()
+        assert (vector.compute_general_mask() == old_compute_general_mask(vector)).all()
+        assert (vector.compute_entity_mask(number_entities_dict)
+                == old_compute_entity_mask(vector, number_entities_dict)).all()
+        assert (vector.compute_entity_mask(None) == 0).all()
+
+        vector.pointer = lambda: (np.zeros(6 * len(DB_DOMAINS)), number_entities_dict)
+        state = {'belief_state': belief_state, 'user_action': [], 'system_action': [], 'terminated': False,
+                 'booked': {domain: [] for domain in DB_DOMAINS}}
+        mask = vector.state_vectorize(state)[1]
+        expected = old_state_mask(vector, vector.init_domain_active_dict(), number_entities_dict)
+        assert mask.dtype == expected.dtype
+        assert (mask == expected).all()
+        masked += (mask != 0).sum()
+    assert 0 < masked < 300 * vector.da_dim